@@ -1,7 +1,9 @@
 import os
 from fastapi import HTTPException
-from httpx import AsyncClient
+from app.http_client import get_http_client
 from app.auth.supabase_auth import supabase
+from app import db
+from app.services.connection_service import connection_service
 from datetime import datetime, timedelta
 from app.config import get_settings
 from urllib.parse import quote
@@ -82,25 +84,25 @@ class AirtableOAuth:
         if not self.code_verifier:
             raise HTTPException(status_code=400, detail="Code verifier not found. Please restart the OAuth flow.")
         
-        async with AsyncClient() as client:
-            response = await client.post(
-                self.token_url,
-                auth=(self.client_id, self.client_secret),
-                data={
-                    "grant_type": "authorization_code",
-                    "code": code,
-                    "redirect_uri": self.redirect_uri,
-                    "code_verifier": self.code_verifier
-                }
-            )
+        client = get_http_client()
+        response = await client.post(
+            self.token_url,
+            auth=(self.client_id, self.client_secret),
+            data={
+                "grant_type": "authorization_code",
+                "code": code,
+                "redirect_uri": self.redirect_uri,
+                "code_verifier": self.code_verifier
+            }
+        )
             
-            if response.status_code != 200:
-                logger.error(f"Token exchange failed with status {response.status_code}: {response.text}")
-                raise HTTPException(status_code=400, detail=f"Failed to get access token: {response.text}")
+        if response.status_code != 200:
+            logger.error(f"Token exchange failed with status {response.status_code}: {response.text}")
+            raise HTTPException(status_code=400, detail=f"Failed to get access token: {response.text}")
             
-            token_data = response.json()
-            logger.info("Successfully obtained Airtable access token")
-            return token_data
+        token_data = response.json()
+        logger.info("Successfully obtained Airtable access token")
+        return token_data
 
     async def store_token(self, user_id: str, token_data: dict) -> None:
         """Store Airtable tokens in Supabase"""
@@ -119,19 +121,21 @@ class AirtableOAuth:
             }
             
             # Check if credentials already exist
-            existing = supabase.table('service_credentials').select('*').eq('user_id', user_id).eq('service_name', 'airtable').execute()
+            existing = await db.execute(supabase.table('service_credentials').select('*').eq('user_id', user_id).eq('service_name', 'airtable'))
             
             if existing.data:
                 # Update existing credentials
-                response = supabase.table('service_credentials').update(data).eq('user_id', user_id).eq('service_name', 'airtable').execute()
+                response = await db.execute(supabase.table('service_credentials').update(data).eq('user_id', user_id).eq('service_name', 'airtable'))
                 logger.info("Updated existing Airtable credentials")
             else:
                 # Insert new credentials
-                response = supabase.table('service_credentials').insert(data).execute()
+                response = await db.execute(supabase.table('service_credentials').insert(data))
                 logger.info("Stored new Airtable credentials")
             
             if not response.data:
                 raise Exception("No data returned from Supabase operation")
+            
+            connection_service.invalidate_user(user_id)
                 
         except Exception as e:
             logger.error(f"Error storing Airtable tokens: {str(e)}")
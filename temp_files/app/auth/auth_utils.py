@@ -1,6 +1,7 @@
 from fastapi import Request, HTTPException, Depends
 from fastapi.responses import RedirectResponse
 from app.auth.supabase_auth import supabase
+from app.auth.token_verifier import verify_access_token, TokenExpiredError
 import logging
 from typing import Optional
 from app.config import get_settings
@@ -11,6 +12,11 @@ settings = get_settings()
 async def get_current_user(request: Request):
     """Get the currently logged in user from the request"""
     try:
+        # AuthMiddleware has already verified the token for protected pages
+        user = getattr(request.state, "user", None)
+        if user:
+            return user
+        
         # Get the session token from cookies
         access_token = request.cookies.get("access_token") or request.cookies.get("sb-access-token")
         
@@ -35,20 +41,13 @@ async def get_current_user(request: Request):
 async def verify_token(access_token: str):
     """Verify a user token and return the user"""
     try:
-        # Use Supabase to verify the token
-        user_response = supabase.auth.get_user(access_token)
-        if not user_response or not user_response.user:
-            return None
-        return user_response.user
-    except Exception as e:
+        # Verified locally and cached until the token expires
+        return await verify_access_token(access_token)
+    except TokenExpiredError as e:
         logger.error(f"Error verifying token: {str(e)}")
         
-        # Check if token is expired and try to refresh
-        if "token is expired" in str(e).lower():
-            # Logic to handle token refresh could go here
-            # This would require the refresh token
-            pass
-        
+        # Logic to handle token refresh could go here
+        # This would require the refresh token
         return None
 
 def set_auth_cookies(response, session):
@@ -76,6 +75,23 @@ def set_auth_cookies(response, session):
     
     return response
 
+# One-time cookie carrying a just-generated API key to the connections page,
+# the only place it is shown in full
+NEW_API_KEY_COOKIE = "new_api_key"
+
+def reveal_api_key(response, api_key: str):
+    """Let the next connections page render show a newly generated key once"""
+    response.set_cookie(
+        key=NEW_API_KEY_COOKIE,
+        value=api_key,
+        httponly=True,
+        secure=settings.ENV != "development",  # Only secure in production
+        samesite="lax",
+        max_age=300,
+        path="/connections"
+    )
+    return response
+
 def clear_auth_cookies(response):
     """Clear authentication cookies from a response object"""
     response.delete_cookie(key="access_token")
@@ -1,7 +1,9 @@
 import os
 from fastapi import HTTPException
-from httpx import AsyncClient
+from app.http_client import get_http_client
 from app.auth.supabase_auth import supabase
+from app import db
+from app.services.connection_service import connection_service
 from datetime import datetime, timedelta
 from app.config import get_settings
 import logging
@@ -51,44 +53,44 @@ class FacebookOAuth:
     
     async def get_access_token(self, code: str) -> dict:
         """Get initial short-lived token and exchange for long-lived token"""
-        async with AsyncClient() as client:
-            # Get initial short-lived token
-            response = await client.get(
-                self.token_url,
-                params={
-                    "client_id": self.app_id,
-                    "client_secret": self.app_secret,
-                    "redirect_uri": self.redirect_uri,
-                    "code": code
-                }
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=400, detail="Failed to get access token")
-            
-            token_data = response.json()
-            
-            # Exchange for long-lived token
-            exchange_url = f"https://graph.facebook.com/{self.api_version}/oauth/access_token"
-            exchange_params = {
-                "grant_type": "fb_exchange_token",
+        client = get_http_client()
+        # Get initial short-lived token
+        response = await client.get(
+            self.token_url,
+            params={
                 "client_id": self.app_id,
                 "client_secret": self.app_secret,
-                "fb_exchange_token": token_data["access_token"]
+                "redirect_uri": self.redirect_uri,
+                "code": code
             }
+        )
             
-            exchange_response = await client.get(exchange_url, params=exchange_params)
-            if exchange_response.status_code != 200:
-                raise HTTPException(status_code=400, detail="Failed to exchange for long-lived token")
+        if response.status_code != 200:
+            raise HTTPException(status_code=400, detail="Failed to get access token")
             
-            long_lived_data = exchange_response.json()
+        token_data = response.json()
             
-            # Combine the data, preferring long-lived token data
-            return {
-                "access_token": long_lived_data["access_token"],
-                "expires_in": long_lived_data.get("expires_in", 5184000),  # Default to 60 days if not provided
-                "token_type": "bearer"
-            }
+        # Exchange for long-lived token
+        exchange_url = f"https://graph.facebook.com/{self.api_version}/oauth/access_token"
+        exchange_params = {
+            "grant_type": "fb_exchange_token",
+            "client_id": self.app_id,
+            "client_secret": self.app_secret,
+            "fb_exchange_token": token_data["access_token"]
+        }
+            
+        exchange_response = await client.get(exchange_url, params=exchange_params)
+        if exchange_response.status_code != 200:
+            raise HTTPException(status_code=400, detail="Failed to exchange for long-lived token")
+            
+        long_lived_data = exchange_response.json()
+            
+        # Combine the data, preferring long-lived token data
+        return {
+            "access_token": long_lived_data["access_token"],
+            "expires_in": long_lived_data.get("expires_in", 5184000),  # Default to 60 days if not provided
+            "token_type": "bearer"
+        }
     
     async def store_token(self, user_id: str, token_data: dict) -> None:
         """Store Facebook tokens in Supabase"""
@@ -112,22 +114,24 @@ class FacebookOAuth:
             logger.info(f"Attempting to store data in Supabase: {data}")
             
             # Check if credentials already exist
-            existing = supabase.table('service_credentials').select('*').eq('user_id', user_id).eq('service_name', 'facebook').execute()
+            existing = await db.execute(supabase.table('service_credentials').select('*').eq('user_id', user_id).eq('service_name', 'facebook'))
             
             if existing.data:
                 logger.info(f"Updating existing Facebook credentials for user {user_id}")
                 # Update existing credentials
-                response = supabase.table('service_credentials').update(data).eq('user_id', user_id).eq('service_name', 'facebook').execute()
+                response = await db.execute(supabase.table('service_credentials').update(data).eq('user_id', user_id).eq('service_name', 'facebook'))
                 logger.info(f"Update response: {response}")
             else:
                 logger.info(f"Storing new Facebook credentials for user {user_id}")
                 # Insert new credentials
-                response = supabase.table('service_credentials').insert(data).execute()
+                response = await db.execute(supabase.table('service_credentials').insert(data))
                 logger.info(f"Insert response: {response}")
             
             if not response.data:
                 raise Exception("No data returned from Supabase operation")
             
+            connection_service.invalidate_user(user_id)
+            
             logger.info(f"Successfully stored Facebook token for user {user_id}")
                 
         except Exception as e:
@@ -1,7 +1,9 @@
 import os
 from fastapi import HTTPException
-from httpx import AsyncClient
+from app.http_client import get_http_client
 from app.auth.supabase_auth import supabase
+from app import db
+from app.services.connection_service import connection_service
 from datetime import datetime, timedelta
 from app.config import get_settings
 from urllib.parse import quote
@@ -25,22 +27,22 @@ class NotionOAuth:
         return f"{self.auth_url}?client_id={self.client_id}&redirect_uri={self.redirect_uri}&response_type=code&state={state}&owner=user"
 
     async def get_access_token(self, code: str) -> dict:
-        async with AsyncClient() as client:
-            response = await client.post(
-                self.token_url,
-                auth=(self.client_id, self.client_secret),
-                json={
-                    "grant_type": "authorization_code",
-                    "code": code,
-                    "redirect_uri": self.redirect_uri
-                }
-            )
-            if response.status_code != 200:
-                raise HTTPException(status_code=400, detail="Failed to get access token")
+        client = get_http_client()
+        response = await client.post(
+            self.token_url,
+            auth=(self.client_id, self.client_secret),
+            json={
+                "grant_type": "authorization_code",
+                "code": code,
+                "redirect_uri": self.redirect_uri
+            }
+        )
+        if response.status_code != 200:
+            raise HTTPException(status_code=400, detail="Failed to get access token")
             
-            token_data = response.json()
-            logger.info(f"Notion token response: {token_data}")
-            return token_data
+        token_data = response.json()
+        logger.info(f"Notion token response: {token_data}")
+        return token_data
 
     async def store_token(self, user_id: str, token_data: dict) -> None:
         """Store Notion tokens in Supabase"""
@@ -59,19 +61,21 @@ class NotionOAuth:
             }
             
             # Check if credentials already exist
-            existing = supabase.table('service_credentials').select('*').eq('user_id', user_id).eq('service_name', 'notion').execute()
+            existing = await db.execute(supabase.table('service_credentials').select('*').eq('user_id', user_id).eq('service_name', 'notion'))
             
             if existing.data:
                 # Update existing credentials
-                response = supabase.table('service_credentials').update(data).eq('user_id', user_id).eq('service_name', 'notion').execute()
+                response = await db.execute(supabase.table('service_credentials').update(data).eq('user_id', user_id).eq('service_name', 'notion'))
                 logger.info("Updated existing Notion credentials")
             else:
                 # Insert new credentials
-                response = supabase.table('service_credentials').insert(data).execute()
+                response = await db.execute(supabase.table('service_credentials').insert(data))
                 logger.info("Stored new Notion credentials")
             
             if not response.data:
                 raise Exception("No data returned from Supabase operation")
+            
+            connection_service.invalidate_user(user_id)
                 
         except Exception as e:
             logger.error(f"Error storing Notion tokens: {str(e)}")
@@ -0,0 +1,67 @@
+"""Routes that AuthMiddleware lets through without a session.
+
+Endpoints opt in with the @public marker, placed below the route decorator:
+
+    @router.get("/login")
+    @public
+    async def login_page(request: Request): ...
+
+PublicRouteMatcher compiles the marked routes of the app's router table into
+a frozenset of static paths plus one regex for parameterised paths and mounts,
+so the per-request check doesn't depend on how many routes there are.
+"""
+import re
+from typing import Any, Iterable, Iterator, Optional, Pattern, Tuple, TypeVar
+
+from starlette.routing import BaseRoute, Mount, compile_path
+
+T = TypeVar("T")
+
+PUBLIC_MARKER = "__public_route__"
+
+# Starlette names every path parameter group; the names clash once the patterns are joined
+_NAMED_GROUP = re.compile(r"\(\?P<\w+>")
+
+def public(target: T) -> T:
+    """Mark an endpoint (or a mounted ASGI app) as reachable without logging in"""
+    setattr(target, PUBLIC_MARKER, True)
+    return target
+
+def _iter_routes(routes: Iterable[BaseRoute], prefix: str = "") -> Iterator[Tuple[str, Any, bool]]:
+    """(path, endpoint or mounted app, is_mount) for each route in the table"""
+    for route in routes:
+        # Newer FastAPI releases keep included routers nested instead of copying their routes up
+        included = getattr(route, "original_router", None)
+        if included is not None:
+            yield from _iter_routes(included.routes, prefix + route.include_context.prefix)
+        elif isinstance(route, Mount):
+            yield prefix + route.path, route.app, True
+        elif getattr(route, "path", None) is not None:
+            yield prefix + route.path, getattr(route, "endpoint", None), False
+
+class PublicRouteMatcher:
+    """Constant-time path lookup for the public routes in a router table"""
+
+    def __init__(self, routes: Iterable[BaseRoute], extra_paths: Iterable[str] = ()):
+        routes = list(routes)
+        self.route_count = len(routes)
+        paths = set(extra_paths)
+        patterns = []
+        for path, target, is_mount in _iter_routes(routes):
+            if not getattr(target, PUBLIC_MARKER, False):
+                continue
+            if is_mount:
+                patterns.append(f"^{re.escape(path)}/.*$")
+            elif "{" in path:
+                patterns.append(_NAMED_GROUP.sub("(?:", compile_path(path)[0].pattern))
+            else:
+                paths.add(path)
+        self.paths = frozenset(paths)
+        self.pattern: Optional[Pattern[str]] = (
+            re.compile("|".join(f"(?:{pattern})" for pattern in patterns)) if patterns else None
+        )
+
+    def __call__(self, path: str) -> bool:
+        if path in self.paths:
+            return True
+        return self.pattern is not None and self.pattern.match(path) is not None
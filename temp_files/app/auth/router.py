@@ -1,19 +1,22 @@
 from fastapi import APIRouter, Request, Form, Depends, HTTPException, Response, Cookie
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from app.templating import create_templates
 from app.auth.supabase_auth import supabase, register_user, login_user, logout_user
-from app.auth.auth_utils import set_auth_cookies, clear_auth_cookies
+from app.auth.auth_utils import set_auth_cookies, clear_auth_cookies, reveal_api_key
+from app.auth.token_verifier import forget_token
+from app.auth.public_routes import public
 import logging
 from app.config import get_settings
-import httpx
+from app.http_client import get_http_client
 from app.services.api_key_service import generate_api_key_for_user, api_key_service
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
+templates = create_templates()
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
 @router.post("/register")
+@public
 async def register(
     request: Request, 
     email: str = Form(...), 
@@ -35,30 +38,30 @@ async def register(
     
     # Verify with Cloudflare API
     turnstile_secret_key = settings.cloudflare_turnstile_secret_key
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://challenges.cloudflare.com/turnstile/v0/siteverify",
-            data={
-                "secret": turnstile_secret_key,
-                "response": cf_turnstile_response,
-                "remoteip": request.client.host
+    client = get_http_client()
+    response = await client.post(
+        "https://challenges.cloudflare.com/turnstile/v0/siteverify",
+        data={
+            "secret": turnstile_secret_key,
+            "response": cf_turnstile_response,
+            "remoteip": request.client.host
+        }
+    )
+        
+    result = response.json()
+    if not result.get("success", False):
+        logger.error(f"Turnstile verification failed: {result}")
+        return templates.TemplateResponse(
+            "register.html", 
+            {
+                "request": request, 
+                "error": "CAPTCHA verification failed", 
+                "settings": settings,
+                "cloudflare_turnstile_site_key": settings.cloudflare_turnstile_site_key
             }
         )
         
-        result = response.json()
-        if not result.get("success", False):
-            logger.error(f"Turnstile verification failed: {result}")
-            return templates.TemplateResponse(
-                "register.html", 
-                {
-                    "request": request, 
-                    "error": "CAPTCHA verification failed", 
-                    "settings": settings,
-                    "cloudflare_turnstile_site_key": settings.cloudflare_turnstile_site_key
-                }
-            )
-        
-        logger.info("Turnstile verification successful")
+    logger.info("Turnstile verification successful")
 
     try:
         logger.debug("Calling register_user function")
@@ -90,6 +93,7 @@ async def register(
         )
 
 @router.get("/register", response_class=HTMLResponse)
+@public
 async def register_page(request: Request):
     """Show the registration form"""
     # Make sure settings is directly exposed from state
@@ -113,6 +117,7 @@ async def register_page(request: Request):
     )
 
 @router.get("/login", response_class=HTMLResponse)
+@public
 async def login_page(request: Request, message: str = None):
     """Show the login form"""
     logger.info("Rendering login page")
@@ -132,6 +137,7 @@ async def login_page(request: Request, message: str = None):
     )
 
 @router.post("/login")
+@public
 async def login(
     request: Request,
     email: str = Form(...),
@@ -143,30 +149,30 @@ async def login(
     
     # Verify with Cloudflare API
     turnstile_secret_key = settings.cloudflare_turnstile_secret_key
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://challenges.cloudflare.com/turnstile/v0/siteverify",
-            data={
-                "secret": turnstile_secret_key,
-                "response": cf_turnstile_response,
-                "remoteip": request.client.host
+    client = get_http_client()
+    response = await client.post(
+        "https://challenges.cloudflare.com/turnstile/v0/siteverify",
+        data={
+            "secret": turnstile_secret_key,
+            "response": cf_turnstile_response,
+            "remoteip": request.client.host
+        }
+    )
+        
+    result = response.json()
+    if not result.get("success", False):
+        logger.error(f"Turnstile verification failed: {result}")
+        return templates.TemplateResponse(
+            "login.html", 
+            {
+                "request": request, 
+                "error": "CAPTCHA verification failed", 
+                "settings": settings,
+                "email": email
             }
         )
         
-        result = response.json()
-        if not result.get("success", False):
-            logger.error(f"Turnstile verification failed: {result}")
-            return templates.TemplateResponse(
-                "login.html", 
-                {
-                    "request": request, 
-                    "error": "CAPTCHA verification failed", 
-                    "settings": settings,
-                    "email": email
-                }
-            )
-        
-        logger.info("Turnstile verification successful")
+    logger.info("Turnstile verification successful")
     
     try:
         logger.debug("Calling login_user function")
@@ -188,10 +194,11 @@ async def login(
         
         # Check if user already has an API key
         keys = await api_key_service.list_keys(response.user.id)
+        new_key = None
         if not keys:
             # Generate an API key for the user if they don't have one
             try:
-                await generate_api_key_for_user(response.user.id)
+                new_key = await generate_api_key_for_user(response.user.id)
                 logger.info(f"Generated initial API key for user {response.user.id}")
             except Exception as e:
                 logger.error(f"Failed to generate initial API key: {str(e)}")
@@ -199,6 +206,9 @@ async def login(
         # Set cookies and redirect
         redirect = RedirectResponse(url="/connections/", status_code=302)
         set_auth_cookies(redirect, response.session)
+        if new_key:
+            # The connections page shows the new key once
+            reveal_api_key(redirect, new_key['key'])
         
         logger.debug("Auth cookies set, redirecting to home page")
         return redirect
@@ -216,10 +226,14 @@ async def login(
         )
 
 @router.get("/logout")
+@public
 async def logout_route(request: Request):
     """Log out the current user"""
     logger.info("Processing logout request")
     try:
+        # Revoke locally first, so the tokens stop working even if the Supabase call fails
+        await forget_token(request.cookies.get("access_token"))
+        await forget_token(request.cookies.get("sb-access-token"))
         await logout_user(request)
         
         # Clear cookies and redirect to login
@@ -0,0 +1,240 @@
+"""Local verification of Supabase access tokens.
+
+Tokens signed with the project's HS256 secret (SUPABASE_JWT_SECRET) or with an
+asymmetric key from the project's JWKS endpoint are verified in-process; the
+verified user is cached per token until the token's exp. Only tokens that
+can't be verified locally (no secret configured, unknown key) fall back to a
+supabase.auth.get_user round trip, whose result is cached the same way.
+
+Local verification can't see a session that ended, so logging out goes through
+forget_token(), which records the session in the revoked_sessions table
+(migrations/004_revoked_sessions.sql) and in a local denylist. A verified user
+is cached for at most AUTH_REVOCATION_CHECK_INTERVAL seconds; every cache miss
+checks the local denylist and then the table, so a logout reaches every worker
+within that interval. Tokens without a session_id, or whose revocation status
+can't be read, fall back to the get_user round trip.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import jwt
+
+from app import db
+from app.auth.supabase_auth import supabase, supabase_service
+from app.cache import TTLCache, SingleFlight, MISSING
+from app.config import get_settings
+from app.http_client import get_http_client
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+REVOKED_SESSIONS_TABLE = "revoked_sessions"
+
+# access token -> verified user, for at most AUTH_REVOCATION_CHECK_INTERVAL
+auth_user_cache = TTLCache(maxsize=settings.AUTH_USER_CACHE_MAXSIZE, ttl=3600.0)
+auth_flight = SingleFlight()
+
+# Logged-out access tokens and session ids -> True, each entry expiring with its token;
+# a local shortcut in front of the revoked_sessions table, so losing an entry is safe
+revoked_tokens = TTLCache(maxsize=settings.AUTH_REVOKED_TOKENS_MAXSIZE, ttl=3600.0)
+
+_jwks: Dict[str, Any] = {"keys": {}, "fetched_at": None}
+
+class TokenExpiredError(Exception):
+    """The access token is well formed but past its exp; callers may refresh it"""
+
+class TokenUser:
+    """The authenticated user as described by a verified token's claims"""
+
+    __slots__ = ("id", "email", "phone", "role", "aud", "app_metadata", "user_metadata", "claims")
+
+    def __init__(self, claims: Dict[str, Any]):
+        self.id = claims["sub"]
+        self.email = claims.get("email")
+        self.phone = claims.get("phone")
+        self.role = claims.get("role")
+        self.aud = claims.get("aud")
+        self.app_metadata = claims.get("app_metadata") or {}
+        self.user_metadata = claims.get("user_metadata") or {}
+        self.claims = claims
+
+    def __repr__(self) -> str:
+        return f"TokenUser(id={self.id!r}, email={self.email!r})"
+
+async def _fetch_jwks() -> Dict[str, Any]:
+    # Tried again no sooner than AUTH_JWKS_MIN_REFRESH, whether or not this fetch works
+    _jwks["fetched_at"] = time.monotonic()
+    response = await get_http_client().get(
+        f"{settings.SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json",
+        headers={"apikey": settings.SUPABASE_KEY}
+    )
+    if response.status_code != 200:
+        # Keep the keys we have; they're still valid until the project rotates them
+        logger.warning(f"Could not fetch Supabase JWKS (status {response.status_code}), keeping {len(_jwks['keys'])} cached keys")
+        return _jwks["keys"]
+    try:
+        keys = {key.key_id: key for key in jwt.PyJWKSet.from_dict(response.json()).keys}
+    except jwt.PyJWKSetError:
+        # Projects still on the shared HS256 secret publish no usable keys
+        keys = {}
+    except ValueError as e:
+        logger.warning(f"Could not parse Supabase JWKS, keeping {len(_jwks['keys'])} cached keys: {str(e)}")
+        return _jwks["keys"]
+    _jwks["keys"] = keys
+    return keys
+
+async def _signing_key(kid: str) -> Optional[jwt.PyJWK]:
+    """JWKS key for kid, refetching the set when it is old or the kid is new"""
+    fetched_at = _jwks["fetched_at"]
+    age = time.monotonic() - fetched_at if fetched_at is not None else None
+    keys = _jwks["keys"]
+    # Unknown kids trigger at most one refetch per AUTH_JWKS_MIN_REFRESH
+    if age is None or age > settings.AUTH_JWKS_TTL or (kid not in keys and age > settings.AUTH_JWKS_MIN_REFRESH):
+        try:
+            keys = await auth_flight.do("jwks", _fetch_jwks)
+        except Exception as e:
+            logger.error(f"Error fetching Supabase JWKS: {str(e)}")
+    return keys.get(kid)
+
+def _session_revoked(claims: Dict[str, Any]) -> bool:
+    session_id = claims.get("session_id")
+    return session_id is not None and revoked_tokens.get(("session", session_id)) is not MISSING
+
+async def _session_revoked_remotely(session_id: str) -> bool:
+    """Whether any worker recorded a logout for this session"""
+    response = await db.execute(
+        supabase_service.table(REVOKED_SESSIONS_TABLE)
+        .select("session_id")
+        .eq("session_id", session_id)
+        .limit(1)
+    )
+    return bool(response.data)
+
+def _cache(access_token: str, user: Any, exp: Optional[float]) -> None:
+    ttl = (exp - time.time()) if exp else settings.AUTH_USER_CACHE_FALLBACK_TTL
+    # Re-check revocations every so often, even for long-lived tokens
+    ttl = min(ttl, settings.AUTH_REVOCATION_CHECK_INTERVAL)
+    if ttl > 0:
+        auth_user_cache.set(access_token, user, ttl=ttl)
+
+async def _verify_remotely(access_token: str) -> Optional[Any]:
+    """Ask Supabase about a token we can't verify locally"""
+    try:
+        response = await asyncio.to_thread(supabase.auth.get_user, access_token)
+    except Exception as e:
+        if "expired" in str(e).lower():
+            raise TokenExpiredError(str(e)) from e
+        logger.error(f"Error verifying token: {str(e)}")
+        return None
+    if not response or not response.user:
+        return None
+    exp = jwt.decode(access_token, options={"verify_signature": False}).get("exp")
+    _cache(access_token, response.user, exp)
+    return response.user
+
+async def verify_access_token(access_token: str) -> Optional[Any]:
+    """
+    Return the user for a Supabase access token, or None if it is invalid.
+    Raises TokenExpiredError for a genuine token that has expired.
+    """
+    if revoked_tokens.get(access_token) is not MISSING:
+        return None
+
+    user = auth_user_cache.get(access_token)
+    if user is not MISSING:
+        # Another token of a session that has since logged out
+        if isinstance(user, TokenUser) and _session_revoked(user.claims):
+            auth_user_cache.invalidate(access_token)
+            return None
+        return user
+
+    try:
+        header = jwt.get_unverified_header(access_token)
+    except jwt.InvalidTokenError:
+        return None
+
+    algorithm = header.get("alg")
+    if algorithm == "HS256" and settings.SUPABASE_JWT_SECRET:
+        key, algorithms = settings.SUPABASE_JWT_SECRET, ["HS256"]
+    elif algorithm in ASYMMETRIC_ALGORITHMS and header.get("kid"):
+        jwk = await _signing_key(header["kid"])
+        key, algorithms = (jwk.key, [jwk.algorithm_name]) if jwk else (None, None)
+    else:
+        key = None
+
+    if key is None:
+        # Concurrent requests carrying the same token share one lookup
+        return await auth_flight.do(("user", access_token), lambda: _verify_remotely(access_token))
+
+    try:
+        claims = jwt.decode(
+            access_token,
+            key,
+            algorithms=algorithms,
+            audience=settings.SUPABASE_JWT_AUDIENCE,
+            options={"require": ["exp", "sub"]}
+        )
+    except jwt.ExpiredSignatureError as e:
+        raise TokenExpiredError("Token is expired") from e
+    except jwt.InvalidTokenError as e:
+        logger.warning(f"Rejected access token: {str(e)}")
+        return None
+    if _session_revoked(claims):
+        return None
+    session_id = claims.get("session_id")
+    if not session_id:
+        # Nothing to look a logout up by; let Supabase decide
+        return await auth_flight.do(("user", access_token), lambda: _verify_remotely(access_token))
+    try:
+        # Concurrent requests for the same session share one lookup
+        revoked = await auth_flight.do(("revoked", session_id), lambda: _session_revoked_remotely(session_id))
+    except Exception as e:
+        logger.error(f"Error checking revoked sessions, verifying remotely: {str(e)}")
+        return await auth_flight.do(("user", access_token), lambda: _verify_remotely(access_token))
+    if revoked:
+        _remember_revoked(access_token, claims)
+        return None
+
+    user = TokenUser(claims)
+    _cache(access_token, user, claims["exp"])
+    return user
+
+def _remember_revoked(access_token: str, claims: Dict[str, Any]) -> None:
+    exp = claims.get("exp")
+    ttl = (exp - time.time()) if isinstance(exp, (int, float)) else settings.AUTH_USER_CACHE_FALLBACK_TTL
+    if ttl <= 0:
+        return
+    revoked_tokens.set(access_token, True, ttl=ttl)
+    if claims.get("session_id"):
+        revoked_tokens.set(("session", claims["session_id"]), True, ttl=ttl)
+
+async def forget_token(access_token: Optional[str]) -> None:
+    """Revoke a token and its session for every worker, e.g. on logout"""
+    if not access_token:
+        return
+    auth_user_cache.invalidate(access_token)
+    try:
+        claims = jwt.decode(access_token, options={"verify_signature": False})
+    except jwt.InvalidTokenError:
+        return
+    _remember_revoked(access_token, claims)
+    session_id = claims.get("session_id")
+    if not session_id:
+        return
+    exp = claims.get("exp")
+    expires_at = datetime.fromtimestamp(exp, timezone.utc) if isinstance(exp, (int, float)) else datetime.now(timezone.utc)
+    try:
+        await db.execute(
+            supabase_service.table(REVOKED_SESSIONS_TABLE).upsert(
+                {"session_id": session_id, "expires_at": expires_at.isoformat()},
+                on_conflict="session_id",
+                ignore_duplicates=True
+            )
+        )
+    except Exception as e:
+        logger.error(f"Error recording revoked session {session_id}: {str(e)}")
@@ -26,11 +26,95 @@ class Settings(BaseSettings):
     
     # API key settings
     API_KEY_HEADER: str = "X-API-Key"
+    API_KEY_HASH_SECRET: str = os.getenv("API_KEY_HASH_SECRET", "")  # HMAC key for stored API key hashes; changing it invalidates every key
+    API_KEY_CACHE_TTL: float = 300.0  # Seconds a resolved key stays cached
+    API_KEY_CACHE_NEGATIVE_TTL: float = 30.0  # Seconds an invalid key stays cached
+    API_KEY_CACHE_MAXSIZE: int = 10000
+    API_KEY_USAGE_FLUSH_INTERVAL: float = 30.0  # Seconds between bulk last_used_at / usage_count writes
+    API_KEY_USAGE_MAX_PENDING: int = 10000  # Distinct keys buffered before flushing early
+    CONNECTION_CACHE_TTL: float = 60.0  # Seconds a user's credentials stay cached
+    CONNECTION_CACHE_MAXSIZE: int = 10000
+    CONNECTIONS_PROVIDER_TIMEOUT: float = 2.0  # Seconds the connections page waits per provider before deferring it
+    
+    # Notion database / Airtable base catalog (stale-while-revalidate)
+    CATALOG_TTL: float = 300.0  # Seconds a listing is fresh
+    CATALOG_MAX_STALE: float = 86400.0  # Seconds a listing may be served stale while it refreshes
+    CATALOG_MAXSIZE: int = 5000
+    CATALOG_REFRESH_INTERVAL: float = 60.0  # Seconds between background refresher passes (0 disables)
+    CATALOG_IDLE_TTL: float = 3600.0  # Stop refreshing users who haven't asked in this long
+    CATALOG_MAX_PAGES: int = 100  # Safety cap on provider pagination
+    CATALOG_SCHEMA_CONCURRENCY: int = 4  # Concurrent Airtable table schema requests per listing
+    
+    # Outbound HTTP client pool settings
+    HTTP_CLIENT_HTTP2: bool = True
+    HTTP_CLIENT_MAX_CONNECTIONS: int = 100
+    HTTP_CLIENT_MAX_KEEPALIVE: int = 20
+    HTTP_CLIENT_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP_CLIENT_MAX_PER_HOST: int = 20  # Concurrent requests allowed per provider host
+    HTTP_CLIENT_TIMEOUT: float = 15.0
+    HTTP_CLIENT_CONNECT_TIMEOUT: float = 5.0
+    NOTION_CLIENT_CACHE_TTL: float = 3600.0  # Seconds a per-token Notion client is reused
+    NOTION_CLIENT_CACHE_MAXSIZE: int = 1000
+    
+    # Outbound rate limits, as requests/second and burst per provider key
+    RATE_LIMIT_NOTION_RPS: float = 3.0  # Per integration token
+    RATE_LIMIT_NOTION_BURST: int = 3
+    RATE_LIMIT_AIRTABLE_RPS: float = 5.0  # Per base
+    RATE_LIMIT_AIRTABLE_BURST: int = 5
+    RATE_LIMIT_FACEBOOK_RPS: float = 20.0  # Per user access token
+    RATE_LIMIT_FACEBOOK_BURST: int = 20
+    RATE_LIMIT_MAX_RETRIES: int = 3  # Retries after a 429 before giving up
+    RATE_LIMIT_BACKOFF_BASE: float = 1.0  # Seconds; doubled per retry when there's no Retry-After
+    RATE_LIMIT_BACKOFF_MAX: float = 30.0
+    RATE_LIMIT_MAX_RETRY_AFTER: float = 60.0  # Give up rather than wait longer than this
+    AIRTABLE_BATCH_WINDOW: float = 0.01  # Seconds to collect record fetches per table (0 disables)
+    AIRTABLE_BATCH_MAX_RECORDS: int = 100  # Airtable's list-records page size limit
+    
+    # Build queue settings
+    BUILD_QUEUE_BACKEND: str = "sqlite"  # Options: sqlite, memory
+    BUILD_QUEUE_PATH: str = "data/build_queue.sqlite3"
+    BUILD_QUEUE_CONCURRENCY: int = 12  # Also bounds how many Airtable record fetches can share a batch
+    BUILD_QUEUE_MAX_ATTEMPTS: int = 5
+    BUILD_QUEUE_RETRY_BASE_DELAY: float = 2.0
+    BUILD_QUEUE_RETRY_MAX_DELAY: float = 300.0
+    BUILD_QUEUE_VISIBILITY_TIMEOUT: float = 600.0  # Seconds a claimed job may run before another worker may take it over
+    BUILD_QUEUE_SHUTDOWN_TIMEOUT: float = 10.0  # Seconds running jobs get to finish on shutdown before they're cancelled
+    WEBHOOK_BATCH_MAX_RECORDS: int = 500  # Records accepted per batch webhook
+    WEBHOOK_MAX_BODY_BYTES: int = 10 * 1024 * 1024  # Larger webhook bodies are rejected with 413
+    WEBHOOK_BATCH_MAX_BODY_BYTES: int = 50 * 1024 * 1024
+    WEBHOOK_PRUNE_PAYLOADS: bool = True  # Only keep the properties/fields the field map reads (captures included)
+    
+    # Transform tracing (payload dumps are only serialized for sampled requests)
+    TRANSFORM_DEBUG_SAMPLE_RATE: int = 0  # Trace 1 in N transforms; 0 disables sampling
+    TRANSFORM_DEBUG_USER_IDS: str = ""  # Comma-separated user ids that are always traced
+    FIELD_MAP_CACHE_MAXSIZE: int = 1024  # Compiled field maps kept by raw query string
+    
+    # Webhook capture store (sampled payloads written off the request path)
+    CAPTURE_ENABLED: bool = True
+    CAPTURE_DIR: str = "logs/captures"
+    CAPTURE_SAMPLE_RATE: float = 1.0  # Fraction of webhooks captured
+    CAPTURE_SEGMENT_MAX_BYTES: int = 16 * 1024 * 1024  # Compressed size before rotating
+    CAPTURE_MAX_TOTAL_BYTES: int = 512 * 1024 * 1024
+    CAPTURE_SEGMENT_MAX_AGE: float = 3600.0  # Seconds before the active segment is rotated, however small
+    CAPTURE_RETENTION_DAYS: float = 7.0
+    CAPTURE_RETENTION_INTERVAL: float = 300.0  # Seconds between retention passes besides the ones after rotation
+    CAPTURE_QUEUE_SIZE: int = 10000  # Captures waiting for the writer before new ones are dropped
     
     # Supabase settings
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY", "")
     SUPABASE_SERVICE_KEY: str = os.getenv("SUPABASE_SERVICE_KEY", "")
+    SUPABASE_MAX_CONCURRENCY: int = 16  # Threads available for blocking Supabase queries
+    SUPABASE_JWT_SECRET: str = os.getenv("SUPABASE_JWT_SECRET", "")  # Enables local HS256 token verification
+    SUPABASE_JWT_AUDIENCE: str = "authenticated"
+    AUTH_USER_CACHE_MAXSIZE: int = 10000  # Verified users cached per access token until exp
+    AUTH_USER_CACHE_FALLBACK_TTL: float = 60.0  # For tokens without an exp claim
+    AUTH_REVOCATION_CHECK_INTERVAL: float = 60.0  # Seconds a verified token is trusted before revoked_sessions is checked again
+    # Per-process shortcut in front of the revoked_sessions table; an evicted entry
+    # only costs a table lookup, so logouts still hold across workers and restarts
+    AUTH_REVOKED_TOKENS_MAXSIZE: int = 10000
+    AUTH_JWKS_TTL: float = 600.0  # Seconds before the signing keys are refetched
+    AUTH_JWKS_MIN_REFRESH: float = 30.0  # Minimum gap between refetches for unknown key ids
     
     app_name: str = "Pablo"
     notion_client_id: str = os.getenv("NOTION_CLIENT_ID", "")
@@ -0,0 +1,36 @@
+"""Non-blocking access to the synchronous supabase-py client.
+
+supabase-py only exposes a blocking ``.execute()``, so every query is handed to
+a dedicated, bounded thread pool instead of running on the event loop. A slow
+round trip then only occupies one pool thread rather than stalling every
+in-flight request.
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.SUPABASE_MAX_CONCURRENCY,
+    thread_name_prefix="supabase"
+)
+
+async def run_sync(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking callable on the database thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+async def execute(query) -> Any:
+    """Execute a supabase-py query builder without blocking the event loop"""
+    return await run_sync(query.execute)
+
+def shutdown() -> None:
+    """Stop accepting new queries and release the pool threads"""
+    logger.info("Shutting down Supabase thread pool")
+    _executor.shutdown(wait=False)
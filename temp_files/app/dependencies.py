@@ -1,14 +1,14 @@
 # app/dependencies.py
 import logging
 import json
-from typing import Optional, Dict
-from urllib.parse import unquote
+from typing import Optional
 
 from fastapi import Depends, HTTPException, status, Query
 
 # Assuming these are the correct import paths based on previous context
 from app.middleware.api_key_middleware import get_api_key_from_request
-from app.auth.supabase_auth import supabase_service
+from app.services.api_key_service import api_key_service
+from app.transformers.field_mapping import FieldMapping, compile_field_map
 
 logger = logging.getLogger(__name__)
 
@@ -27,20 +27,8 @@ async def verify_api_key_and_get_user(
         )
 
     try:
-        # Ensure we only select the user_id column for efficiency
-        response = supabase_service.table("api_keys").select("user_id").eq("key", api_key).limit(1).execute()
-
-        if not response.data:
-            logger.error(f"API key verification failed: Invalid API key provided.")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid API key"
-            )
-
-        user_id = response.data[0]["user_id"]
-        logger.info(f"API key verified successfully for user_id: {user_id}")
-        return user_id
-
+        # Served from the in-process key cache when warm
+        user_id = await api_key_service.get_user_id_for_key(api_key)
     except Exception as e:
         logger.error(f"API key verification failed due to database error: {str(e)}")
         raise HTTPException(
@@ -48,12 +36,22 @@ async def verify_api_key_and_get_user(
             detail="Could not verify API key due to an internal error."
         )
 
+    if not user_id:
+        logger.error(f"API key verification failed: Invalid API key provided.")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid API key"
+        )
+
+    logger.info(f"API key verified successfully for user_id: {user_id}")
+    return user_id
+
 async def parse_field_map(
     field_map: Optional[str] = Query(
         None,
         description='URL-encoded JSON string mapping source fields to destination fields. Example: {"Source Name":"ad_name"}'
     )
-) -> Optional[Dict[str, str]]:
+) -> Optional[FieldMapping]:
     """
     FastAPI dependency that parses a URL-encoded JSON field mapping.
     
@@ -62,7 +60,7 @@ async def parse_field_map(
                   Example: {"Source Field":"dest_field"}
                   
     Returns:
-        Dict mapping source fields to destination fields, or None if no mapping provided
+        FieldMapping of source fields to destination fields, or None if no mapping provided
         
     Raises:
         HTTPException: If the field_map is provided but invalid
@@ -71,29 +69,8 @@ async def parse_field_map(
         return None
 
     try:
-        # URL decode the string first
-        decoded_string = unquote(field_map)
-        logger.info(f"URL decoded field_map string: {decoded_string}")
-
-        # Parse the decoded string as JSON
-        mapping = json.loads(decoded_string)
-        
-        # Validate the mapping structure
-        if not isinstance(mapping, dict):
-            raise ValueError("Field map must be a JSON object")
-            
-        # Ensure all keys and values are strings
-        invalid_entries = [
-            (k, v) for k, v in mapping.items()
-            if not isinstance(k, str) or not isinstance(v, str)
-        ]
-        if invalid_entries:
-            raise ValueError(
-                f"All keys and values must be strings. Invalid entries: {invalid_entries}"
-            )
-
-        logger.info(f"Successfully parsed field map: {mapping}")
-        return mapping
+        # Compiled mappings are cached by the raw string
+        return compile_field_map(field_map)
 
     except json.JSONDecodeError as e:
         logger.error(f"Invalid JSON in field_map: {e}")
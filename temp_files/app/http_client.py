@@ -0,0 +1,153 @@
+"""Application-lifetime HTTP client pool for outbound provider calls.
+
+A single httpx.AsyncClient (HTTP/2, keep-alive) is shared by every call to
+Notion, Airtable, Facebook and Cloudflare so connections are reused instead of
+paying TCP and TLS setup per request. It is opened and closed by the FastAPI
+lifespan hook; get_http_client() creates it lazily for scripts that run
+outside the app.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+import httpx
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_client: Optional[httpx.AsyncClient] = None
+_transport: Optional["HostLimitedTransport"] = None
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response stream that frees the per-host slot once the body is closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+class HostLimitedTransport(httpx.AsyncBaseTransport):
+    """Caps concurrent requests per host and keeps per-host counters"""
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport, max_per_host: int):
+        self._transport = transport
+        self._max_per_host = max_per_host
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.host_stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"requests": 0, "errors": 0, "in_flight": 0, "waiting": 0}
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self._max_per_host))
+        stats = self.host_stats[host]
+
+        stats["waiting"] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            stats["waiting"] -= 1
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+
+        released = False
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                stats["in_flight"] -= 1
+                semaphore.release()
+
+        try:
+            response = await self._transport.handle_async_request(request)
+        except Exception:
+            stats["errors"] += 1
+            release()
+            raise
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream, release),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Summarise the underlying connection pool"""
+        pool = getattr(self._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        return {
+            "connections": len(connections),
+            "idle": sum(1 for conn in connections if conn.is_idle()),
+            "http2": sum(1 for conn in connections if "HTTP/2" in repr(conn)),
+            "hosts": {host: dict(stats) for host, stats in self.host_stats.items()},
+        }
+
+def _build_client() -> httpx.AsyncClient:
+    global _transport
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE,
+        keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY,
+    )
+    _transport = HostLimitedTransport(
+        httpx.AsyncHTTPTransport(http2=settings.HTTP_CLIENT_HTTP2, limits=limits),
+        max_per_host=settings.HTTP_CLIENT_MAX_PER_HOST,
+    )
+    timeout = httpx.Timeout(
+        settings.HTTP_CLIENT_TIMEOUT,
+        connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT,
+    )
+    return httpx.AsyncClient(transport=_transport, timeout=timeout)
+
+async def startup() -> None:
+    """Open the shared client (called from the FastAPI lifespan hook)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+        logger.info("Opened shared HTTP client pool")
+
+async def shutdown() -> None:
+    """Close the shared client and its pooled connections"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("Closed shared HTTP client pool")
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it if the lifespan hook hasn't run"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+def get_transport() -> "HostLimitedTransport":
+    """
+    Return the shared pooled transport, for SDK clients that need their own
+    httpx.AsyncClient (base URL, auth headers) but should reuse our connections.
+    Never close a client built on it; the pool belongs to the shared client.
+    """
+    get_http_client()
+    return _transport
+
+def pool_stats() -> Dict[str, Any]:
+    """Connection pool and per-host request stats for monitoring"""
+    if _client is None or _transport is None:
+        return {"open": False}
+    return {"open": not _client.is_closed, **_transport.pool_stats()}
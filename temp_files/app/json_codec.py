@@ -0,0 +1,58 @@
+"""JSON encoding and decoding for request bodies, responses, captures and logs.
+
+Uses orjson when it is installed and falls back to the stdlib json module
+otherwise, with the same output shape either way: compact UTF-8 by default,
+indent=2 with sorted keys for pretty(), and str() for anything that isn't
+natively serializable. Decoding errors are json.JSONDecodeError (orjson's
+error subclasses it), so existing except clauses keep working.
+"""
+import json
+from typing import Any, Union
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+    _PRETTY_OPTIONS = _OPTIONS | orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """Parse a JSON document"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=str, option=_OPTIONS)
+        except TypeError:
+            # e.g. integers beyond 64 bits, which the stdlib still handles
+            pass
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+def dumps_str(obj: Any) -> str:
+    """dumps() as text, for log lines and TEXT columns"""
+    return dumps(obj).decode("utf-8")
+
+def pretty(obj: Any) -> str:
+    """Indented JSON with sorted keys, for logging payloads"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=str, option=_PRETTY_OPTIONS).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(obj, indent=2, sort_keys=True, default=str)
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the fast codec; the app's default response class"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
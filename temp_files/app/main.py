@@ -3,7 +3,6 @@ import os
 from dotenv import load_dotenv
 import logging
 import starlette.templating
-from starlette.templating import _TemplateResponse
 
 # Load environment variables first thing
 env_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env')
@@ -14,17 +13,31 @@ else:
     # Fall back to default location
     load_dotenv()  # Try default location
 
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.templating import Jinja2Templates
+from app.templating import create_templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse
 from app.config import get_settings, settings
 from app.middleware.auth_middleware import AuthMiddleware
 from app.middleware.supabase_middleware import SupabaseConnectionMiddleware
 from app.services.auth_service import AuthService
-from app.services.connection_service import connection_service
+from app.services.connection_service import connection_service, connection_cache, connection_flight
 from app.routers import ads, connections, api_keys, webhooks, legal
 from app.auth.router import router as auth_router
+from app import db, http_client
+from app.services.api_key_service import api_key_cache, api_key_flight, api_key_usage
+from app.services import build_service
+from app.transformers.field_mapping import compile_field_map
+from app.services.webhook_capture import webhook_capture
+from app.services.workspace_catalog import workspace_catalog
+from app.services.notion_service import notion_client_cache
+from app.rate_limit import rate_limiter
+from app.services.airtable_service import record_batcher
+from app.auth.token_verifier import auth_user_cache, revoked_tokens
+from app.auth.public_routes import public
+from app.json_codec import FastJSONResponse
 from fastapi.openapi.utils import get_openapi
 import jwt
 from fastapi.middleware.cors import CORSMiddleware
@@ -40,20 +53,38 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop application-lifetime resources"""
+    await http_client.startup()
+    await build_service.start()
+    webhook_capture.start()
+    await workspace_catalog.start()
+    await api_key_usage.start()
+    yield
+    await api_key_usage.stop()
+    await workspace_catalog.stop()
+    await build_service.stop()
+    await asyncio.to_thread(webhook_capture.stop)
+    await http_client.shutdown()
+    db.shutdown()
+
 app = FastAPI(
     title="Pablo",
     description="Backend API for Pablo",
     version="0.1.0",
     docs_url=None,  # Disable /docs
     redoc_url=None,  # Disable /redoc
-    openapi_url=None  # Disable OpenAPI schema
+    openapi_url=None,  # Disable OpenAPI schema
+    default_response_class=FastJSONResponse,  # orjson when installed
+    lifespan=lifespan
 )
 settings = get_settings()
 logger.info(f"Starting application in {settings.ENV} environment")
 logger.info(f"Using domain: {settings.domain}")
 logger.info(f"Template directory: {os.path.abspath('templates')}")
 logger.info(f"Templates available: {os.listdir('templates') if os.path.exists('templates') else 'Directory not found'}")
-templates = Jinja2Templates(directory="templates")
+templates = create_templates()
 
 # Add custom filter for truncating characters
 def truncatechars(value, length):
@@ -67,13 +98,13 @@ templates.env.filters["truncatechars"] = truncatechars
 # Mount the static directory if it exists
 static_dir = "static"
 if os.path.exists(static_dir) and os.path.isdir(static_dir):
-    app.mount("/static", StaticFiles(directory=static_dir), name="static")
+    app.mount("/static", public(StaticFiles(directory=static_dir)), name="static")
 else:
     logger.warning(f"Static directory '{static_dir}' does not exist. Static files will not be served.")
     # Create an empty directory to prevent errors
     os.makedirs(static_dir, exist_ok=True)
     # Mount it anyway to avoid errors in templates that reference static files
-    app.mount("/static", StaticFiles(directory=static_dir), name="static")
+    app.mount("/static", public(StaticFiles(directory=static_dir)), name="static")
 
 # Add CORS middleware
 app.add_middleware(
@@ -114,6 +145,7 @@ app.include_router(webhooks.router, prefix="/webhooks", tags=["webhooks"])
 app.include_router(legal.router, prefix="/legal", tags=["legal"])
 
 @app.get("/")
+@public
 async def home(request: Request):
     try:
         logger.info("Loading index.html template")
@@ -129,6 +161,7 @@ async def home(request: Request):
         return JSONResponse({"error": "Template error", "details": str(e)})
 
 @app.get("/routes")
+@public
 async def get_routes():
     """
     Returns a list of all available routes in the application.
@@ -152,7 +185,33 @@ async def get_routes():
     
     return {"routes": routes} 
 
+@app.get("/stats")
+async def get_stats():
+    """
+    Returns runtime stats (outbound HTTP pool, caches) for monitoring.
+    """
+    return {
+        "http_pool": http_client.pool_stats(),
+        "api_key_cache": api_key_cache.stats(),
+        "api_key_usage": api_key_usage.stats(),
+        "auth_user_cache": auth_user_cache.stats(),
+        "revoked_tokens": revoked_tokens.stats(),
+        "connection_cache": connection_cache.stats(),
+        "notion_client_cache": notion_client_cache.stats(),
+        "single_flight": {
+            "api_key_lookup": api_key_flight.stats(),
+            "connections": connection_flight.stats()
+        },
+        "rate_limits": rate_limiter.stats(),
+        "airtable_record_batcher": record_batcher.stats(),
+        "build_queue": await asyncio.to_thread(build_service.queue.stats),
+        "field_map_cache": compile_field_map.cache_info()._asdict(),
+        "webhook_capture": webhook_capture.stats(),
+        "workspace_catalog": workspace_catalog.stats()
+    }
+
 @app.get("/sitemap", response_class=HTMLResponse)
+@public
 async def sitemap(request: Request):
     """
     Displays a human-readable sitemap of all routes.
@@ -197,16 +256,3 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         status_code=exc.status_code,
         content={"detail": exc.detail}
     )
-
-@app.middleware("http")
-async def add_settings_to_templates(request: Request, call_next):
-    """Add settings to all template responses"""
-    response = await call_next(request)
-    
-    # Only modify template responses
-    if isinstance(response, _TemplateResponse):
-        # Add settings to the context if not already present
-        if "settings" not in response.context:
-            response.context["settings"] = settings.dict()
-    
-    return response 
\ No newline at end of file
@@ -1,117 +1,133 @@
 from fastapi import Request, HTTPException, Depends
-from fastapi.responses import RedirectResponse, JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi.responses import RedirectResponse, JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from app.auth.supabase_auth import supabase
+from app.auth.token_verifier import verify_access_token, TokenExpiredError
+from app.auth.public_routes import PublicRouteMatcher
+from app.config import settings
 import jwt
+import asyncio
 import logging
+from typing import Iterable, Optional
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Define public routes that don't require authentication
-PUBLIC_ROUTES = [
-    "/",
-    "/auth/login",
-    "/auth/register",
-    "/auth/reset-password",
-    "/auth/callback",
-    "/auth/session",
-    "/auth/resend-confirmation",
-    "/legal/privacy-policy",
-    "/legal/terms-of-service",
-    "/static",
-    "/favicon.ico",
-    "/sitemap",
-    "/routes",
-]
+# Paths with no route of their own that shouldn't bounce to the login page;
+# everything else is public only if its route is marked with @public
+EXTRA_PUBLIC_PATHS = ("/favicon.ico",)
 
-# Define prefixes for routes that don't require authentication
-PUBLIC_PREFIXES = [
-    "/static/",
-    "/auth/",
-    "/legal/",
-    "/api/public/",
-    "/webhooks/",
-]
-
-# Make sure /connections is NOT in these lists
-
-class AuthMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        logger.info(f"Auth middleware processing request to: {request.url.path}")
+class AuthMiddleware:
+    """Pure ASGI middleware that sends unauthenticated page requests to the login page"""
+    
+    def __init__(self, app: ASGIApp, extra_public_paths: Iterable[str] = EXTRA_PUBLIC_PATHS):
+        self.app = app
+        self.extra_public_paths = tuple(extra_public_paths)
+        self._public_routes: Optional[PublicRouteMatcher] = None
         
-        # Skip auth for public routes
-        if request.url.path in PUBLIC_ROUTES or any(request.url.path.startswith(prefix) for prefix in PUBLIC_PREFIXES):
-            logger.info(f"Skipping auth for public route: {request.url.path}")
-            return await call_next(request)
+    def is_public(self, scope: Scope) -> bool:
+        """Whether the request's route is marked @public, compiled from the app's router table"""
+        routes = getattr(scope.get("app"), "routes", ())
+        matcher = self._public_routes
+        # Compiled on first use and again only if the router table changes size
+        if matcher is None or matcher.route_count != len(routes):
+            matcher = self._public_routes = PublicRouteMatcher(routes, self.extra_public_paths)
+        return matcher(scope["path"])
         
-        # Check if the path starts with /connections/ but is not exactly /connections
-        if request.url.path.startswith("/connections/") and request.url.path != "/connections":
-            # For OAuth callbacks and other connection-related routes
-            return await call_next(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+            
+        path = scope["path"]
+        logger.info(f"Auth middleware processing request to: {path}")
+        
+        # Skip auth for public routes
+        if self.is_public(scope):
+            logger.info(f"Skipping auth for public route: {path}")
+            await self.app(scope, receive, send)
+            return
+            
+        # Request(scope).state writes through to scope["state"], so routes see what we set
+        request = Request(scope)
         
         # Get token from cookies
         access_token = request.cookies.get("access_token")
-
+        
         if not access_token:
-            logger.warning(f"No token found for protected route: {request.url.path}")
-            return RedirectResponse(url="/auth/login", status_code=303)
-
+            logger.warning(f"No token found for protected route: {path}")
+            await RedirectResponse(url="/auth/login", status_code=303)(scope, receive, send)
+            return
+            
         try:
             logger.debug(f"Verifying token: {access_token[:10]}...")
-            # Verify the token with Supabase
-            user = supabase.auth.get_user(access_token)
+            # Verified locally against the project's signing key and cached until exp
+            user = await verify_access_token(access_token)
+        except TokenExpiredError as e:
+            logger.info(f"Auth error: {str(e)}")
+            user = None
+            expired = True
+        else:
+            expired = False
             
-            logger.debug(f"Token verification result: {user}")
-            if not user or not user.user:
-                logger.warning(f"Invalid token for protected route: {request.url.path}")
-                return RedirectResponse(url="/auth/login", status_code=303)
+        if user:
+            # Add user to request state so get_current_user doesn't verify again
+            request.state.user = user
+            request.state.user_id = user.id
+            logger.info(f"User authenticated: {user.id}")
+            await self.app(scope, receive, send)
+            return
             
-            # Add user to request state
-            request.state.user = user.user
-            logger.info(f"User authenticated: {user.user.id}")
+        if not expired:
+            logger.warning(f"Invalid token for protected route: {path}")
+            await RedirectResponse(url="/auth/login", status_code=303)(scope, receive, send)
+            return
             
-            return await call_next(request)
-        except Exception as e:
-            logger.error(f"Auth error: {str(e)}")
+        # The token is expired, so try to refresh it
+        session = None
+        refresh_token = request.cookies.get("refresh_token")
+        if refresh_token:
+            try:
+                logger.info("Attempting to refresh token")
+                response = await asyncio.to_thread(supabase.auth.refresh_session, refresh_token)
+                session = response.session if response else None
+            except Exception as refresh_error:
+                logger.error(f"Token refresh error: {str(refresh_error)}")
+                
+        if not session:
+            # If we get here, authentication failed
+            await RedirectResponse(url="/auth/login", status_code=303)(scope, receive, send)
+            return
             
-            # Check if token is expired
-            if "token is expired" in str(e).lower():
-                # Try to refresh the token
-                refresh_token = request.cookies.get("refresh_token")
-                if refresh_token:
-                    try:
-                        logger.info("Attempting to refresh token")
-                        response = supabase.auth.refresh_session(refresh_token)
-                        
-                        if response and response.session:
-                            # Create a new response with the refreshed token
-                            original_response = await call_next(request)
-                            
-                            # Set the new tokens in cookies
-                            original_response.set_cookie(
-                                key="access_token",
-                                value=response.session.access_token,
-                                httponly=True,
-                                max_age=3600,
-                                secure=getattr(settings, 'cookie_secure', False),
-                                samesite=getattr(settings, 'cookie_samesite', 'lax')
-                            )
-                            original_response.set_cookie(
-                                key="refresh_token",
-                                value=response.session.refresh_token,
-                                httponly=True,
-                                max_age=7 * 24 * 3600,
-                                secure=getattr(settings, 'cookie_secure', False),
-                                samesite=getattr(settings, 'cookie_samesite', 'lax')
-                            )
-                            
-                            return original_response
-                    except Exception as refresh_error:
-                        logger.error(f"Token refresh error: {str(refresh_error)}")
+        request.state.user = session.user
+        request.state.user_id = session.user.id
+        
+        # Set the new tokens in cookies on whatever response the route sends
+        cookies = Response()
+        cookies.set_cookie(
+            key="access_token",
+            value=session.access_token,
+            httponly=True,
+            max_age=3600,
+            secure=getattr(settings, 'cookie_secure', False),
+            samesite=getattr(settings, 'cookie_samesite', 'lax')
+        )
+        cookies.set_cookie(
+            key="refresh_token",
+            value=session.refresh_token,
+            httponly=True,
+            max_age=7 * 24 * 3600,
+            secure=getattr(settings, 'cookie_secure', False),
+            samesite=getattr(settings, 'cookie_samesite', 'lax')
+        )
+        set_cookie_headers = [value for name, value in cookies.raw_headers if name == b"set-cookie"]
+        
+        async def send_with_cookies(message: Message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"set-cookie", value) for value in set_cookie_headers]
+            await send(message)
             
-            # If we get here, authentication failed
-            return RedirectResponse(url="/auth/login", status_code=303)
+        await self.app(scope, receive, send_with_cookies)
 
 async def get_current_user_id(request: Request):
     """Get the current user ID from the request state"""
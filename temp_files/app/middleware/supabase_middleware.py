@@ -1,18 +1,36 @@
 from fastapi import Request, HTTPException
 from fastapi.responses import JSONResponse, HTMLResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from app.auth.supabase_auth import supabase
 import logging
 import os
 from app.config import settings
-from fastapi.templating import Jinja2Templates
+from app.templating import create_templates
 import jwt
 
 logger = logging.getLogger(__name__)
-templates = Jinja2Templates(directory="templates")
+templates = create_templates()
 
-class SupabaseConnectionMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+class SupabaseConnectionMiddleware:
+    """Pure ASGI middleware that points the Supabase client at the caller's session"""
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+            
+        request = Request(scope)
+        response_started = False
+        
+        async def send_wrapper(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+            
         try:
             # Get access token from cookies
             access_token = request.cookies.get("access_token")
@@ -33,10 +51,13 @@ class SupabaseConnectionMiddleware(BaseHTTPMiddleware):
                 except Exception as e:
                     logger.error(f"Error setting Supabase session: {str(e)}")
             
-            response = await call_next(request)
-            return response
+            await self.app(scope, receive, send_wrapper)
             
         except Exception as e:
+            # Once headers are out we can't replace the response, so let the server handle it
+            if response_started:
+                raise
+                
             error_message = str(e)
             logger.error(f"Supabase middleware error: {error_message}")
             
@@ -44,7 +65,7 @@ class SupabaseConnectionMiddleware(BaseHTTPMiddleware):
             accept_header = request.headers.get("accept", "")
             if "text/html" in accept_header:
                 # Return HTML error page
-                return templates.TemplateResponse(
+                response = templates.TemplateResponse(
                     "error.html",
                     {
                         "request": request,
@@ -60,7 +81,8 @@ class SupabaseConnectionMiddleware(BaseHTTPMiddleware):
                 )
             else:
                 # Return JSON error for API requests
-                return JSONResponse(
+                response = JSONResponse(
                     status_code=500,
                     content={"error": "Database connection error", "details": str(e)}
-                ) 
\ No newline at end of file
+                )
+            await response(scope, receive, send)
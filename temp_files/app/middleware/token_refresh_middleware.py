@@ -1,15 +1,24 @@
 from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
 from app.services.connection_service import ConnectionService
 from app.auth.supabase_auth import supabase
 import logging
 from datetime import datetime, timedelta
+from app import db
 
 logger = logging.getLogger(__name__)
 connection_service = ConnectionService(supabase)
 
-class TokenRefreshMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+class TokenRefreshMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+            
+        request = Request(scope)
         # Only check on certain routes that use Facebook API
         if "/facebook/" in request.url.path or "/ads/" in request.url.path:
             try:
@@ -33,18 +42,18 @@ class TokenRefreshMiddleware(BaseHTTPMiddleware):
             except Exception as e:
                 logger.error(f"Error in token refresh middleware: {str(e)}")
         
-        response = await call_next(request)
-        return response
+        await self.app(scope, receive, send)
     
     async def check_and_refresh_facebook_token(self, user_id):
         """Check if Facebook token needs refresh and refresh if needed"""
         try:
             # Get Facebook credentials
-            response = supabase.table('service_credentials')\
-                .select("*")\
-                .eq('user_id', user_id)\
-                .eq('service_name', 'facebook')\
-                .execute()
+            response = await db.execute(
+                supabase.table('service_credentials')
+                .select("*")
+                .eq('user_id', user_id)
+                .eq('service_name', 'facebook')
+            )
             
             if not response.data:
                 return
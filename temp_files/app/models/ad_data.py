@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, HttpUrl
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, TypedDict
 from datetime import datetime, timezone
 from enum import Enum
 import uuid
@@ -13,6 +13,29 @@ class ImportStatus(str, Enum):
     COMPLETE = "complete"
     ERROR = "error"
 
+class AdImportRow(TypedDict):
+    """An ad_imports insert row, as produced by AdData.to_row()"""
+    source_type: str
+    source_record_id: str
+    source_table_id: Optional[str]
+    user_id: str
+    build_id: str
+    ad_id: Optional[str]
+    ad_name: str
+    ad_headline: str
+    ad_body: str
+    ad_link_url: str
+    ad_media_type: str
+    ad_cta_label: str
+    ad_asset_url: str
+    ad_asset_filename: str
+    ad_asset_vertical_url: Optional[str]
+    ad_asset_vertical_filename: Optional[str]
+    destination_ad_account_id: str
+    destination_adset_id: str
+    destination_template_ad_id: str
+    ad_import_status: str
+
 class AdData(BaseModel):
     """Generic model for ad data to be saved to Supabase"""
     source_type: str = Field(..., description="Source of the ad data (e.g., 'notion', 'airtable')")
@@ -36,15 +59,13 @@ class AdData(BaseModel):
     destination_template_ad_id: str = Field(..., min_length=1, description="Facebook template ad ID")
     ad_import_status: ImportStatus = Field(..., description="Status of the ad import process")
 
+    def to_row(self) -> AdImportRow:
+        """The ad_imports insert row, serialized in one pass (URLs and enums as strings)"""
+        return self.model_dump(mode="json")
+
     def to_dict(self) -> Dict[str, Any]:
         """Convert the model to a dictionary with URLs as strings"""
-        data = self.model_dump()
-        # Convert HttpUrl objects to strings
-        data['ad_link_url'] = str(data['ad_link_url'])
-        data['ad_asset_url'] = str(data['ad_asset_url'])
-        if data['ad_asset_vertical_url']:
-            data['ad_asset_vertical_url'] = str(data['ad_asset_vertical_url'])
-        return data
+        return self.to_row()
 
     class Config:
         json_schema_extra = {
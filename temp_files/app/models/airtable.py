@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, validator, HttpUrl
+from pydantic import BaseModel, Field, validator
 from typing import Optional, Dict, Any, List
 from .ad_data import AdData
 import logging
@@ -72,7 +72,7 @@ class AirtablePayload(BaseModel):
             if value is not None:
                 fields[field_name] = value
 
-        # Convert URL strings to HttpUrl objects
+        # Pull URL strings (and filenames) out of attachments; AdData validates the URLs
         url_fields = {
             "ad_link": "ad_link_url",
             "ad_asset": "ad_asset_url",
@@ -89,11 +89,7 @@ class AirtablePayload(BaseModel):
                 else:
                     url_value = fields[airtable_field]
                 
-                try:
-                    fields[ad_field] = HttpUrl(url_value)
-                except ValueError as e:
-                    logger.error(f"Invalid URL for {airtable_field}: {url_value}")
-                    raise ValueError(f"Invalid URL for {airtable_field}: {str(e)}")
+                fields[ad_field] = url_value
 
         # Create AdData with only the fields we have
         try:
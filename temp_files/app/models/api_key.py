@@ -9,6 +9,7 @@ class ApiKey(BaseModel):
     name: str
     created_at: datetime
     last_used_at: Optional[datetime] = None
+    usage_count: int = 0
     
     class Config:
         from_attributes = True  # V2 replacement for orm_mode 
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""Token-bucket scheduling for outbound provider API calls.
+
+Calls are queued per provider and key (Notion per integration token, Airtable
+per base, Facebook per user token) and released at the provider's documented
+rate, so bursts from automations are smoothed out instead of failing. A 429
+pauses the whole bucket for the Retry-After period (or a jittered exponential
+backoff when the header is missing) and the call is retried.
+
+    response = await rate_limiter.call("airtable", base_id, lambda: client.get(url))
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+from app.cache import TTLCache, MISSING
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+T = TypeVar("T")
+
+class TokenBucket:
+    """Refills at rate tokens per second up to burst; waiters are served in arrival order"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller for the next seconds, e.g. after a 429"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> float:
+        """Wait for a token and return the seconds spent waiting"""
+        started = time.monotonic()
+        # Holding the lock while sleeping keeps the queue FIFO
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                delay = self._blocked_until - now
+                if delay <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        break
+                    delay = (1 - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+        return time.monotonic() - started
+
+def retry_after_seconds(headers: Any) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date"""
+    value = headers.get("retry-after") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+class RateLimiter:
+    """Token buckets per (provider, key) with Retry-After aware retries on 429"""
+
+    def __init__(
+        self,
+        limits: Dict[str, Tuple[float, int]],
+        max_retries: int = 3,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+        max_retry_after: float = 60.0,
+        max_buckets: int = 10000
+    ):
+        self.limits = limits
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        # Idle buckets expire; a fresh bucket starts full, which is what an idle one would be
+        self._buckets = TTLCache(maxsize=max_buckets, ttl=600.0)
+        self._stats: Dict[str, Dict[str, Any]] = defaultdict(lambda: {
+            "requests": 0, "waiting": 0, "throttled": 0, "retries": 0, "gave_up": 0,
+            "wait_seconds": 0.0, "max_wait_seconds": 0.0,
+        })
+
+    def bucket(self, provider: str, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get((provider, key))
+        if bucket is MISSING:
+            rate, burst = self.limits[provider]
+            bucket = TokenBucket(rate, burst)
+        # Re-set on every use so active buckets never expire
+        self._buckets.set((provider, key), bucket)
+        return bucket
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            # Never earlier than asked; jitter so queued callers don't all fire at once
+            return retry_after * random.uniform(1.0, 1.2)
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+    async def call(self, provider: str, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run fn() once the (provider, key) bucket has capacity. fn may return an
+        httpx.Response or raise an SDK error carrying status/headers; a 429 is
+        retried up to max_retries times, after which it is returned or raised.
+        """
+        bucket = self.bucket(provider, key)
+        stats = self._stats[provider]
+        attempt = 0
+        while True:
+            stats["waiting"] += 1
+            try:
+                waited = await bucket.acquire()
+            finally:
+                stats["waiting"] -= 1
+            stats["requests"] += 1
+            stats["wait_seconds"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+
+            error = None
+            try:
+                result = await fn()
+                status, headers = getattr(result, "status_code", None), getattr(result, "headers", None)
+            except Exception as e:
+                result = None
+                error = e
+                status, headers = getattr(e, "status", None), getattr(e, "headers", None)
+
+            if status != 429:
+                if error is not None:
+                    raise error
+                return result
+
+            stats["throttled"] += 1
+            retry_after = retry_after_seconds(headers)
+            delay = self._backoff(attempt, retry_after)
+            # A pathological Retry-After shouldn't stall the bucket indefinitely
+            bucket.pause(min(delay, self.max_retry_after))
+            if attempt >= self.max_retries or (retry_after or 0) > self.max_retry_after:
+                stats["gave_up"] += 1
+                logger.warning(f"{provider} still rate limited after {attempt} retries, giving up")
+                if error is not None:
+                    raise error
+                return result
+
+            attempt += 1
+            stats["retries"] += 1
+            logger.warning(f"{provider} rate limited (429), retrying in {delay:.1f}s (attempt {attempt}/{self.max_retries})")
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, wait time and throttling counters per provider"""
+        providers = {}
+        for provider, (rate, burst) in self.limits.items():
+            stats = dict(self._stats[provider])
+            requests = stats["requests"]
+            stats["avg_wait_seconds"] = round(stats["wait_seconds"] / requests, 4) if requests else 0.0
+            stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+            stats["max_wait_seconds"] = round(stats["max_wait_seconds"], 3)
+            providers[provider] = {"rate": rate, "burst": burst, **stats}
+        return {"buckets": len(self._buckets), "providers": providers}
+
+rate_limiter = RateLimiter(
+    {
+        "notion": (settings.RATE_LIMIT_NOTION_RPS, settings.RATE_LIMIT_NOTION_BURST),
+        "airtable": (settings.RATE_LIMIT_AIRTABLE_RPS, settings.RATE_LIMIT_AIRTABLE_BURST),
+        "facebook": (settings.RATE_LIMIT_FACEBOOK_RPS, settings.RATE_LIMIT_FACEBOOK_BURST),
+    },
+    max_retries=settings.RATE_LIMIT_MAX_RETRIES,
+    backoff_base=settings.RATE_LIMIT_BACKOFF_BASE,
+    backoff_max=settings.RATE_LIMIT_BACKOFF_MAX,
+    max_retry_after=settings.RATE_LIMIT_MAX_RETRY_AFTER
+)
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Request, Depends, Form, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from app.templating import create_templates
 from app.auth.auth_utils import get_current_user
 from app.services.api_key_service import ApiKeyService, generate_api_key_for_user
 from app.auth.supabase_auth import supabase
@@ -8,7 +8,7 @@ import logging
 from app.config import settings
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
+templates = create_templates()
 logger = logging.getLogger(__name__)
 
 api_key_service = ApiKeyService(supabase)
@@ -85,8 +85,15 @@ async def generate_key(request: Request, current_user = Depends(get_current_user
         api_key = await generate_api_key_for_user(current_user.id)
         logger.info(f"Successfully generated API key for user {current_user.id}")
         
-        # Return the user to a 'key created' page or redirect
-        return RedirectResponse(url="/api-keys?message=Key+Created", status_code=303)
+        # Only the key's hash is stored, so this page is the one chance to copy it
+        return templates.TemplateResponse(
+            "api_key_created.html",
+            {
+                "request": request,
+                "key": api_key["key"],
+                "name": api_key.get("name") or "Webhook key"
+            }
+        )
     except Exception as e:
         logger.error(f"Error generating API key: {str(e)}")
         return RedirectResponse(url="/api-keys?message=Error+generating+API+key&error=true", status_code=303) 
\ No newline at end of file
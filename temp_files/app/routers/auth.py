@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Request, Form, HTTPException, Response, Depends
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from app.templating import create_templates
 from app.auth.supabase_auth import register_user, login_user, logout_user, supabase
 from app.config import settings
 import logging
@@ -9,7 +9,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
+templates = create_templates()
 
 @router.get("/register", response_class=HTMLResponse)
 async def register_page(request: Request):
@@ -1,134 +1,122 @@
 from fastapi import APIRouter, Request, HTTPException, Depends, Form, Query, Header
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from app.templating import create_templates
 from app.auth.notion_oauth import notion_oauth
 from app.auth.airtable_oauth import airtable_oauth
 from app.auth.supabase_auth import supabase
-from app.auth.auth_utils import get_current_user
+from app.auth.auth_utils import get_current_user, reveal_api_key, NEW_API_KEY_COOKIE
+from app.auth.public_routes import public
 from app.middleware.auth_middleware import get_current_user_id
-from app.services.notion_service import NotionService
 import secrets
+import asyncio
 from app.auth.facebook_oauth import facebook_oauth
 import logging
 import jwt
 from app.config import get_settings
 import string
 from datetime import datetime
-import httpx
+from app.http_client import get_http_client
+from app.rate_limit import rate_limiter
 from app.services.connection_service import connection_service
-from app.services.api_key_service import api_key_service, generate_api_key_for_user
+from app.services.workspace_catalog import workspace_catalog
+from app.services.api_key_service import api_key_service, generate_api_key_for_user, hash_api_key, key_prefix
+from app import db
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
+templates = create_templates()
 logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
+# service -> credentials key the connections template reads the catalog under
+PROVIDER_RESOURCES = {
+    'notion': 'databases',
+    'airtable': 'bases',
+}
+
+async def load_provider_resources(user_id: str, credentials: dict, service: str) -> None:
+    """
+    Attach a provider's databases/bases from the workspace catalog. A provider
+    whose listing isn't cached and doesn't arrive within
+    CONNECTIONS_PROVIDER_TIMEOUT is marked as loading so the page renders
+    without it and fetches the list afterwards.
+    """
+    service_credentials = credentials.get(service)
+    if not service_credentials or not service_credentials.get('access_token'):
+        return
+    
+    field = PROVIDER_RESOURCES[service]
+    try:
+        service_credentials[field] = await asyncio.wait_for(
+            workspace_catalog.get(user_id, service, service_credentials['access_token']),
+            timeout=settings.CONNECTIONS_PROVIDER_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        # The listing keeps running and lands in the catalog for the deferred fetch
+        logger.warning(f"Timed out fetching {service} {field}, deferring to the browser")
+        service_credentials['loading'] = True
+    except Exception as e:
+        logger.error(f"Error fetching {service} {field}: {str(e)}")
+
 @router.get("/", response_class=HTMLResponse)
 async def connections_page(request: Request, current_user = Depends(get_current_user)):
     # Log all cookies for debugging
     logger.debug(f"Request cookies: {request.cookies}")
     # Debug: Check if user is in request state
     logger.debug(f"User authenticated: {current_user.id}")
-    
-    # Get user's API key
-    keys = await api_key_service.list_keys(current_user.id)
-    logger.info(f"Retrieved API keys for user {current_user.id}: {keys}")
-
-    if not keys:
-        try:
-            logger.info(f"No API keys found for user {current_user.id}, generating new key")
-            await generate_api_key_for_user(current_user.id)
-            logger.info(f"Generated API key for user {current_user.id} on connections page visit")
-            # Refresh the keys after generation
-            keys = await api_key_service.list_keys(current_user.id)
-            logger.info(f"Refreshed keys after generation: {keys}")
-        except Exception as e:
-            logger.error(f"Failed to generate API key on connections page: {str(e)}")
-            logger.exception(e)  # This will log the full stack trace
-
-    # Get user connections
     user_id = current_user.id
-    connections = connection_service.get_user_connections(user_id)
-    logger.info(f"Retrieved connections data for user {user_id}")
     
-    # Get the user's API key to display in the webhook URL
-    api_key = None
+    async def load_keys():
+        keys = await api_key_service.list_keys(user_id)
+        logger.info(f"Retrieved {len(keys or [])} API keys for user {user_id}")
+        
+        new_key = None
+        if not keys:
+            try:
+                logger.info(f"No API keys found for user {user_id}, generating new key")
+                new_key = (await generate_api_key_for_user(user_id))['key']
+                logger.info(f"Generated API key for user {user_id} on connections page visit")
+                # Refresh the keys after generation
+                keys = await api_key_service.list_keys(user_id)
+            except Exception as e:
+                logger.error(f"Failed to generate API key on connections page: {str(e)}")
+                logger.exception(e)  # This will log the full stack trace
+        return keys, new_key
+        
+    async def load_connections():
+        connections = await connection_service.get_user_connections(user_id)
+        logger.info(f"Retrieved connections data for user {user_id}")
+        
+        # Provider lists are fetched side by side, so the slowest one sets the page latency
+        credentials = connections.get('credentials', {}) if isinstance(connections, dict) else {}
+        await asyncio.gather(*(
+            load_provider_resources(user_id, credentials, service) for service in PROVIDER_RESOURCES
+        ))
+        return connections
+        
+    (keys, api_key), connections = await asyncio.gather(load_keys(), load_connections())
+    
+    # Keys are stored hashed, so the full key is only shown right after it was generated
+    revealed_key = request.cookies.get(NEW_API_KEY_COOKIE)
+    if not api_key and revealed_key and keys:
+        if any(key.get('key_hash') == hash_api_key(revealed_key) for key in keys):
+            api_key = revealed_key
+            
+    # Otherwise identify the user's key by its prefix
+    api_key_prefix = None
     if keys:
         # Use the first key from the list (assuming we only need one)
-        api_key = keys[0]['key']
-        logger.info(f"Using API key (first 4 chars: {api_key[:4]}...)")
+        first_key = keys[0]
+        api_key_prefix = first_key.get('key_prefix') or (first_key.get('key') and key_prefix(first_key['key']))
     else:
         logger.error("No API keys found in keys list")
-    
+        
     # Ensure connections has the right structure
     if not isinstance(connections, dict):
-        connections = {'credentials': {}, 'api_key': api_key}
+        connections = {'credentials': {}}
     elif 'credentials' not in connections:
-        connections = {'credentials': connections, 'api_key': api_key}
-    else:
-        # Keep the existing structure but ensure API key is set
-        connections['api_key'] = api_key
-    
-    # Fetch Notion databases if connected
-    notion_credentials = connections.get('credentials', {}).get('notion', {})
-    if notion_credentials and notion_credentials.get('access_token'):
-        try:
-            notion_service = NotionService(token=notion_credentials['access_token'])
-            databases = notion_service.client.search(
-                filter={
-                    "property": "object",
-                    "value": "database"
-                }
-            )
-            
-            # Extract relevant database information
-            database_list = []
-            for db in databases.get('results', []):
-                database_list.append({
-                    'id': db.get('id'),
-                    'title': db.get('title', [{}])[0].get('plain_text', 'Untitled'),
-                    'url': db.get('url'),
-                    'icon': db.get('icon', {}).get('emoji') if db.get('icon', {}).get('type') == 'emoji' else db.get('icon', {}).get('external', {}).get('url')
-                })
-            notion_credentials['databases'] = database_list
-            logger.info(f"Found {len(database_list)} Notion databases")
-        except Exception as e:
-            logger.error(f"Error fetching Notion databases: {str(e)}")
-    
-    # Fetch Airtable bases if connected
-    airtable_credentials = connections.get('credentials', {}).get('airtable', {})
-    if airtable_credentials and airtable_credentials.get('access_token'):
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    "https://api.airtable.com/v0/meta/bases",
-                    headers={
-                        "Authorization": f"Bearer {airtable_credentials['access_token']}",
-                        "Content-Type": "application/json"
-                    }
-                )
-                if response.status_code == 200:
-                    bases_data = response.json()
-                    base_list = []
-                    # Default database icon SVG
-                    default_icon = '''<svg class="w-4 h-4 text-gray-600" xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke="currentColor">
-                        <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M4 7v10c0 2.21 3.582 4 8 4s8-1.79 8-4V7M4 7c0 2.21 3.582 4 8 4s8-1.79 8-4M4 7c0-2.21 3.582-4 8-4s8 1.79 8 4m0 5c0 2.21-3.582 4-8 4s-8-1.79-8-4" />
-                    </svg>'''
-                    for base in bases_data.get('bases', []):
-                        base_list.append({
-                            'id': base.get('id'),
-                            'name': base.get('name'),
-                            'url': f"https://airtable.com/{base.get('id')}",
-                            'icon': base.get('icon', {}).get('url') or default_icon
-                        })
-                    airtable_credentials['bases'] = base_list
-                    logger.info(f"Found {len(base_list)} Airtable bases")
-                else:
-                    logger.error(f"Error fetching Airtable bases: {response.text}")
-        except Exception as e:
-            logger.error(f"Error fetching Airtable bases: {str(e)}")
-    
+        connections = {'credentials': connections}
+        
     # Final connections data structure
     logger.info(f"Final connections data structure ready (keys: {list(connections.keys()) if isinstance(connections, dict) else 'not a dict'})")
     logger.info(f"Connected services: {list(connections.get('credentials', {}).keys())}")
@@ -138,19 +126,39 @@ async def connections_page(request: Request, current_user = Depends(get_current_
         "request": request,
         "connections": connections,
         "api_key": api_key,
+        "api_key_prefix": api_key_prefix,
         "settings": settings,
         "is_authenticated": True,
         "current_user": current_user
     }
     logger.info(f"Template context keys: {context.keys()}")
-    logger.info(f"API key in context: {'present' if api_key else 'missing'}")
-    if api_key:
-        logger.info(f"API key first 4 chars: {api_key[:4]}...")
+    logger.info(f"API key in context: {'revealed' if api_key else api_key_prefix and 'prefix only' or 'missing'}")
     
-    return templates.TemplateResponse(
+    response = templates.TemplateResponse(
         "connections.html",
         context
     )
+    if revealed_key:
+        response.delete_cookie(NEW_API_KEY_COOKIE, path="/connections")
+    return response
+
+@router.get("/{service}/resources")
+async def provider_resources(service: str, current_user = Depends(get_current_user)):
+    """Databases/bases for a provider the connections page deferred"""
+    if service not in PROVIDER_RESOURCES:
+        raise HTTPException(status_code=404, detail=f"Unknown service: {service}")
+        
+    connections = await connection_service.get_user_connections(current_user.id)
+    service_credentials = connections.get('credentials', {}).get(service)
+    if not service_credentials or not service_credentials.get('access_token'):
+        return JSONResponse(status_code=404, content={"error": f"{service} is not connected"})
+        
+    field = PROVIDER_RESOURCES[service]
+    try:
+        return {field: await workspace_catalog.get(current_user.id, service, service_credentials['access_token'])}
+    except Exception as e:
+        logger.error(f"Error fetching {service} {field}: {str(e)}")
+        return JSONResponse(status_code=502, content={"error": f"Could not load {service} {field}"})
 
 @router.get("/notion/connect")
 async def notion_connect(request: Request, current_user = Depends(get_current_user)):
@@ -192,11 +200,14 @@ async def notion_disconnect(request: Request, current_user = Depends(get_current
     try:
         # Delete the credentials
         logger.info(f"Deleting Notion credentials for user {current_user.id}")
-        result = supabase.table('service_credentials')\
-            .delete()\
-            .eq('user_id', current_user.id)\
-            .eq('service_name', 'notion')\
-            .execute()
+        result = await db.execute(
+            supabase.table('service_credentials')
+            .delete()
+            .eq('user_id', current_user.id)
+            .eq('service_name', 'notion')
+        )
+        connection_service.invalidate_user(current_user.id)
+        workspace_catalog.invalidate(current_user.id, 'notion')
         
         logger.info(f"Deletion result: {result}")
         
@@ -262,11 +273,12 @@ async def facebook_disconnect(request: Request, current_user = Depends(get_curre
     """Disconnect Facebook integration"""
     try:
         # Get the current access token
-        credentials_response = supabase.table('service_credentials')\
-            .select("access_token")\
-            .eq('user_id', current_user.id)\
-            .eq('service_name', 'facebook')\
-            .execute()
+        credentials_response = await db.execute(
+            supabase.table('service_credentials')
+            .select("access_token")
+            .eq('user_id', current_user.id)
+            .eq('service_name', 'facebook')
+        )
         
         if credentials_response.data:
             access_token = credentials_response.data[0]['access_token']
@@ -274,22 +286,24 @@ async def facebook_disconnect(request: Request, current_user = Depends(get_curre
             # Revoke the token on Facebook's side
             try:
                 revoke_url = f"https://graph.facebook.com/v21.0/me/permissions"
-                async with httpx.AsyncClient() as client:
-                    await client.delete(
-                        revoke_url,
-                        params={"access_token": access_token}
-                    )
+                client = get_http_client()
+                await rate_limiter.call("facebook", access_token, lambda: client.delete(
+                    revoke_url,
+                    params={"access_token": access_token}
+                ))
                 logger.info(f"Successfully revoked Facebook permissions for user {current_user.id}")
             except Exception as e:
                 logger.error(f"Error revoking Facebook permissions: {str(e)}")
                 # Continue with deletion even if revocation fails
         
         # Delete the credentials from your database
-        supabase.table('service_credentials')\
-            .delete()\
-            .eq('user_id', current_user.id)\
-            .eq('service_name', 'facebook')\
-            .execute()
+        await db.execute(
+            supabase.table('service_credentials')
+            .delete()
+            .eq('user_id', current_user.id)
+            .eq('service_name', 'facebook')
+        )
+        connection_service.invalidate_user(current_user.id)
         
         return RedirectResponse(
             url="/connections/?message=Successfully disconnected Facebook&success=true",
@@ -306,11 +320,14 @@ async def facebook_disconnect(request: Request, current_user = Depends(get_curre
 async def disconnect_service(service: str, current_user = Depends(get_current_user)):
     try:
         # Delete the service credentials
-        supabase.table('service_credentials')\
-            .delete()\
-            .eq('user_id', current_user.id)\
-            .eq('service_name', service)\
-            .execute()
+        await db.execute(
+            supabase.table('service_credentials')
+            .delete()
+            .eq('user_id', current_user.id)
+            .eq('service_name', service)
+        )
+        connection_service.invalidate_user(current_user.id)
+        workspace_catalog.invalidate(current_user.id, service)
         
         return RedirectResponse(
             url=f"/connections?message={service.capitalize()} disconnected successfully",
@@ -330,11 +347,13 @@ async def simple_generate_api_key(request: Request, current_user = Depends(get_c
         user_id = current_user.id
         
         # Generate the key
-        await generate_api_key_for_user(user_id)
+        key_data = await generate_api_key_for_user(user_id)
         logger.info(f"Generated API key for user {user_id}")
         
-        # Redirect back to the connections page
-        return RedirectResponse(url="/connections/?message=API+key+generated+successfully", status_code=303)
+        # Redirect back to the connections page, which shows the new key once
+        response = RedirectResponse(url="/connections/?message=API+key+generated+successfully", status_code=303)
+        reveal_api_key(response, key_data['key'])
+        return response
     except Exception as e:
         logger.error(f"Error generating API key: {str(e)}")
         return templates.TemplateResponse(
@@ -406,6 +425,7 @@ async def airtable_connect(request: Request, current_user = Depends(get_current_
         return RedirectResponse(url="/connections?message=Error connecting to Airtable&error=true", status_code=303)
 
 @router.get("/airtable/callback")
+@public
 async def airtable_callback(request: Request, code: str = None, state: str = None, error: str = None, error_description: str = None):
     """Handle Airtable OAuth callback"""
     logger.info(f"Airtable callback received: code={code is not None}, state={state}, error={error}")
@@ -472,11 +492,12 @@ async def airtable_disconnect(request: Request, current_user = Depends(get_curre
         logger.info(f"Attempting to disconnect Airtable for user {user_id}")
         
         # First verify if credentials exist
-        check = supabase.table('service_credentials')\
-            .select("*")\
-            .eq('user_id', user_id)\
-            .eq('service_name', 'airtable')\
-            .execute()
+        check = await db.execute(
+            supabase.table('service_credentials')
+            .select("*")
+            .eq('user_id', user_id)
+            .eq('service_name', 'airtable')
+        )
             
         if not check.data:
             logger.info(f"No Airtable credentials found for user {user_id}")
@@ -485,24 +506,28 @@ async def airtable_disconnect(request: Request, current_user = Depends(get_curre
         logger.info(f"Found Airtable credentials for user {user_id}: {check.data}")
         
         # Instead of deleting, update the record to null the tokens
-        update_result = supabase.table('service_credentials')\
+        update_result = await db.execute(
+            supabase.table('service_credentials')
             .update({
                 'access_token': None,
                 'refresh_token': None,
                 'updated_at': datetime.now().isoformat()
-            })\
-            .eq('user_id', user_id)\
-            .eq('service_name', 'airtable')\
-            .execute()
+            })
+            .eq('user_id', user_id)
+            .eq('service_name', 'airtable')
+        )
+        connection_service.invalidate_user(user_id)
+        workspace_catalog.invalidate(user_id, 'airtable')
             
         logger.info(f"Update result: {update_result}")
         
         # Verify update
-        verify = supabase.table('service_credentials')\
-            .select("*")\
-            .eq('user_id', user_id)\
-            .eq('service_name', 'airtable')\
-            .execute()
+        verify = await db.execute(
+            supabase.table('service_credentials')
+            .select("*")
+            .eq('user_id', user_id)
+            .eq('service_name', 'airtable')
+        )
             
         if verify.data and verify.data[0].get('access_token'):
             logger.error(f"Failed to nullify Airtable credentials for user {user_id}")
@@ -548,15 +573,15 @@ async def exchange_for_long_lived_token(short_lived_token, app_id, app_secret):
             "fb_exchange_token": short_lived_token
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(exchange_url, params=params)
-            response.raise_for_status()
-            data = response.json()
+        client = get_http_client()
+        response = await client.get(exchange_url, params=params)
+        response.raise_for_status()
+        data = response.json()
             
-            if "access_token" not in data:
-                raise ValueError("No long-lived token in response")
+        if "access_token" not in data:
+            raise ValueError("No long-lived token in response")
                 
-            return data["access_token"]
+        return data["access_token"]
     except Exception as e:
         logger.error(f"Error exchanging for long-lived token: {str(e)}")
         raise
@@ -570,10 +595,10 @@ async def get_facebook_user_info(access_token):
             "fields": "id,name,email"
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(user_info_url, params=params)
-            response.raise_for_status()
-            return response.json()
+        client = get_http_client()
+        response = await rate_limiter.call("facebook", access_token, lambda: client.get(user_info_url, params=params))
+        response.raise_for_status()
+        return response.json()
     except Exception as e:
         logger.error(f"Error getting Facebook user info: {str(e)}")
         raise
@@ -595,10 +620,12 @@ async def regenerate_api_key(request: Request, current_user = Depends(get_curren
             logger.info(f"Deleted {len(keys)} existing API keys for user {current_user.id}")
         
         # Generate a new key
-        await generate_api_key_for_user(current_user.id)
+        key_data = await generate_api_key_for_user(current_user.id)
         logger.info(f"Regenerated API key for user {current_user.id}")
         
-        return RedirectResponse(url="/connections?message=API key regenerated successfully", status_code=303)
+        response = RedirectResponse(url="/connections?message=API key regenerated successfully", status_code=303)
+        reveal_api_key(response, key_data['key'])
+        return response
     except Exception as e:
         logger.error(f"Failed to regenerate API key: {str(e)}")
         # Check if this is an authentication error
@@ -610,7 +637,8 @@ async def regenerate_api_key(request: Request, current_user = Depends(get_curren
 async def validate_notion_token(
     request: Request,
     current_user = Depends(get_current_user),
-    api_key: str = Query(None, description="Optional API key for testing customer connections")
+    api_key: str = Query(None, description="Optional API key for testing customer connections"),
+    refresh: bool = Query(False, description="Re-list databases instead of using the cached catalog")
 ):
     """Validate Notion token and list accessible databases"""
     try:
@@ -623,7 +651,7 @@ async def validate_notion_token(
             logger.info(f"Using API key to validate Notion connection for user {user_id}")
         
         # Get user's Notion token from connections
-        connections = connection_service.get_user_connections(user_id)
+        connections = await connection_service.get_user_connections(user_id)
         notion_credentials = connections.get('credentials', {}).get('notion', {})
         token = notion_credentials.get('access_token')
         
@@ -633,27 +661,20 @@ async def validate_notion_token(
                 content={"error": "No Notion token found. Please connect to Notion first."}
             )
         
-        # Initialize Notion client
-        notion_service = NotionService(token=token)
-        
-        # Try to list databases to validate token
+        # Listing databases validates the token; repeat checks are served from the catalog
         try:
-            databases = notion_service.client.search(
-                filter={
-                    "property": "object",
-                    "value": "database"
-                }
-            )
+            databases = await workspace_catalog.get(user_id, 'notion', token, refresh=refresh)
             
             # Extract relevant database information
-            database_list = []
-            for db in databases.get('results', []):
-                database_list.append({
-                    'id': db.get('id'),
-                    'title': db.get('title', [{}])[0].get('plain_text', 'Untitled'),
-                    'url': db.get('url'),
-                    'last_edited_time': db.get('last_edited_time')
-                })
+            database_list = [
+                {
+                    'id': database['id'],
+                    'title': database['title'],
+                    'url': database['url'],
+                    'last_edited_time': database['last_edited_time']
+                }
+                for database in databases
+            ]
             
             return JSONResponse(
                 status_code=200,
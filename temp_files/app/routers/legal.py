@@ -1,12 +1,14 @@
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from app.templating import create_templates
+from app.auth.public_routes import public
 from datetime import datetime
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
+templates = create_templates()
 
 @router.get("/privacy-policy", response_class=HTMLResponse)
+@public
 async def privacy_policy(request: Request):
     """Display the privacy policy"""
     return templates.TemplateResponse(
@@ -18,6 +20,7 @@ async def privacy_policy(request: Request):
     )
 
 @router.get("/terms-of-service", response_class=HTMLResponse)
+@public
 async def terms_of_service(request: Request):
     """Display the terms of service"""
     return templates.TemplateResponse(
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Request, Depends, HTTPException, Query, status
-from fastapi.responses import JSONResponse
-from typing import Optional, Dict, Any
+from app.json_codec import FastJSONResponse, pretty
+from typing import Optional, Dict, Any, List
 # Remove the direct import of get_api_key_from_request if no longer needed elsewhere
 # from app.middleware.api_key_middleware import get_api_key_from_request
 from app.auth.supabase_auth import supabase_service
@@ -11,6 +11,12 @@ from app.services.connection_service import connection_service
 from pydantic import ValidationError
 # Import the new dependency
 from app.dependencies import verify_api_key_and_get_user, parse_field_map
+from app.auth.public_routes import public
+from app.config import get_settings
+from app.transformers import airtable as airtable_transformer, notion as notion_transformer
+from app.transformers.field_mapping import FieldMapping
+from app.webhook_body import Spec, read_webhook_json
+from app.services.webhook_capture import webhook_capture
 
 # Try to import NotionService, but provide a fallback
 try:
@@ -23,32 +29,65 @@ except ImportError as e:
     logger.warning(f"Notion service not available: {str(e)}. Notion webhooks will be logged but not processed.")
 
 import logging
-import json
-import os
-from datetime import datetime
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 def pretty_json(obj):
     """Format object as pretty JSON string"""
-    return json.dumps(obj, indent=2, sort_keys=True, default=str)
+    return pretty(obj)
 
-def save_webhook_to_file(payload: dict, prefix: str):
-    """Save webhook payload to a file for debugging"""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"logs/{prefix}_{timestamp}.json"
-    os.makedirs("logs", exist_ok=True)
-    with open(filename, "w") as f:
-        json.dump(payload, f, indent=2)
-    logger.info(f"Saved webhook payload to {filename}")
+def save_webhook_to_file(payload: Any, prefix: str, **meta: Any):
+    """Hand a webhook payload to the background capture store"""
+    webhook_capture.capture(prefix, payload, **meta)
+
+def payload_spec(transformer: Any, field_map: Optional[FieldMapping]) -> Spec:
+    """What to keep of a webhook body, or None to keep all of it"""
+    if not settings.WEBHOOK_PRUNE_PAYLOADS:
+        return None
+    return transformer.payload_spec(field_map)
+
+async def read_batch_records(request: Request, record_spec: Spec = None) -> List[Dict[str, Any]]:
+    """Read a batch webhook body: a JSON array of records, or {"records": [...]}"""
+    # A spec applies to each item of an array, so this covers both shapes
+    spec = {**record_spec, "records": record_spec} if record_spec is not None else None
+    try:
+        body = await read_webhook_json(request, settings.WEBHOOK_BATCH_MAX_BODY_BYTES, spec)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to parse batch request body: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid JSON in request body"
+        )
+        
+    records = body.get("records") if isinstance(body, dict) else body
+    if not isinstance(records, list) or not records:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Expected a non-empty JSON array of records"
+        )
+    if len(records) > settings.WEBHOOK_BATCH_MAX_RECORDS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {settings.WEBHOOK_BATCH_MAX_RECORDS} records"
+        )
+    return records
+
+def batch_response(result: Dict[str, Any]) -> FastJSONResponse:
+    """202 if anything was queued, 400 if every record was rejected"""
+    status_code = status.HTTP_202_ACCEPTED if result["queued"] else status.HTTP_400_BAD_REQUEST
+    return FastJSONResponse(status_code=status_code, content=result)
 
 @router.post("/notion")
 @router.get("/notion")
+@public
 async def notion_webhook(
     request: Request, 
     user_id: str = Depends(verify_api_key_and_get_user),
-    field_map: Optional[Dict[str, str]] = Depends(parse_field_map)
+    field_map: Optional[FieldMapping] = Depends(parse_field_map)
 ):
     """Handle webhook from Notion"""
     try:
@@ -67,15 +106,17 @@ async def notion_webhook(
         # user_id = response.data[0]["user_id"]
         
         # Get the payload from the request body (POST only)
-        payload = await request.json()
+        payload = await read_webhook_json(
+            request, settings.WEBHOOK_MAX_BODY_BYTES, payload_spec(notion_transformer, field_map)
+        )
         
         # Save to file for debugging
-        save_webhook_to_file(payload, "notion")
+        save_webhook_to_file(payload, "notion", user_id=user_id)
         
-        # Process the data using build service
-        result = await build_service.process_notion_data(payload, user_id, field_map)
+        # Validate now, insert in the background
+        result = await build_service.enqueue_notion_data(payload, user_id, field_map)
         
-        return result
+        return FastJSONResponse(status_code=status.HTTP_202_ACCEPTED, content=result)
         
     except HTTPException as e:
         # Re-raise HTTP exceptions (like 401 from the dependency)
@@ -83,26 +124,27 @@ async def notion_webhook(
     except ValueError as e:
         # Return 400 for validation errors
         logger.error(f"Validation error in Notion webhook: {str(e)}")
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=status.HTTP_400_BAD_REQUEST,
             content={"status": "error", "message": str(e)}
         )
     except Exception as e:
         # Return 500 for other errors
         logger.error(f"Error processing Notion webhook: {str(e)}")
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"status": "error", "message": "Internal server error processing webhook"}
         )
 
 @router.post("/airtable")
 @router.get("/airtable")
+@public
 async def airtable_webhook(
     request: Request,
     source_record_id: Optional[str] = Query(None, alias="source_record_id"),
     source_table_id: Optional[str] = Query(None, alias="source_table_id"),
     user_id: str = Depends(verify_api_key_and_get_user),
-    field_map: Optional[Dict[str, str]] = Depends(parse_field_map)
+    field_map: Optional[FieldMapping] = Depends(parse_field_map)
 ):
     """Handle webhook from Airtable"""
     try:
@@ -144,7 +186,7 @@ async def airtable_webhook(
             
         # Get the payload
         if request.method == "GET":
-            logger.info("GET request - fetching record from Airtable")
+            logger.info("GET request - queueing record fetch from Airtable")
             if not source_record_id:
                 logger.error("Missing source_record_id for GET request")
                 raise HTTPException(
@@ -152,35 +194,34 @@ async def airtable_webhook(
                     detail="Missing source_record_id parameter"
                 )
             
-            try:
-                record = await airtable_service.get_record(base_id, table_id, source_record_id)
-                logger.info(f"Fetched record from Airtable: {json.dumps(record, indent=2)}")
-                payload = record
-            except Exception as e:
-                logger.error(f"Failed to fetch record from Airtable: {str(e)}")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Failed to fetch record from Airtable: {str(e)}"
-                )
-        else: # POST request
-            logger.info("POST request - getting payload from body")
-            try:
-                payload = await request.json()
-            except Exception as e:
-                logger.error(f"Failed to parse request body: {str(e)}")
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Invalid JSON in request body"
-                )
+            # The record is fetched, transformed and saved by a queue worker
+            result = await build_service.enqueue_airtable_record(
+                user_id, base_id, table_id, source_record_id, field_map
+            )
+            return FastJSONResponse(status_code=status.HTTP_202_ACCEPTED, content=result)
+        
+        logger.info("POST request - getting payload from body")
+        try:
+            payload = await read_webhook_json(
+                request, settings.WEBHOOK_MAX_BODY_BYTES, payload_spec(airtable_transformer, field_map)
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to parse request body: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid JSON in request body"
+            )
         
-        save_webhook_to_file(payload, "airtable")
+        save_webhook_to_file(payload, "airtable", user_id=user_id, source_table_id=source_table_id)
         
-        logger.info("Processing data with build service")
-        result = await build_service.process_airtable_data(
+        logger.info("Validating data and queueing build")
+        result = await build_service.enqueue_airtable_data(
             payload, user_id, base_id, table_id, field_map
         )
         
-        return result
+        return FastJSONResponse(status_code=status.HTTP_202_ACCEPTED, content=result)
         
     except HTTPException as e:
         # Re-raise HTTP exceptions
@@ -188,14 +229,80 @@ async def airtable_webhook(
     except ValueError as e:
         # Return 400 for validation errors
         logger.error(f"Validation error in Airtable webhook: {str(e)}")
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=status.HTTP_400_BAD_REQUEST,
             content={"status": "error", "message": str(e)}
         )
     except Exception as e:
         # Return 500 for other errors
         logger.error(f"Error processing Airtable webhook: {str(e)}")
-        return JSONResponse(
+        return FastJSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"status": "error", "message": "Internal server error processing webhook"}
+        )
+
+@router.post("/notion/batch")
+@public
+async def notion_batch_webhook(
+    request: Request,
+    user_id: str = Depends(verify_api_key_and_get_user),
+    field_map: Optional[FieldMapping] = Depends(parse_field_map)
+):
+    """Handle a batch of Notion pages in one request"""
+    try:
+        records = await read_batch_records(request, payload_spec(notion_transformer, field_map))
+        logger.info(f"Received Notion batch of {len(records)} records from user_id: {user_id}")
+        save_webhook_to_file(records, "notion_batch", user_id=user_id)
+        
+        result = await build_service.enqueue_notion_batch(records, user_id, field_map)
+        return batch_response(result)
+        
+    except HTTPException as e:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing Notion batch webhook: {str(e)}")
+        return FastJSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"status": "error", "message": "Internal server error processing webhook"}
+        )
+
+@router.post("/airtable/batch")
+@public
+async def airtable_batch_webhook(
+    request: Request,
+    source_table_id: Optional[str] = Query(None, alias="source_table_id"),
+    user_id: str = Depends(verify_api_key_and_get_user),
+    field_map: Optional[FieldMapping] = Depends(parse_field_map)
+):
+    """Handle a batch of Airtable records in one request"""
+    try:
+        if not source_table_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Missing source_table_id parameter"
+            )
+        try:
+            base_id, table_id = source_table_id.split("_")
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid source_table_id format. Expected format: base_id_table_id"
+            )
+            
+        records = await read_batch_records(request, payload_spec(airtable_transformer, field_map))
+        logger.info(f"Received Airtable batch of {len(records)} records from user_id: {user_id}")
+        save_webhook_to_file(records, "airtable_batch", user_id=user_id, source_table_id=source_table_id)
+        
+        result = await build_service.enqueue_airtable_batch(
+            records, user_id, base_id, table_id, field_map
+        )
+        return batch_response(result)
+        
+    except HTTPException as e:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing Airtable batch webhook: {str(e)}")
+        return FastJSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"status": "error", "message": "Internal server error processing webhook"}
-        ) 
\ No newline at end of file
+        )
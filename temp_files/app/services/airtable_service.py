@@ -1,8 +1,27 @@
+import asyncio
 import logging
-from httpx import AsyncClient
-from typing import Dict, Any, Optional
+import re
+from app.config import get_settings
+from app.http_client import get_http_client
+from app.rate_limit import rate_limiter
+from typing import Dict, Any, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
+
+RECORD_ID_PATTERN = re.compile(r"^rec[A-Za-z0-9]+$")
+
+class AirtableAPIError(Exception):
+    """A non-200 response from the Airtable API"""
+    
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+        
+    @property
+    def permanent(self) -> bool:
+        """Client errors (deleted record, revoked grant) won't go away on retry; 429 will"""
+        return 400 <= self.status_code < 500 and self.status_code != 429
 
 class AirtableService:
     def __init__(self, credentials: Dict[str, Any]):
@@ -42,15 +61,149 @@ class AirtableService:
             "Content-Type": "application/json"
         }
         
-        async with AsyncClient() as client:
-            url = f"{self.base_url}/{base_id}/{table_id}/{record_id}"
-            logger.info(f"Requesting URL: {url}")
-            response = await client.get(url, headers=headers)
+        client = get_http_client()
+        url = f"{self.base_url}/{base_id}/{table_id}/{record_id}"
+        logger.info(f"Requesting URL: {url}")
+        # Airtable allows ~5 requests/second per base
+        response = await rate_limiter.call("airtable", base_id, lambda: client.get(url, headers=headers))
             
-            logger.info(f"Airtable API response status: {response.status_code}")
-            if response.status_code != 200:
-                logger.error(f"Failed to get record (status {response.status_code}): {response.text}")
-                raise Exception(f"Failed to get record: {response.text}")
+        logger.info(f"Airtable API response status: {response.status_code}")
+        if response.status_code != 200:
+            logger.error(f"Failed to get record (status {response.status_code}): {response.text}")
+            raise AirtableAPIError(f"Failed to get record: {response.text}", response.status_code)
             
-            logger.info("Successfully fetched record from Airtable API")
-            return response.json() 
\ No newline at end of file
+        logger.info("Successfully fetched record from Airtable API")
+        return response.json()
+    
+    async def list_records(self, base_id: str, table_id: str, record_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch up to 100 records of one table in a single list-records call, keyed by id"""
+        token = self._get_token()
+        formula = "OR(" + ",".join(f"RECORD_ID()='{record_id}'" for record_id in record_ids) + ")"
+        client = get_http_client()
+        url = f"{self.base_url}/{base_id}/{table_id}"
+        response = await rate_limiter.call("airtable", base_id, lambda: client.get(
+            url,
+            params={"filterByFormula": formula, "pageSize": str(len(record_ids))},
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json"
+            }
+        ))
+        
+        logger.info(f"Airtable list-records for {len(record_ids)} ids: status {response.status_code}")
+        if response.status_code != 200:
+            logger.error(f"Failed to list records (status {response.status_code}): {response.text}")
+            raise AirtableAPIError(f"Failed to get record: {response.text}", response.status_code)
+        return {record["id"]: record for record in response.json().get("records", [])}
+        
+    async def get_record_batched(self, base_id: str, table_id: str, record_id: str) -> Dict[str, Any]:
+        """get_record, coalesced with concurrent fetches from the same table"""
+        return await record_batcher.get(self, base_id, table_id, record_id)
+
+class AirtableRecordBatcher:
+    """
+    Collects single-record fetches per (token, base, table) for a short window
+    and resolves them with one list-records call filtered on RECORD_ID().
+    """
+    
+    def __init__(self, window: float = 0.01, max_batch: int = 100):
+        self.window = window
+        self.max_batch = max_batch
+        # (token, base_id, table_id) -> (service, {record_id: [futures]})
+        self._pending: Dict[Tuple[str, str, str], Tuple[AirtableService, Dict[str, List[asyncio.Future]]]] = {}
+        self._tasks: set = set()
+        self._counters = {"records": 0, "list_calls": 0, "single_calls": 0, "max_batch": 0}
+        
+    async def get(self, service: AirtableService, base_id: str, table_id: str, record_id: str) -> Dict[str, Any]:
+        self._counters["records"] += 1
+        if self.window <= 0 or not RECORD_ID_PATTERN.match(record_id):
+            # Anything that isn't a plain record id stays out of the formula
+            self._counters["single_calls"] += 1
+            return await service.get_record(base_id, table_id, record_id)
+            
+        loop = asyncio.get_running_loop()
+        key = (service._get_token(), base_id, table_id)
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = self._pending[key] = (service, {})
+            loop.call_later(self.window, self._flush, key, entry)
+            
+        future = loop.create_future()
+        entry[1].setdefault(record_id, []).append(future)
+        if len(entry[1]) >= self.max_batch:
+            self._flush(key, entry)
+        return await future
+        
+    def _flush(self, key: Tuple[str, str, str], entry) -> None:
+        # The timer of a batch that already filled up finds a newer entry (or none)
+        if self._pending.get(key) is not entry:
+            return
+        del self._pending[key]
+        task = asyncio.ensure_future(self._fetch(key[1], key[2], *entry))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        
+    async def _fetch(
+        self,
+        base_id: str,
+        table_id: str,
+        service: AirtableService,
+        waiters: Dict[str, List[asyncio.Future]]
+    ) -> None:
+        record_ids = list(waiters)
+        self._counters["max_batch"] = max(self._counters["max_batch"], len(record_ids))
+        try:
+            if len(record_ids) == 1:
+                self._counters["single_calls"] += 1
+                records = {record_ids[0]: await service.get_record(base_id, table_id, record_ids[0])}
+            else:
+                self._counters["list_calls"] += 1
+                records = await service.list_records(base_id, table_id, record_ids)
+        except Exception as e:
+            for futures in waiters.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+            
+        for record_id, futures in waiters.items():
+            record = records.get(record_id)
+            if record is None:
+                # Deleted or inaccessible; a direct fetch reports it the usual way
+                self._resolve_single(service, base_id, table_id, record_id, futures)
+                continue
+            for future in futures:
+                if not future.done():
+                    future.set_result(record)
+                    
+    def _resolve_single(self, service, base_id, table_id, record_id, futures) -> None:
+        async def fetch():
+            self._counters["single_calls"] += 1
+            try:
+                record = await service.get_record(base_id, table_id, record_id)
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            for future in futures:
+                if not future.done():
+                    future.set_result(record)
+                    
+        task = asyncio.ensure_future(fetch())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        
+    def stats(self) -> Dict[str, Any]:
+        """Batching counters: records requested vs Airtable calls made"""
+        calls = self._counters["list_calls"] + self._counters["single_calls"]
+        return {
+            **self._counters,
+            "pending_batches": len(self._pending),
+            "records_per_call": round(self._counters["records"] / calls, 2) if calls else 0.0,
+        }
+
+record_batcher = AirtableRecordBatcher(
+    window=settings.AIRTABLE_BATCH_WINDOW,
+    max_batch=settings.AIRTABLE_BATCH_MAX_RECORDS
+)
@@ -1,17 +1,46 @@
 from typing import Dict, Any, Optional, Union, Tuple
+import hashlib
+import hmac
 import secrets
-import string
 from datetime import datetime
 import logging
 from supabase import Client
 from app.auth.supabase_auth import supabase
 from app.config import get_settings
 from supabase import create_client
+from app.cache import TTLCache, SingleFlight, MISSING
+from app.services.connection_service import connection_service
+from app.services.api_key_usage import ApiKeyUsageTracker
+from app import db
 import os
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# Keys are stored as an indexed key_prefix (their first characters) plus an
+# HMAC-SHA256 key_hash; the full key is only ever shown when it's generated
+KEY_PREFIX_LENGTH = 12
+
+_hash_secret = settings.API_KEY_HASH_SECRET.encode()
+if not _hash_secret:
+    logger.warning("API_KEY_HASH_SECRET is not set, API keys are hashed without a secret")
+
+# Maps key prefix -> ((key_hash, user_id), ...) of the hashed keys sharing it, and
+# ("invalid", key_hash) -> True for keys that matched nothing; raw keys never enter the cache
+api_key_cache = TTLCache(
+    maxsize=settings.API_KEY_CACHE_MAXSIZE,
+    ttl=settings.API_KEY_CACHE_TTL
+)
+api_key_flight = SingleFlight()
+
+def key_prefix(api_key: str) -> str:
+    """The indexed lookup part of an API key"""
+    return api_key[:KEY_PREFIX_LENGTH]
+
+def hash_api_key(api_key: str) -> str:
+    """Keyed hash stored in place of the raw API key"""
+    return hmac.new(_hash_secret, api_key.encode(), hashlib.sha256).hexdigest()
+
 # Create a separate admin client for API key operations
 try:
     # Require both URL and service key
@@ -30,6 +59,13 @@ except Exception as e:
     logger.error(f"Failed to initialize Supabase admin client: {str(e)}")
     raise
 
+# last_used_at and call counts, written to api_keys in bulk off the request path
+api_key_usage = ApiKeyUsageTracker(
+    supabase_admin,
+    flush_interval=settings.API_KEY_USAGE_FLUSH_INTERVAL,
+    max_pending=settings.API_KEY_USAGE_MAX_PENDING
+)
+
 class ApiKeyService:
     def __init__(self, supabase_client=None):
         # Only use the admin client - no fallbacks
@@ -39,20 +75,32 @@ class ApiKeyService:
         self.logger = logging.getLogger(__name__)
     
     async def generate_key(self, user_id: str):
-        """Generate a new API key for a user"""
+        """
+        Generate a new API key for a user. The returned row carries the raw
+        key under "key"; it isn't stored, so this is the only chance to show it.
+        """
         try:
             # Generate a random API key
             key = self._generate_random_key()
+            prefix = key_prefix(key)
+            
+            key_hash = hash_api_key(key)
             
             # Insert the key into the database using admin client
-            response = self.client.table('api_keys').insert({
+            response = await db.execute(self.client.table('api_keys').insert({
                 "user_id": user_id,
-                "key": key,
+                "key_prefix": prefix,
+                "key_hash": key_hash,
                 "created_at": datetime.now().isoformat()
-            }).execute()
+            }))
+            
+            # Drop any cached entries for this prefix or key so the key resolves immediately
+            api_key_cache.invalidate(prefix)
+            api_key_cache.invalidate(("invalid", key_hash))
+            connection_service.invalidate_user(user_id)
             
             self.logger.info(f"Generated API key for user {user_id}")
-            return response.data[0] if response.data else None
+            return {**response.data[0], "key": key} if response.data else None
         except Exception as e:
             self.logger.error(f"Error generating API key: {str(e)}")
             raise
@@ -60,7 +108,7 @@ class ApiKeyService:
     async def list_keys(self, user_id: str):
         """List all API keys for a user"""
         try:
-            response = self.client.table('api_keys').select("*").eq('user_id', user_id).execute()
+            response = await db.execute(self.client.table('api_keys').select("*").eq('user_id', user_id))
             return response.data
         except Exception as e:
             self.logger.error(f"Error listing API keys: {str(e)}")
@@ -69,16 +117,98 @@ class ApiKeyService:
     async def delete_key(self, key_id: str):
         """Delete an API key"""
         try:
-            response = self.client.table('api_keys').delete().eq('id', key_id).execute()
+            response = await db.execute(self.client.table('api_keys').delete().eq('id', key_id))
+            
+            # Deleted rows are returned, so evict their keys from the cache
+            for row in response.data or []:
+                prefix = row.get('key_prefix') or (row.get('key') and key_prefix(row['key']))
+                if prefix:
+                    api_key_cache.invalidate(prefix)
+                connection_service.invalidate_user(row.get('user_id'))
             return True
         except Exception as e:
             self.logger.error(f"Error deleting API key: {str(e)}")
             raise
     
+    async def get_user_id_for_key(self, api_key: str) -> Optional[str]:
+        """
+        Resolve an API key to its user_id with one indexed prefix lookup (served
+        from the in-process cache when warm) and a constant-time hash compare,
+        and record the use. Returns None if the key does not exist.
+        """
+        key_hash = hash_api_key(api_key)
+        # Only the exact key is remembered as invalid, never its prefix: a typo must not
+        # shadow a legacy plaintext key that shares the prefix
+        if api_key_cache.get(("invalid", key_hash)) is not MISSING:
+            return None
+        
+        prefix = key_prefix(api_key)
+        candidates = api_key_cache.get(prefix)
+        if candidates is MISSING:
+            # Concurrent webhooks with the same cold prefix share one query
+            candidates = await api_key_flight.do(prefix, lambda: self._fetch_candidates(prefix))
+        
+        user_id = None
+        for candidate_hash, candidate_user_id in candidates:
+            if hmac.compare_digest(candidate_hash, key_hash):
+                user_id = candidate_user_id
+        
+        if not user_id:
+            # Keys created before hashing are moved over the first time they're used;
+            # the flight is per key, since each caller may hold a different raw key
+            user_id = await api_key_flight.do(
+                ("plaintext", key_hash), lambda: self._migrate_plaintext_key(api_key)
+            )
+        
+        if not user_id:
+            api_key_cache.set(("invalid", key_hash), True, ttl=settings.API_KEY_CACHE_NEGATIVE_TTL)
+            return None
+        
+        api_key_usage.record(key_hash)
+        return user_id
+    
+    async def _fetch_candidates(self, prefix: str) -> Tuple[Tuple[str, str], ...]:
+        """Look the hashed keys sharing a prefix up in the database and cache them"""
+        response = await db.execute(
+            self.client.table('api_keys')
+            .select("user_id, key_hash")
+            .eq('key_prefix', prefix)
+        )
+        candidates = tuple((row['key_hash'], row['user_id']) for row in response.data if row.get('key_hash'))
+        
+        # An empty prefix is only cached briefly, in case a key is created under it
+        ttl = None if candidates else settings.API_KEY_CACHE_NEGATIVE_TTL
+        api_key_cache.set(prefix, candidates, ttl=ttl)
+        return candidates
+    
+    async def _migrate_plaintext_key(self, api_key: str) -> Optional[str]:
+        """Replace a legacy plaintext key with its prefix and hash; returns its user_id"""
+        response = await db.execute(
+            self.client.table('api_keys')
+            .select("id, user_id")
+            .eq('key', api_key)
+            .limit(1)
+        )
+        if not response.data:
+            return None
+        
+        row = response.data[0]
+        key_hash = hash_api_key(api_key)
+        await db.execute(
+            self.client.table('api_keys')
+            .update({"key_prefix": key_prefix(api_key), "key_hash": key_hash, "key": None})
+            .eq('id', row['id'])
+        )
+        # The prefix's cached candidates predate this key's hash
+        api_key_cache.invalidate(key_prefix(api_key))
+        connection_service.invalidate_user(row['user_id'])
+        self.logger.info(f"Moved API key {row['id']} to hashed storage")
+        return row['user_id']
+    
     def _generate_random_key(self, length=32):
-        """Generate a random API key string"""
-        alphabet = string.ascii_letters + string.digits
-        return ''.join(secrets.choice(alphabet) for _ in range(length))
+        """Generate a random, URL-safe API key string"""
+        # token_urlsafe yields ~1.3 characters per byte
+        return secrets.token_urlsafe(length)[:length]
     
     async def validate_api_key(self, api_key: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
         """
@@ -95,27 +225,18 @@ class ApiKeyService:
         try:
             self.logger.info(f"Validating API key: {api_key[:8]}...")
             
-            response = self.client.table('api_keys')\
-                .select("user_id")\
-                .eq('key', api_key)\
-                .execute()
+            user_id = await self.get_user_id_for_key(api_key)
             
-            if not response.data:
+            if not user_id:
                 self.logger.error(f"No matching API key found in database")
                 return None, {
                     "status_code": 401,
                     "content": {"error": "Invalid API key"}
                 }
             
-            user_id = response.data[0]['user_id']
+            # last_used_at is recorded by get_user_id_for_key and flushed in bulk
             self.logger.info(f"API key validated successfully for user_id: {user_id}")
             
-            # Update last_used_at
-            self.client.table('api_keys')\
-                .update({"last_used_at": datetime.now().isoformat()})\
-                .eq('key', api_key)\
-                .execute()
-            
             return user_id, None
             
         except Exception as e:
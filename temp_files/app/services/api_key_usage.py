@@ -0,0 +1,143 @@
+"""Batched last_used_at / usage_count tracking for API keys.
+
+Validating a key only records the use in memory (last-used time and a call
+count per key hash). A background task flushes everything recorded since the
+last flush to Supabase every API_KEY_USAGE_FLUSH_INTERVAL seconds, and once
+more on shutdown, in a single call to the record_api_key_usage() database
+function (migrations/002_hashed_api_keys.sql). Until that migration is applied
+(PostgREST answers PGRST202) the flush falls back to one last_used_at update per
+key used in the interval, and tries the function again every
+FUNCTION_RETRY_INTERVAL seconds. Any other error leaves the usage pending for
+the next flush.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+USAGE_FUNCTION = "record_api_key_usage"
+
+# PostgREST's "function not found" error code
+FUNCTION_NOT_FOUND = "PGRST202"
+
+# Seconds before a missing usage function is looked for again
+FUNCTION_RETRY_INTERVAL = 3600.0
+
+class ApiKeyUsageTracker:
+    """Accumulates API key usage in memory and writes it out in bulk"""
+
+    def __init__(self, client: Any, flush_interval: float = 30.0, max_pending: int = 10000):
+        self.client = client
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # key hash -> {"last_used_at": iso timestamp, "calls": n}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._use_function = True
+        self._function_retry_at = 0.0
+        self._counters = {"recorded": 0, "flushes": 0, "rows_written": 0, "flush_errors": 0}
+
+    def record(self, key_hash: str) -> None:
+        """Note one use of a key; never touches the database"""
+        usage = self._pending.get(key_hash)
+        if usage is None:
+            usage = self._pending[key_hash] = {"last_used_at": None, "calls": 0}
+        usage["last_used_at"] = datetime.now().isoformat()
+        usage["calls"] += 1
+        self._counters["recorded"] += 1
+        # Don't let a flood of distinct keys grow the buffer until the next tick
+        if len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """Write out everything recorded so far and return the number of keys written"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+            rows = [{"key_hash": key_hash, **usage} for key_hash, usage in pending.items()]
+            try:
+                await self._write(rows)
+            except Exception as e:
+                self._counters["flush_errors"] += 1
+                logger.error(f"Error flushing API key usage for {len(rows)} keys: {str(e)}")
+                self._restore(pending)
+                return 0
+            self._counters["flushes"] += 1
+            self._counters["rows_written"] += len(rows)
+            return len(rows)
+
+    async def _write(self, rows: List[Dict[str, Any]]) -> None:
+        if not self._use_function and time.monotonic() >= self._function_retry_at:
+            # The migration may have been applied since
+            self._use_function = True
+        if self._use_function:
+            try:
+                await db.execute(self.client.rpc(USAGE_FUNCTION, {"usage": rows}))
+                return
+            except Exception as e:
+                # Anything but a missing function (e.g. a statement timeout) is retried as is
+                if getattr(e, "code", None) != FUNCTION_NOT_FOUND:
+                    raise
+                logger.warning(f"{USAGE_FUNCTION}() not found, falling back to per-key last_used_at updates")
+                self._use_function = False
+                self._function_retry_at = time.monotonic() + FUNCTION_RETRY_INTERVAL
+        for row in rows:
+            await db.execute(
+                self.client.table('api_keys')
+                .update({"last_used_at": row["last_used_at"]})
+                .eq('key_hash', row["key_hash"])
+            )
+
+    def _restore(self, pending: Dict[str, Dict[str, Any]]) -> None:
+        """Merge usage from a failed flush back in so the next one retries it"""
+        for key_hash, usage in pending.items():
+            current = self._pending.get(key_hash)
+            if current is None:
+                self._pending[key_hash] = usage
+            else:
+                current["calls"] += usage["calls"]
+                current["last_used_at"] = max(current["last_used_at"], usage["last_used_at"])
+
+    async def start(self) -> None:
+        """Start the periodic flusher (called from the FastAPI lifespan hook)"""
+        if self._task is None and self.flush_interval > 0:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="api-key-usage-flusher")
+
+    async def stop(self) -> None:
+        """Stop the flusher and write out whatever is still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """Usage buffer counters for monitoring"""
+        return {
+            "pending_keys": len(self._pending),
+            "flush_interval": self.flush_interval,
+            "flusher_running": self._task is not None and not self._task.done(),
+            "bulk_function": self._use_function,
+            **self._counters,
+        }
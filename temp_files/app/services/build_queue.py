@@ -0,0 +1,386 @@
+"""Durable job queue for builds.
+
+Webhooks enqueue a job and return immediately; a pool of workers drains the
+queue with bounded concurrency, retrying failed jobs with exponential backoff
+and jitter. Storage is pluggable: SQLite (survives restarts, the default) or
+in-memory.
+
+The SQLite file can be shared by several worker processes. A job is claimed
+in a single UPDATE ... RETURNING under BEGIN IMMEDIATE, so only one process
+gets it, and the claim is a lease: a job still marked running after
+BUILD_QUEUE_VISIBILITY_TIMEOUT seconds is assumed to belong to a dead worker
+and handed out again. Handlers must therefore tolerate running twice (the
+build inserts upsert on build_id).
+"""
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from app.json_codec import dumps_str, loads
+
+logger = logging.getLogger(__name__)
+
+class BuildJob(BaseModel):
+    """A unit of queued build work"""
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    kind: str
+    payload: Dict[str, Any]
+    attempts: int = 0
+    available_at: float = Field(default_factory=time.time)
+    last_error: Optional[str] = None
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying the job cannot succeed"""
+
+class QueueBackend:
+    """Storage interface for build jobs. Methods are blocking and thread-safe."""
+
+    def put(self, job: BuildJob) -> None:
+        raise NotImplementedError
+
+    def claim(self, now: float) -> Optional[BuildJob]:
+        """Mark the next available job as running and return it"""
+        raise NotImplementedError
+
+    def complete(self, job_id: str) -> None:
+        raise NotImplementedError
+
+    def retry(self, job: BuildJob) -> None:
+        """Put a claimed job back with its updated attempts and available_at"""
+        raise NotImplementedError
+
+    def fail(self, job: BuildJob) -> None:
+        """Park a job that exhausted its retries"""
+        raise NotImplementedError
+
+    def release(self, job_id: str) -> None:
+        """Make a claimed job available again straight away, e.g. after its worker was cancelled"""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+class MemoryQueueBackend(QueueBackend):
+    """Process-local backend; jobs are lost on restart"""
+
+    def __init__(self):
+        self._pending: Dict[str, BuildJob] = {}
+        self._running: Dict[str, BuildJob] = {}
+        self._failed: Dict[str, BuildJob] = {}
+        self._lock = threading.Lock()
+
+    def put(self, job: BuildJob) -> None:
+        with self._lock:
+            self._pending[job.id] = job
+
+    def claim(self, now: float) -> Optional[BuildJob]:
+        with self._lock:
+            ready = [job for job in self._pending.values() if job.available_at <= now]
+            if not ready:
+                return None
+            job = min(ready, key=lambda j: j.available_at)
+            del self._pending[job.id]
+            self._running[job.id] = job
+            return job
+
+    def complete(self, job_id: str) -> None:
+        with self._lock:
+            self._running.pop(job_id, None)
+
+    def retry(self, job: BuildJob) -> None:
+        with self._lock:
+            self._running.pop(job.id, None)
+            self._pending[job.id] = job
+
+    def fail(self, job: BuildJob) -> None:
+        with self._lock:
+            self._running.pop(job.id, None)
+            self._failed[job.id] = job
+
+    def release(self, job_id: str) -> None:
+        with self._lock:
+            job = self._running.pop(job_id, None)
+            if job is not None:
+                self._pending[job_id] = job
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "running": len(self._running),
+                "failed": len(self._failed),
+            }
+
+class SQLiteQueueBackend(QueueBackend):
+    """File-backed backend that several processes can share; claims are leases"""
+
+    def __init__(self, path: str, visibility_timeout: float = 600.0):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS build_jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    last_error TEXT,
+                    claimed_at REAL
+                )
+                """
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(build_jobs)")}
+            if "claimed_at" not in columns:
+                # Queue files created before claims were leases
+                conn.execute("ALTER TABLE build_jobs ADD COLUMN claimed_at REAL")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS build_jobs_ready ON build_jobs (status, available_at)"
+            )
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _row_to_job(row) -> BuildJob:
+        job_id, kind, payload, attempts, available_at, last_error = row
+        return BuildJob(
+            id=job_id,
+            kind=kind,
+            payload=loads(payload),
+            attempts=attempts,
+            available_at=available_at,
+            last_error=last_error,
+        )
+
+    def put(self, job: BuildJob) -> None:
+        with self._lock:
+            self._connection().execute(
+                "INSERT INTO build_jobs (id, kind, payload, attempts, available_at, status) "
+                "VALUES (?, ?, ?, ?, ?, 'pending')",
+                (job.id, job.kind, dumps_str(job.payload), job.attempts, job.available_at),
+            )
+
+    def claim(self, now: float) -> Optional[BuildJob]:
+        with self._lock:
+            conn = self._connection()
+            # IMMEDIATE takes the write lock up front, so other processes wait their turn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A lease that ran out belonged to a worker that died or hung mid-job
+                recovered = conn.execute(
+                    "UPDATE build_jobs SET status = 'pending' "
+                    "WHERE status = 'running' AND (claimed_at IS NULL OR claimed_at <= ?)",
+                    (now - self.visibility_timeout,),
+                ).rowcount
+                row = conn.execute(
+                    "UPDATE build_jobs SET status = 'running', claimed_at = ? "
+                    "WHERE id = (SELECT id FROM build_jobs WHERE status = 'pending' AND available_at <= ? "
+                    "ORDER BY available_at LIMIT 1) "
+                    "RETURNING id, kind, payload, attempts, available_at, last_error",
+                    (now, now),
+                ).fetchone()
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        if recovered:
+            logger.warning(f"Re-queued {recovered} build jobs whose lease expired")
+        return self._row_to_job(row) if row is not None else None
+
+    def complete(self, job_id: str) -> None:
+        with self._lock:
+            self._connection().execute("DELETE FROM build_jobs WHERE id = ?", (job_id,))
+
+    def retry(self, job: BuildJob) -> None:
+        with self._lock:
+            self._connection().execute(
+                "UPDATE build_jobs SET status = 'pending', attempts = ?, available_at = ?, last_error = ? "
+                "WHERE id = ?",
+                (job.attempts, job.available_at, job.last_error, job.id),
+            )
+
+    def fail(self, job: BuildJob) -> None:
+        with self._lock:
+            self._connection().execute(
+                "UPDATE build_jobs SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                (job.attempts, job.last_error, job.id),
+            )
+
+    def release(self, job_id: str) -> None:
+        with self._lock:
+            self._connection().execute(
+                "UPDATE build_jobs SET status = 'pending', claimed_at = NULL "
+                "WHERE id = ? AND status = 'running'",
+                (job_id,),
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(
+                self._connection().execute(
+                    "SELECT status, COUNT(*) FROM build_jobs GROUP BY status"
+                ).fetchall()
+            )
+        return {status: counts.get(status, 0) for status in ("pending", "running", "failed")}
+
+QUEUE_BACKENDS: Dict[str, Callable[..., QueueBackend]] = {
+    "memory": lambda settings: MemoryQueueBackend(),
+    "sqlite": lambda settings: SQLiteQueueBackend(
+        settings.BUILD_QUEUE_PATH, visibility_timeout=settings.BUILD_QUEUE_VISIBILITY_TIMEOUT
+    ),
+}
+
+def create_queue_backend(settings) -> QueueBackend:
+    """Instantiate the backend named by BUILD_QUEUE_BACKEND"""
+    try:
+        factory = QUEUE_BACKENDS[settings.BUILD_QUEUE_BACKEND]
+    except KeyError:
+        raise ValueError(f"Unknown build queue backend: {settings.BUILD_QUEUE_BACKEND}")
+    return factory(settings)
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+class BuildQueue:
+    """Worker pool that drains a QueueBackend"""
+
+    def __init__(
+        self,
+        backend: QueueBackend,
+        concurrency: int = 4,
+        max_attempts: int = 5,
+        retry_base_delay: float = 2.0,
+        retry_max_delay: float = 300.0,
+        poll_interval: float = 1.0,
+        shutdown_timeout: float = 10.0
+    ):
+        self.backend = backend
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.poll_interval = poll_interval
+        self.shutdown_timeout = shutdown_timeout
+        self._handlers: Dict[str, JobHandler] = {}
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        """Register the coroutine that processes jobs of the given kind"""
+        self._handlers[kind] = handler
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any], job_id: Optional[str] = None) -> str:
+        """Persist a job and wake an idle worker. Returns the job id."""
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for build job kind: {kind}")
+        job = BuildJob(kind=kind, payload=payload)
+        if job_id:
+            job.id = job_id
+        await asyncio.to_thread(self.backend.put, job)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        logger.info(f"Enqueued {kind} build job {job.id}")
+        return job.id
+
+    async def start(self) -> None:
+        """Start the worker pool"""
+        if self._workers:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._worker(n), name=f"build-worker-{n}")
+            for n in range(self.concurrency)
+        ]
+        logger.info(f"Started {self.concurrency} build queue workers")
+
+    async def stop(self) -> None:
+        """Stop the workers, giving running jobs up to shutdown_timeout seconds to finish.
+
+        Jobs cancelled after that are released back to the backend, so another
+        worker or the next start picks them up; the memory backend loses them
+        when the process exits.
+        """
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self._workers:
+            # Workers exit after their current job once _stopping is set
+            _, running = await asyncio.wait(self._workers, timeout=self.shutdown_timeout)
+            if running:
+                logger.warning(f"Cancelling {len(running)} build queue workers still busy after {self.shutdown_timeout}s")
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Stopped build queue workers")
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.retry_max_delay, self.retry_base_delay * (2 ** (attempts - 1)))
+        # Equal jitter: retries from a burst spread out but still wait at least half the delay
+        return random.uniform(delay / 2, delay)
+
+    async def _worker(self, number: int) -> None:
+        while not self._stopping:
+            job = await asyncio.to_thread(self.backend.claim, time.time())
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: BuildJob) -> None:
+        handler = self._handlers.get(job.kind)
+        job.attempts += 1
+        try:
+            if handler is None:
+                raise PermanentJobError(f"No handler registered for build job kind: {job.kind}")
+            await handler(job.payload)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back rather than waiting for its lease to run out
+            try:
+                self.backend.release(job.id)
+            except Exception as e:
+                logger.error(f"Could not release build job {job.id}: {str(e)}")
+            raise
+        except Exception as e:
+            job.last_error = str(e)
+            if isinstance(e, PermanentJobError) or job.attempts >= self.max_attempts:
+                logger.error(f"Build job {job.id} ({job.kind}) failed permanently after {job.attempts} attempts: {str(e)}")
+                await asyncio.to_thread(self.backend.fail, job)
+                return
+            delay = self._backoff(job.attempts)
+            job.available_at = time.time() + delay
+            logger.warning(f"Build job {job.id} ({job.kind}) failed on attempt {job.attempts}, retrying in {delay:.1f}s: {str(e)}")
+            await asyncio.to_thread(self.backend.retry, job)
+            return
+
+        await asyncio.to_thread(self.backend.complete, job.id)
+        logger.info(f"Completed {job.kind} build job {job.id}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and worker count for monitoring"""
+        return {"workers": len(self._workers), **self.backend.stats()}
@@ -1,28 +1,52 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Mapping, Optional, List, Callable
 import logging
+import uuid
 from app.models.ad_data import AdData
 from app.auth.supabase_auth import supabase_service
+from app.config import get_settings
 from app.transformers.notion import NotionTransformer
 from app.transformers.airtable import AirtableTransformer
+from app.services.build_queue import BuildQueue, PermanentJobError, create_queue_backend
+from app.services.connection_service import connection_service
+from app.services.airtable_service import AirtableAPIError
+from app import db
+
+settings = get_settings()
 
 class BuildService:
-    def __init__(self):
+    def __init__(self, queue: Optional[BuildQueue] = None):
         self.logger = logging.getLogger(__name__)
+        self.queue = queue or BuildQueue(
+            create_queue_backend(settings),
+            concurrency=settings.BUILD_QUEUE_CONCURRENCY,
+            max_attempts=settings.BUILD_QUEUE_MAX_ATTEMPTS,
+            retry_base_delay=settings.BUILD_QUEUE_RETRY_BASE_DELAY,
+            retry_max_delay=settings.BUILD_QUEUE_RETRY_MAX_DELAY,
+            shutdown_timeout=settings.BUILD_QUEUE_SHUTDOWN_TIMEOUT
+        )
+        self.queue.register("insert", self._run_insert_job)
+        self.queue.register("insert_batch", self._run_insert_batch_job)
+        self.queue.register("airtable_record", self._run_airtable_record_job)
+        
+    async def start(self) -> None:
+        """Start the build queue workers"""
+        await self.queue.start()
+        
+    async def stop(self) -> None:
+        """Stop the build queue workers"""
+        await self.queue.stop()
         
     async def create_build(self, ad_data: AdData) -> Dict[str, Any]:
         """Save AdData to Supabase and return build info"""
         try:
             # Convert AdData to dict
-            data = ad_data.to_dict()
+            data = ad_data.to_row()
             
             # Insert into Supabase
-            response = supabase_service.table('ad_imports').insert(data).execute()
-            
-            if not response.data:
-                raise Exception("No data returned from Supabase insert")
-                
-            result = response.data[0]
-            self.logger.info(f"Created build for ad: {data['ad_name']}")
+            if await self._insert_rows([data]):
+                self.logger.info(f"Created build for ad: {data['ad_name']}")
+            else:
+                self.logger.info(f"Build {data['build_id']} already exists, skipping insert")
             
             return {
                 "status": "success",
@@ -36,19 +60,56 @@ class BuildService:
             self.logger.error(f"Error creating build: {str(e)}")
             raise Exception(f"Error creating build: {str(e)}")
             
+    async def enqueue_build(self, ad_data: AdData) -> Dict[str, Any]:
+        """Queue an already validated AdData for insertion and return build info"""
+        data = ad_data.to_row()
+        await self.queue.enqueue("insert", {"row": data}, job_id=data["build_id"])
+        
+        return {
+            "status": "queued",
+            "message": "Build queued",
+            "build_id": data["build_id"],
+            "ad_name": data["ad_name"],
+            "ad_import_status": data["ad_import_status"]
+        }
+        
+    def build_notion_ad(
+        self,
+        payload: Dict[str, Any],
+        user_id: str,
+        field_map: Optional[Mapping[str, str]] = None
+    ) -> AdData:
+        """Transform a Notion payload into AdData"""
+        transformer = NotionTransformer(data=payload)
+        return transformer.transform(user_id=user_id, field_map=field_map)
+        
+    def build_airtable_ad(
+        self,
+        payload: Dict[str, Any],
+        user_id: str,
+        base_id: str,
+        table_id: str,
+        field_map: Optional[Mapping[str, str]] = None
+    ) -> AdData:
+        """Transform an Airtable record into AdData"""
+        transformer = AirtableTransformer(data=payload)
+        return transformer.transform(
+            user_id=user_id,
+            base_id=base_id,
+            table_id=table_id,
+            field_map=field_map
+        )
+        
     async def process_notion_data(
-        self, 
-        payload: Dict[str, Any], 
+        self,
+        payload: Dict[str, Any],
         user_id: str,
-        field_map: Optional[Dict[str, str]] = None
+        field_map: Optional[Mapping[str, str]] = None
     ) -> Dict[str, Any]:
         """Process Notion data and create build"""
         try:
-            # Create NotionTransformer
-            transformer = NotionTransformer(data=payload)
-            
             # Transform to AdData
-            ad_data = transformer.transform(user_id=user_id, field_map=field_map)
+            ad_data = self.build_notion_ad(payload, user_id, field_map)
             
             # Create build
             return await self.create_build(ad_data)
@@ -58,29 +119,193 @@ class BuildService:
             raise Exception(f"Error processing Notion data: {str(e)}")
             
     async def process_airtable_data(
-        self, 
-        payload: Dict[str, Any], 
+        self,
+        payload: Dict[str, Any],
         user_id: str,
-        base_id: str, 
+        base_id: str,
         table_id: str,
-        field_map: Optional[Dict[str, str]] = None
+        field_map: Optional[Mapping[str, str]] = None
     ) -> Dict[str, Any]:
         """Process Airtable data and create build"""
         try:
-            # Create AirtableTransformer
-            transformer = AirtableTransformer(data=payload)
-            
             # Transform to AdData
-            ad_data = transformer.transform(
-                user_id=user_id,
-                base_id=base_id,
-                table_id=table_id,
-                field_map=field_map
-            )
+            ad_data = self.build_airtable_ad(payload, user_id, base_id, table_id, field_map)
             
             # Create build
             return await self.create_build(ad_data)
             
         except Exception as e:
             self.logger.error(f"Error processing Airtable data: {str(e)}")
-            raise Exception(f"Error processing Airtable data: {str(e)}") 
\ No newline at end of file
+            raise Exception(f"Error processing Airtable data: {str(e)}")
+            
+    async def enqueue_notion_data(
+        self,
+        payload: Dict[str, Any],
+        user_id: str,
+        field_map: Optional[Mapping[str, str]] = None
+    ) -> Dict[str, Any]:
+        """Validate Notion data now and queue the build. Raises ValueError on invalid data."""
+        ad_data = self.build_notion_ad(payload, user_id, field_map)
+        return await self.enqueue_build(ad_data)
+        
+    async def enqueue_airtable_data(
+        self,
+        payload: Dict[str, Any],
+        user_id: str,
+        base_id: str,
+        table_id: str,
+        field_map: Optional[Mapping[str, str]] = None
+    ) -> Dict[str, Any]:
+        """Validate Airtable data now and queue the build. Raises ValueError on invalid data."""
+        ad_data = self.build_airtable_ad(payload, user_id, base_id, table_id, field_map)
+        return await self.enqueue_build(ad_data)
+        
+    async def enqueue_airtable_record(
+        self,
+        user_id: str,
+        base_id: str,
+        table_id: str,
+        record_id: str,
+        field_map: Optional[Mapping[str, str]] = None
+    ) -> Dict[str, Any]:
+        """Queue a build whose Airtable record still has to be fetched"""
+        build_id = str(uuid.uuid4())
+        await self.queue.enqueue(
+            "airtable_record",
+            {
+                "build_id": build_id,
+                "user_id": user_id,
+                "base_id": base_id,
+                "table_id": table_id,
+                "record_id": record_id,
+                "field_map": dict(field_map) if field_map else None
+            },
+            job_id=build_id
+        )
+        
+        return {
+            "status": "queued",
+            "message": "Build queued",
+            "build_id": build_id,
+            "source_record_id": record_id
+        }
+        
+    async def enqueue_notion_batch(
+        self,
+        records: List[Dict[str, Any]],
+        user_id: str,
+        field_map: Optional[Mapping[str, str]] = None
+    ) -> Dict[str, Any]:
+        """Validate a list of Notion payloads and queue them as one multi-row insert"""
+        return await self._enqueue_batch(
+            records,
+            lambda record: self.build_notion_ad(record, user_id, field_map)
+        )
+        
+    async def enqueue_airtable_batch(
+        self,
+        records: List[Dict[str, Any]],
+        user_id: str,
+        base_id: str,
+        table_id: str,
+        field_map: Optional[Mapping[str, str]] = None
+    ) -> Dict[str, Any]:
+        """Validate a list of Airtable records and queue them as one multi-row insert"""
+        return await self._enqueue_batch(
+            records,
+            lambda record: self.build_airtable_ad(record, user_id, base_id, table_id, field_map)
+        )
+        
+    async def _enqueue_batch(
+        self,
+        records: List[Dict[str, Any]],
+        build: Callable[[Dict[str, Any]], AdData]
+    ) -> Dict[str, Any]:
+        """Transform every record, queue the valid ones together and report per-record status"""
+        results = []
+        rows = []
+        for index, record in enumerate(records):
+            try:
+                ad_data = build(record)
+            except Exception as e:
+                self.logger.warning(f"Skipping batch record {index}: {str(e)}")
+                results.append({"index": index, "status": "error", "message": str(e)})
+                continue
+            
+            row = ad_data.to_row()
+            rows.append(row)
+            results.append({
+                "index": index,
+                "status": "queued",
+                "build_id": row["build_id"],
+                "ad_name": row["ad_name"]
+            })
+        
+        if rows:
+            await self.queue.enqueue("insert_batch", {"rows": rows})
+        self.logger.info(f"Queued {len(rows)} of {len(records)} batch records")
+        
+        return {
+            "status": "queued" if rows else "error",
+            "queued": len(rows),
+            "failed": len(records) - len(rows),
+            "results": results
+        }
+        
+    async def _insert_rows(self, rows: List[Dict[str, Any]]) -> int:
+        """Insert ad_imports rows, skipping build_ids that already exist; returns how many were new"""
+        # A job can run twice: retried after its response was lost, or re-queued
+        # after a restart interrupted it. The unique build_id index
+        # (migrations/003_ad_imports_build_id.sql) makes the second run a no-op.
+        response = await db.execute(
+            supabase_service.table('ad_imports').upsert(rows, on_conflict="build_id", ignore_duplicates=True)
+        )
+        return len(response.data or [])
+        
+    async def _run_insert_job(self, payload: Dict[str, Any]) -> None:
+        """Queue handler: insert a validated ad_imports row"""
+        row = payload["row"]
+        if await self._insert_rows([row]):
+            self.logger.info(f"Created build {row['build_id']} for ad: {row['ad_name']}")
+        else:
+            self.logger.info(f"Build {row['build_id']} already exists, skipping insert")
+        
+    async def _run_insert_batch_job(self, payload: Dict[str, Any]) -> None:
+        """Queue handler: insert many validated ad_imports rows in one request"""
+        rows = payload["rows"]
+        created = await self._insert_rows(rows)
+        self.logger.info(f"Created {created} builds from batch of {len(rows)}")
+        
+    async def _run_airtable_record_job(self, payload: Dict[str, Any]) -> None:
+        """Queue handler: fetch an Airtable record, transform it and insert it"""
+        airtable_service = await connection_service.get_airtable_service(payload["user_id"])
+        if not airtable_service:
+            raise PermanentJobError("No Airtable connection found for user")
+            
+        # Concurrent jobs for the same table share one list-records call
+        try:
+            record = await airtable_service.get_record_batched(
+                payload["base_id"], payload["table_id"], payload["record_id"]
+            )
+        except AirtableAPIError as e:
+            # A deleted record or revoked grant fails now instead of after every retry
+            if e.permanent:
+                raise PermanentJobError(
+                    f"Airtable record {payload['record_id']} unavailable (status {e.status_code}): {str(e)}"
+                ) from e
+            raise
+        
+        try:
+            ad_data = self.build_airtable_ad(
+                record,
+                payload["user_id"],
+                payload["base_id"],
+                payload["table_id"],
+                payload.get("field_map")
+            )
+        except ValueError as e:
+            raise PermanentJobError(f"Invalid Airtable record {payload['record_id']}: {str(e)}")
+            
+        ad_data.build_id = payload["build_id"]
+        await self.create_build(ad_data)
+        
\ No newline at end of file
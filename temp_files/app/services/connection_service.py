@@ -1,12 +1,25 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel
 from supabase import Client
 from datetime import datetime
+import asyncio
+import copy
 import logging
 from app.auth.supabase_auth import supabase, supabase_service
 from app.services.airtable_service import AirtableService
+from app.cache import TTLCache, SingleFlight, MISSING
+from app.config import get_settings
+from app import db
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# user_id -> {'credentials': {...}, 'api_key_prefix': ...}
+connection_cache = TTLCache(
+    maxsize=settings.CONNECTION_CACHE_MAXSIZE,
+    ttl=settings.CONNECTION_CACHE_TTL
+)
+connection_flight = SingleFlight()
 
 class Connection(BaseModel):
     service_name: str
@@ -17,6 +30,13 @@ class Connection(BaseModel):
 class ConnectionService:
     def __init__(self, supabase_client: Client = None):
         self.supabase = supabase_client or supabase_service
+        # Bumped on every invalidation so a lookup that raced a write isn't cached
+        self._generation = 0
+        
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop a user's cached connections after their credentials or API keys change"""
+        self._generation += 1
+        connection_cache.invalidate(user_id)
 
     async def store_connection(self, user_id: str, connection: Connection) -> Connection:
         data = {
@@ -24,33 +44,57 @@ class ConnectionService:
             **connection.dict()
         }
         
-        existing = self.supabase.table('service_credentials')\
-            .select("*")\
-            .eq('user_id', user_id)\
-            .eq('service_name', connection.service_name)\
-            .execute()
+        existing = await db.execute(
+            self.supabase.table('service_credentials')
+            .select("*")
+            .eq('user_id', user_id)
+            .eq('service_name', connection.service_name)
+        )
 
         if existing.data:
-            response = self.supabase.table('service_credentials')\
-                .update(data)\
-                .eq('user_id', user_id)\
-                .eq('service_name', connection.service_name)\
-                .execute()
+            response = await db.execute(
+                self.supabase.table('service_credentials')
+                .update(data)
+                .eq('user_id', user_id)
+                .eq('service_name', connection.service_name)
+            )
         else:
-            response = self.supabase.table('service_credentials')\
-                .insert(data)\
-                .execute()
+            response = await db.execute(
+                self.supabase.table('service_credentials')
+                .insert(data)
+            )
         
+        self.invalidate_user(user_id)
         return Connection(**response.data[0])
 
-    def get_user_connections(self, user_id):
-        """Get all connections for a user"""
+    async def get_user_connections(self, user_id) -> Dict[str, Any]:
+        """Get all connections for a user, from cache when warm"""
+        cached = connection_cache.get(user_id)
+        if cached is not MISSING:
+            # Callers mutate the result, so never hand out the cached object
+            return copy.deepcopy(cached)
+            
+        # Concurrent webhooks for the same user share one lookup
+        result = await connection_flight.do(user_id, lambda: self._fetch_user_connections(user_id))
+        return copy.deepcopy(result)
+        
+    async def _fetch_user_connections(self, user_id) -> Dict[str, Any]:
+        """Query a user's credentials and API key and cache the result"""
+        generation = self._generation
         try:
-            # Get service credentials
-            response = self.supabase.table('service_credentials')\
-                .select("*")\
-                .eq('user_id', user_id)\
-                .execute()
+            # Credentials and API key are fetched concurrently
+            response, api_key_response = await asyncio.gather(
+                db.execute(
+                    self.supabase.table('service_credentials')
+                    .select("*")
+                    .eq('user_id', user_id)
+                ),
+                db.execute(
+                    self.supabase.table('api_keys')
+                    .select("key_prefix")
+                    .eq('user_id', user_id)
+                )
+            )
             
             logger.info(f"Retrieved {len(response.data)} service credentials for user {user_id}")
             
@@ -67,35 +111,32 @@ class ConnectionService:
                 else:
                     logger.info(f"Skipping disconnected service: {service_name}")
             
-            # Get API key
-            api_key_response = self.supabase.table('api_keys')\
-                .select("key")\
-                .eq('user_id', user_id)\
-                .execute()
-            
-            api_key = None
+            # Only the key's prefix is stored in the clear
+            api_key_prefix = None
             if api_key_response.data:
-                api_key = api_key_response.data[0]['key']
+                api_key_prefix = api_key_response.data[0]['key_prefix']
                 logger.info(f"Found API key for user {user_id}")
             else:
                 logger.info(f"No API key found for user {user_id}")
             
             result = {
                 'credentials': credentials,
-                'api_key': api_key
+                'api_key_prefix': api_key_prefix
             }
             logger.info(f"Connected services: {list(credentials.keys())}")
+            if generation == self._generation:
+                connection_cache.set(user_id, result)
             return result
             
         except Exception as e:
             logger.error(f"Error getting user connections: {str(e)}")
-            return {'credentials': {}, 'api_key': None}
+            return {'credentials': {}, 'api_key_prefix': None}
 
     async def get_airtable_service(self, user_id: str) -> Optional[AirtableService]:
         """Get an initialized AirtableService for a user"""
         try:
             # Get user's connections
-            connections = self.get_user_connections(user_id)
+            connections = await self.get_user_connections(user_id)
             if not connections or 'credentials' not in connections:
                 logger.error(f"No connections found for user {user_id}")
                 return None
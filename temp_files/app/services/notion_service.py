@@ -1,30 +1,66 @@
 import logging
-from notion_client import Client
+import httpx
+from notion_client import AsyncClient
 from app.auth.supabase_auth import supabase, supabase_service
 from datetime import datetime
-import json
 from dotenv import load_dotenv
 from app.models import NotionPayload, AdData
+from app.cache import TTLCache, MISSING
+from app.rate_limit import rate_limiter
+from app.config import get_settings
+from app import db, http_client
+from app.json_codec import pretty
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 # Load environment variables
 load_dotenv()
 
+# access token -> (transport, AsyncClient); clients are reused across requests
+notion_client_cache = TTLCache(
+    maxsize=settings.NOTION_CLIENT_CACHE_MAXSIZE,
+    ttl=settings.NOTION_CLIENT_CACHE_TTL
+)
+
+def get_notion_client(token: str) -> AsyncClient:
+    """Async Notion client for a token, running on the shared connection pool"""
+    transport = http_client.get_transport()
+    cached = notion_client_cache.get(token)
+    # A client built before the pool was reopened would point at a closed transport
+    if cached is not MISSING and cached[0] is transport:
+        return cached[1]
+    
+    # The SDK sets base URL and auth headers on the httpx client it is given,
+    # so each token gets its own thin client over the pooled transport
+    client = AsyncClient(
+        client=httpx.AsyncClient(transport=transport),
+        auth=token,
+        timeout_ms=int(settings.HTTP_CLIENT_TIMEOUT * 1000),
+        # 429s are retried by rate_limiter, which also slows the token's other callers
+        retry=False,
+        logger=logging.getLogger("notion_client")
+    )
+    notion_client_cache.set(token, (transport, client))
+    return client
+
 def pretty_json(obj):
     """Format object as pretty JSON string"""
-    return json.dumps(obj, indent=2, sort_keys=True, default=str)
+    return pretty(obj)
 
 class NotionService:
     def __init__(self, token, user_id=None):
-        self.client = Client(auth=token)
+        self.token = token
+        self.client = get_notion_client(token)
         self.user_id = user_id
     
     async def get_page(self, page_id: str) -> dict:
         """Fetch a page from Notion"""
         try:
-            page = self.client.pages.retrieve(page_id=page_id)
-            logger.info(f"Retrieved Notion page: {pretty_json(page)}")
+            page = await rate_limiter.call("notion", self.token, lambda: self.client.pages.retrieve(page_id=page_id))
+            logger.info(f"Retrieved Notion page {page_id}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Notion page {page_id}: {pretty_json(page)}")
             return page
         except Exception as e:
             logger.error(f"Error fetching Notion page: {str(e)}")
@@ -42,7 +78,7 @@ class NotionService:
             notion_status = status_mapping.get(status, "Draft")
             
             # Update the page
-            response = self.client.pages.update(
+            response = await rate_limiter.call("notion", self.token, lambda: self.client.pages.update(
                 page_id=page_id,
                 properties={
                     "ad_import_status": {
@@ -51,8 +87,10 @@ class NotionService:
                         }
                     }
                 }
-            )
-            logger.info(f"Updated Notion page status: {pretty_json(response)}")
+            ))
+            logger.info(f"Updated Notion page {page_id} status to {notion_status}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Notion update response for {page_id}: {pretty_json(response)}")
             return response
         except Exception as e:
             logger.error(f"Error updating Notion page status: {str(e)}")
@@ -75,9 +113,11 @@ class NotionService:
             data["ad_import_status"] = "building"
             
             # Log the data we're sending to Supabase
-            logger.info(f"Sending data to Supabase: {pretty_json(data)}")
+            logger.info(f"Sending ad import for Notion page {page_id} to Supabase")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Ad import data for {page_id}: {pretty_json(data)}")
             
-            response = supabase_service.table('ad_imports').insert(data).execute()
+            response = await db.execute(supabase_service.table('ad_imports').insert(data))
             
             if not response.data:
                 raise Exception("No data returned from Supabase insert")
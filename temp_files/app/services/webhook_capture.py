@@ -0,0 +1,281 @@
+"""Background capture store for incoming webhook payloads.
+
+Request handlers call capture(), which samples the payload and hands it to a
+bounded in-memory queue without touching the disk. A writer thread appends
+records as JSON lines to gzip-compressed segments, rotates a segment once it
+reaches CAPTURE_SEGMENT_MAX_BYTES or has been open for CAPTURE_SEGMENT_MAX_AGE
+seconds, and applies the retention policy (age and total size) after every
+rotation and every CAPTURE_RETENTION_INTERVAL seconds. If the writer falls
+behind, new captures are dropped and counted rather than slowing the request
+path.
+
+Segments are named webhooks-<utc timestamp>-<pid>-<seq>.jsonl.gz; the segment
+being written carries a .part suffix until it is rotated. Use iter_captured()
+to read records back, e.g. for replay.
+"""
+import glob
+import gzip
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.config import get_settings
+from app.json_codec import dumps, loads
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+SEGMENT_PREFIX = "webhooks"
+SEGMENT_SUFFIX = ".jsonl.gz"
+ACTIVE_SUFFIX = ".part"
+
+_STOP = object()
+
+class WebhookCapture:
+    """Samples webhook payloads and writes them to rotating gzip JSONL segments"""
+
+    def __init__(
+        self,
+        directory: str,
+        enabled: bool = True,
+        sample_rate: float = 1.0,
+        segment_max_bytes: int = 16 * 1024 * 1024,
+        max_total_bytes: int = 512 * 1024 * 1024,
+        retention_days: float = 7.0,
+        queue_size: int = 10000,
+        flush_interval: float = 1.0,
+        segment_max_age: float = 3600.0,
+        retention_interval: float = 300.0
+    ):
+        self.directory = directory
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.segment_max_bytes = segment_max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.retention_days = retention_days
+        self.flush_interval = flush_interval
+        self.segment_max_age = segment_max_age
+        self.retention_interval = retention_interval
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._raw = None
+        self._gzip = None
+        self._segment_path: Optional[str] = None
+        self._segment_seq = 0
+        self._segment_opened_at = 0.0
+        self._next_retention = 0.0
+        self._counters = {"captured": 0, "sampled_out": 0, "dropped": 0, "written": 0, "errors": 0, "segments_deleted": 0}
+
+    # Request path
+
+    def capture(self, source: str, payload: Any, **meta: Any) -> bool:
+        """Queue a payload for writing. Never blocks; returns False if it was skipped."""
+        if not self.enabled:
+            return False
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self._counters["sampled_out"] += 1
+            return False
+        self._ensure_started()
+        record = {
+            "captured_at": datetime.now(timezone.utc).isoformat(),
+            "source": source,
+            **meta,
+            "payload": payload,
+        }
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._counters["dropped"] += 1
+            return False
+        self._counters["captured"] += 1
+        return True
+
+    # Lifecycle
+
+    def _ensure_started(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="webhook-capture", daemon=True)
+                    self._thread.start()
+
+    def start(self) -> None:
+        """Start the writer thread (called from the FastAPI lifespan hook)"""
+        if self.enabled:
+            self._ensure_started()
+            logger.info(f"Webhook capture writing to {self.directory} (sample rate {self.sample_rate})")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Flush queued records, close the active segment and stop the writer"""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        self._thread = None
+
+    # Writer thread
+
+    def _run(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._apply_retention()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                # A quiet segment still has to rotate and age out on schedule
+                self._maintain()
+                continue
+
+            # Drain whatever else is waiting and write it as one batch
+            batch = [item]
+            while len(batch) < 1000:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = any(record is _STOP for record in batch)
+            records = [record for record in batch if record is not _STOP]
+            if records:
+                self._write(records)
+            if stopping:
+                self._close_segment()
+                return
+
+    def _write(self, records: List[Dict[str, Any]]) -> None:
+        try:
+            if self._gzip is None:
+                self._open_segment()
+            for record in records:
+                self._gzip.write(dumps(record) + b"\n")
+            # Sync flush so a crash loses at most the current batch
+            self._gzip.flush()
+            self._counters["written"] += len(records)
+            if self._raw.tell() >= self.segment_max_bytes:
+                self._close_segment()
+                self._apply_retention()
+            else:
+                self._maintain()
+        except Exception as e:
+            self._counters["errors"] += 1
+            logger.error(f"Failed to write {len(records)} webhook captures: {str(e)}")
+
+    def _maintain(self) -> None:
+        """Rotate the active segment once it's too old and run retention when it's due"""
+        now = time.monotonic()
+        # Retention goes by a segment's mtime, so rotating keeps records from
+        # outliving it by more than segment_max_age
+        if self._gzip is not None and now - self._segment_opened_at >= self.segment_max_age:
+            self._close_segment()
+            self._apply_retention()
+        elif now >= self._next_retention:
+            self._apply_retention()
+
+    def _open_segment(self) -> None:
+        self._segment_seq += 1
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        name = f"{SEGMENT_PREFIX}-{timestamp}-{os.getpid()}-{self._segment_seq:04d}{SEGMENT_SUFFIX}"
+        self._segment_path = os.path.join(self.directory, name)
+        self._raw = open(self._segment_path + ACTIVE_SUFFIX, "ab")
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode="ab")
+        self._segment_opened_at = time.monotonic()
+
+    def _close_segment(self) -> None:
+        if self._gzip is None:
+            return
+        try:
+            self._gzip.close()
+            self._raw.close()
+            os.replace(self._segment_path + ACTIVE_SUFFIX, self._segment_path)
+        except Exception as e:
+            self._counters["errors"] += 1
+            logger.error(f"Failed to close webhook capture segment {self._segment_path}: {str(e)}")
+        finally:
+            self._gzip = None
+            self._raw = None
+            self._segment_path = None
+
+    def _apply_retention(self) -> None:
+        """Delete segments that are too old or beyond the total size budget"""
+        self._next_retention = time.monotonic() + self.retention_interval
+        active = self._segment_path + ACTIVE_SUFFIX if self._segment_path else None
+        segments = []
+        # Includes .part files orphaned by processes that died mid-segment
+        for path in self.segments(include_active=True):
+            if path == active:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            segments.append((stat.st_mtime, stat.st_size, path))
+        segments.sort(reverse=True)
+
+        cutoff = time.time() - self.retention_days * 86400
+        total = 0
+        for mtime, size, path in segments:
+            total += size
+            # Another worker may still be writing a .part file; only age it out
+            over_budget = total > self.max_total_bytes and not path.endswith(ACTIVE_SUFFIX)
+            if mtime < cutoff or over_budget:
+                try:
+                    os.remove(path)
+                    self._counters["segments_deleted"] += 1
+                except OSError as e:
+                    logger.warning(f"Could not delete webhook capture segment {path}: {str(e)}")
+
+    # Reading
+
+    def segments(self, include_active: bool = False) -> List[str]:
+        """Capture segment paths, oldest first"""
+        paths = glob.glob(os.path.join(self.directory, f"{SEGMENT_PREFIX}-*{SEGMENT_SUFFIX}"))
+        if include_active:
+            paths += glob.glob(os.path.join(self.directory, f"{SEGMENT_PREFIX}-*{SEGMENT_SUFFIX}{ACTIVE_SUFFIX}"))
+        return sorted(paths)
+
+    def stats(self) -> Dict[str, Any]:
+        """Capture counters and queue depth for monitoring"""
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "queued": self._queue.qsize(),
+            "writer_alive": self._thread is not None and self._thread.is_alive(),
+            **self._counters,
+        }
+
+def iter_captured(
+    paths: List[str],
+    source: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """Yield capture records from segment files, optionally for one source"""
+    for path in paths:
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = loads(line)
+                    if source is None or record.get("source") == source:
+                        yield record
+        except EOFError:
+            # The active segment has no gzip trailer yet; everything flushed was read
+            continue
+
+webhook_capture = WebhookCapture(
+    settings.CAPTURE_DIR,
+    enabled=settings.CAPTURE_ENABLED,
+    sample_rate=settings.CAPTURE_SAMPLE_RATE,
+    segment_max_bytes=settings.CAPTURE_SEGMENT_MAX_BYTES,
+    max_total_bytes=settings.CAPTURE_MAX_TOTAL_BYTES,
+    retention_days=settings.CAPTURE_RETENTION_DAYS,
+    queue_size=settings.CAPTURE_QUEUE_SIZE,
+    segment_max_age=settings.CAPTURE_SEGMENT_MAX_AGE,
+    retention_interval=settings.CAPTURE_RETENTION_INTERVAL
+)
@@ -0,0 +1,319 @@
+"""Per-user catalog of the Notion databases and Airtable bases a connection can see.
+
+Entries are served stale-while-revalidate: within CATALOG_TTL they are fresh,
+up to CATALOG_MAX_STALE they are returned immediately while a refresh runs in
+the background, and only a missing entry makes the caller wait. Listings follow
+the provider cursors (Notion start_cursor, Airtable offset) to the end, so big
+workspaces are not truncated to the first page.
+
+A background task started from the FastAPI lifespan keeps entries for recently
+active users fresh, so page loads rarely hit the providers at all.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.cache import TTLCache, SingleFlight, MISSING
+from app.config import get_settings
+from app.http_client import get_http_client
+from app.rate_limit import rate_limiter
+from app.services.connection_service import connection_service
+from app.services.notion_service import NotionService
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+AIRTABLE_META_URL = "https://api.airtable.com/v0/meta/bases"
+
+# Default icon for Airtable bases without one
+AIRTABLE_BASE_ICON = '''<svg class="w-4 h-4 text-gray-600" xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke="currentColor">
+                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M4 7v10c0 2.21 3.582 4 8 4s8-1.79 8-4V7M4 7c0 2.21 3.582 4 8 4s8-1.79 8-4M4 7c0-2.21 3.582-4 8-4s8 1.79 8 4m0 5c0 2.21-3.582 4-8 4s-8-1.79-8-4" />
+                </svg>'''
+
+class CatalogFetchError(Exception):
+    """A provider listing failed; status is the HTTP status when known"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+def _token_fingerprint(access_token: str) -> str:
+    # Entries are tied to the token they were listed with, so a reconnect
+    # (new token) never serves the old workspace; the token itself isn't kept
+    return hashlib.sha256(access_token.encode("utf-8")).hexdigest()[:16]
+
+async def list_notion_databases(access_token: str) -> List[Dict[str, Any]]:
+    """Every Notion database shared with the integration, following next_cursor"""
+    client = NotionService(token=access_token).client
+    databases = []
+    cursor = None
+    for _ in range(settings.CATALOG_MAX_PAGES):
+        params = {
+            "filter": {"property": "object", "value": "database"},
+            "page_size": 100
+        }
+        if cursor:
+            params["start_cursor"] = cursor
+        try:
+            page = await rate_limiter.call("notion", access_token, lambda: client.search(**params))
+        except Exception as e:
+            raise CatalogFetchError(f"Notion search failed: {str(e)}", getattr(e, "status", None)) from e
+
+        for database in page.get("results", []):
+            icon = database.get("icon") or {}
+            databases.append({
+                "id": database.get("id"),
+                "title": (database.get("title") or [{}])[0].get("plain_text", "Untitled"),
+                "url": database.get("url"),
+                "icon": icon.get("emoji") if icon.get("type") == "emoji" else icon.get("external", {}).get("url"),
+                "last_edited_time": database.get("last_edited_time"),
+                "properties": {
+                    name: prop.get("type")
+                    for name, prop in (database.get("properties") or {}).items()
+                }
+            })
+
+        cursor = page.get("next_cursor")
+        if not page.get("has_more") or not cursor:
+            break
+    else:
+        logger.warning(f"Stopped listing Notion databases after {settings.CATALOG_MAX_PAGES} pages")
+    return databases
+
+async def _airtable_get(
+    url: str,
+    access_token: str,
+    rate_key: str,
+    params: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    response = await rate_limiter.call("airtable", rate_key, lambda: get_http_client().get(
+        url,
+        params=params,
+        headers={
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json"
+        }
+    ))
+    if response.status_code != 200:
+        raise CatalogFetchError(f"Airtable request failed: {response.text}", response.status_code)
+    return response.json()
+
+async def list_airtable_tables(access_token: str, base_id: str) -> List[Dict[str, Any]]:
+    """Tables of one Airtable base with their field names and types"""
+    data = await _airtable_get(f"{AIRTABLE_META_URL}/{base_id}/tables", access_token, base_id)
+    return [
+        {
+            "id": table.get("id"),
+            "name": table.get("name"),
+            "primary_field_id": table.get("primaryFieldId"),
+            "fields": {field.get("name"): field.get("type") for field in table.get("fields", [])}
+        }
+        for table in data.get("tables", [])
+    ]
+
+async def list_airtable_bases(access_token: str) -> List[Dict[str, Any]]:
+    """Every Airtable base the token can access, following offset, with table schemas"""
+    bases = []
+    offset = None
+    for _ in range(settings.CATALOG_MAX_PAGES):
+        # The base listing isn't tied to a base, so it is throttled per token
+        data = await _airtable_get(
+            AIRTABLE_META_URL,
+            access_token,
+            _token_fingerprint(access_token),
+            {"offset": offset} if offset else None
+        )
+        for base in data.get("bases", []):
+            bases.append({
+                "id": base.get("id"),
+                "name": base.get("name"),
+                "url": f"https://airtable.com/{base.get('id')}",
+                "icon": (base.get("icon") or {}).get("url") or AIRTABLE_BASE_ICON,
+                "permission_level": base.get("permissionLevel"),
+                "tables": []
+            })
+        offset = data.get("offset")
+        if not offset:
+            break
+    else:
+        logger.warning(f"Stopped listing Airtable bases after {settings.CATALOG_MAX_PAGES} pages")
+
+    # Schemas are per base; fetch a few at a time and keep a base listed even if its tables fail
+    semaphore = asyncio.Semaphore(settings.CATALOG_SCHEMA_CONCURRENCY)
+
+    async def attach_tables(base: Dict[str, Any]) -> None:
+        async with semaphore:
+            try:
+                base["tables"] = await list_airtable_tables(access_token, base["id"])
+            except Exception as e:
+                logger.warning(f"Could not list tables for Airtable base {base['id']}: {str(e)}")
+
+    await asyncio.gather(*(attach_tables(base) for base in bases))
+    return bases
+
+# service -> lister; the connections template reads these under credentials[service][field]
+LISTERS = {
+    "notion": list_notion_databases,
+    "airtable": list_airtable_bases,
+}
+
+class CatalogEntry:
+    __slots__ = ("items", "fetched_at", "fingerprint")
+
+    def __init__(self, items: List[Dict[str, Any]], fetched_at: float, fingerprint: str):
+        self.items = items
+        self.fetched_at = fetched_at
+        self.fingerprint = fingerprint
+
+class WorkspaceCatalog:
+    """Stale-while-revalidate cache of provider workspace listings per user"""
+
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        max_stale: float = 86400.0,
+        maxsize: int = 5000,
+        refresh_interval: float = 60.0,
+        idle_ttl: float = 3600.0
+    ):
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.idle_ttl = idle_ttl
+        # Entries outlive ttl so they can be served stale; max_stale is the hard limit
+        self._entries = TTLCache(maxsize=maxsize, ttl=max_stale)
+        self._flight = SingleFlight()
+        # (user_id, service) -> last time a caller asked, for the background refresher
+        self._active: Dict[Tuple[str, str], float] = {}
+        self._background: set = set()
+        self._task: Optional[asyncio.Task] = None
+        self._counters = {"fresh": 0, "stale": 0, "missing": 0, "refreshes": 0, "refresh_errors": 0}
+
+    async def get(self, user_id: str, service: str, access_token: str, refresh: bool = False) -> List[Dict[str, Any]]:
+        """
+        Return the user's listing for a service. Stale entries are returned at
+        once and refreshed in the background; missing ones are fetched inline.
+        """
+        key = (user_id, service)
+        self._active[key] = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not MISSING and entry.fingerprint != _token_fingerprint(access_token):
+            entry = MISSING
+
+        if entry is MISSING or refresh:
+            self._counters["missing"] += 1
+            return await self._refresh(user_id, service, access_token)
+
+        if time.monotonic() - entry.fetched_at < self.ttl:
+            self._counters["fresh"] += 1
+        else:
+            self._counters["stale"] += 1
+            self._refresh_in_background(user_id, service, access_token)
+        return entry.items
+
+    async def _refresh(self, user_id: str, service: str, access_token: str) -> List[Dict[str, Any]]:
+        # Concurrent misses and background refreshes for one user share a listing
+        key = (user_id, service, _token_fingerprint(access_token))
+        return await self._flight.do(key, lambda: self._fetch(user_id, service, access_token))
+
+    async def _fetch(self, user_id: str, service: str, access_token: str) -> List[Dict[str, Any]]:
+        self._counters["refreshes"] += 1
+        started = time.monotonic()
+        try:
+            items = await LISTERS[service](access_token)
+        except Exception as e:
+            self._counters["refresh_errors"] += 1
+            if getattr(e, "status", None) in (401, 403):
+                # Revoked or expired token: stop serving what it used to see
+                self._entries.invalidate((user_id, service))
+            raise
+        self._entries.set((user_id, service), CatalogEntry(items, time.monotonic(), _token_fingerprint(access_token)))
+        logger.info(f"Catalogued {len(items)} {service} items for user {user_id} in {time.monotonic() - started:.2f}s")
+        return items
+
+    def _refresh_in_background(self, user_id: str, service: str, access_token: str) -> None:
+        task = asyncio.ensure_future(self._refresh(user_id, service, access_token))
+        # Hold a reference until done and swallow the error; _fetch already counted it
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+
+    def _background_done(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background catalog refresh failed: {str(task.exception())}")
+
+    def invalidate(self, user_id: str, service: str) -> None:
+        """Forget a user's listing, e.g. after they disconnect the service"""
+        self._entries.invalidate((user_id, service))
+        self._active.pop((user_id, service), None)
+
+    # Background refresher
+
+    async def start(self) -> None:
+        """Start the periodic refresher (called from the FastAPI lifespan hook)"""
+        if self._task is None and self.refresh_interval > 0:
+            self._task = asyncio.create_task(self._run(), name="workspace-catalog-refresher")
+
+    async def stop(self) -> None:
+        """Stop the refresher and any refreshes it started"""
+        tasks = list(self._background)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh_due()
+            except Exception as e:
+                logger.error(f"Workspace catalog refresher failed: {str(e)}")
+
+    async def refresh_due(self) -> int:
+        """Refresh entries for recently active users that are about to go stale"""
+        now = time.monotonic()
+        due = []
+        for key, last_seen in list(self._active.items()):
+            if now - last_seen > self.idle_ttl:
+                del self._active[key]
+                continue
+            entry = self._entries.get(key)
+            # Refresh one interval early so the next page view still finds it fresh
+            if entry is MISSING or now - entry.fetched_at >= self.ttl - self.refresh_interval:
+                due.append(key)
+
+        async def refresh(user_id: str, service: str) -> None:
+            connections = await connection_service.get_user_connections(user_id)
+            access_token = (connections.get("credentials", {}).get(service) or {}).get("access_token")
+            if not access_token:
+                self.invalidate(user_id, service)
+                return
+            try:
+                await self._refresh(user_id, service, access_token)
+            except Exception as e:
+                logger.warning(f"Could not refresh {service} catalog for user {user_id}: {str(e)}")
+
+        await asyncio.gather(*(refresh(user_id, service) for user_id, service in due))
+        return len(due)
+
+    def stats(self) -> Dict[str, Any]:
+        """Catalog counters for monitoring"""
+        return {
+            "entries": len(self._entries),
+            "active_users": len(self._active),
+            "refresher_running": self._task is not None and not self._task.done(),
+            "single_flight": self._flight.stats(),
+            **self._counters,
+        }
+
+workspace_catalog = WorkspaceCatalog(
+    ttl=settings.CATALOG_TTL,
+    max_stale=settings.CATALOG_MAX_STALE,
+    maxsize=settings.CATALOG_MAXSIZE,
+    refresh_interval=settings.CATALOG_REFRESH_INTERVAL,
+    idle_ttl=settings.CATALOG_IDLE_TTL
+)
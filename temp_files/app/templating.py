@@ -0,0 +1,10 @@
+"""Shared Jinja2 templates setup"""
+from fastapi.templating import Jinja2Templates
+from app.config import settings
+
+def create_templates(directory: str = "templates") -> Jinja2Templates:
+    """Jinja2Templates with the app settings available to every template"""
+    templates = Jinja2Templates(directory=directory)
+    # A "settings" entry passed in a route's context still takes precedence
+    templates.env.globals["settings"] = settings
+    return templates
@@ -0,0 +1,71 @@
+"""Sampled, lazily formatted tracing for the transform pipeline.
+
+Transformers used to pretty-print the whole payload and every property at INFO
+on every webhook. They now report through a TransformTrace, which formats and
+serializes nothing unless the request was picked for tracing: either 1 in
+TRANSFORM_DEBUG_SAMPLE_RATE requests, or any request from a user listed in
+TRANSFORM_DEBUG_USER_IDS. Sampled traces are emitted at INFO, so they still
+respect the logger's level.
+"""
+import itertools
+import logging
+import uuid
+from typing import Any, Optional
+
+from app.config import get_settings
+from app.json_codec import pretty
+
+settings = get_settings()
+
+_request_counter = itertools.count()
+
+def _debug_user_ids() -> frozenset:
+    return frozenset(
+        user_id.strip()
+        for user_id in settings.TRANSFORM_DEBUG_USER_IDS.split(",")
+        if user_id.strip()
+    )
+
+_traced_users = _debug_user_ids()
+
+def should_trace(user_id: Optional[str] = None) -> bool:
+    """Decide whether this transform is sampled for tracing"""
+    if user_id and user_id in _traced_users:
+        return True
+    rate = settings.TRANSFORM_DEBUG_SAMPLE_RATE
+    return rate > 0 and next(_request_counter) % rate == 0
+
+class TransformTrace:
+    """Structured trace of one transform; every method is a no-op when disabled"""
+
+    def __init__(self, logger: logging.Logger, enabled: bool = False):
+        self.logger = logger
+        self.enabled = enabled and logger.isEnabledFor(logging.INFO)
+        self.trace_id = uuid.uuid4().hex[:8] if self.enabled else None
+
+    @classmethod
+    def start(cls, logger: logging.Logger, user_id: Optional[str] = None) -> "TransformTrace":
+        """Open a trace for a transform, sampled per settings"""
+        return cls(logger, should_trace(user_id))
+
+    def __bool__(self) -> bool:
+        return self.enabled
+
+    def event(self, name: str, **fields: Any) -> None:
+        """Log an event with key=value fields"""
+        if not self.enabled:
+            return
+        rendered = " ".join(f"{key}={value!r}" for key, value in fields.items())
+        self.logger.info(
+            f"[transform {self.trace_id}] {name} {rendered}".rstrip(),
+            extra={"transform_trace": self.trace_id, "transform_event": name, "transform_fields": fields},
+        )
+
+    def dump(self, name: str, obj: Any) -> None:
+        """Log an object as pretty JSON"""
+        if not self.enabled:
+            return
+        self.logger.info(f"[transform {self.trace_id}] {name}:\n{pretty(obj)}")
+
+# Shared disabled trace for transformer methods called outside transform()
+NULL_TRACE = TransformTrace(logging.getLogger(__name__), enabled=False)
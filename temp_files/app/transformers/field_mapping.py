@@ -0,0 +1,98 @@
+"""Compiled field maps for the transformers.
+
+A field map maps source field names (Notion properties, Airtable fields) to
+AdData field names. Transformers need the reverse lookup, so FieldMapping
+inverts it once; compile_field_map caches compiled mappings by the raw query
+string so repeated automations skip decoding and validation entirely.
+"""
+import logging
+from functools import lru_cache
+from typing import Dict, Iterator, Mapping, Optional, Tuple
+from urllib.parse import unquote
+
+from app.config import get_settings
+from app.json_codec import loads
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+class FieldMapping(Mapping[str, str]):
+    """Read-only source -> target field map with O(1) reverse lookup"""
+
+    def __init__(self, mapping: Mapping[str, str]):
+        self._mapping: Dict[str, str] = dict(mapping)
+        self._sources: Dict[str, str] = {}
+        self._plans: Dict[Tuple[str, ...], Tuple[Tuple[str, Tuple[str, ...]], ...]] = {}
+        for source, target in self._mapping.items():
+            # First source wins, as with the old linear scan
+            self._sources.setdefault(target, source)
+
+    @classmethod
+    def coerce(cls, field_map: Optional[Mapping[str, str]]) -> Optional["FieldMapping"]:
+        """Accept a FieldMapping, a plain dict or None"""
+        if field_map is None or isinstance(field_map, FieldMapping):
+            return field_map
+        return cls(field_map)
+
+    def source_for(self, target: str) -> str:
+        """Source field name that feeds the given target field"""
+        return self._sources.get(target, target)
+
+    def plan(self, targets: Tuple[str, ...]) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+        """Group targets by the source field feeding them, memoized per target tuple"""
+        plan = self._plans.get(targets)
+        if plan is None:
+            plan = build_plan(targets, self)
+            self._plans[targets] = plan
+        return plan
+
+    def __getitem__(self, source: str) -> str:
+        return self._mapping[source]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._mapping)
+
+    def __len__(self) -> int:
+        return len(self._mapping)
+
+    def __repr__(self) -> str:
+        return f"FieldMapping({self._mapping!r})"
+
+    def to_dict(self) -> Dict[str, str]:
+        return dict(self._mapping)
+
+def build_plan(
+    targets: Tuple[str, ...],
+    field_map: Optional[FieldMapping] = None
+) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+    """(source, targets) pairs so each source field is read once"""
+    grouped: Dict[str, list] = {}
+    for target in targets:
+        source = field_map.source_for(target) if field_map else target
+        grouped.setdefault(source, []).append(target)
+    return tuple((source, tuple(fields)) for source, fields in grouped.items())
+
+@lru_cache(maxsize=settings.FIELD_MAP_CACHE_MAXSIZE)
+def compile_field_map(raw: str) -> FieldMapping:
+    """Decode, validate and invert a URL-encoded JSON field map.
+
+    Raises json.JSONDecodeError for malformed JSON and ValueError for a
+    mapping of the wrong shape. Only successful compilations are cached.
+    """
+    decoded_string = unquote(raw)
+    mapping = loads(decoded_string)
+
+    if not isinstance(mapping, dict):
+        raise ValueError("Field map must be a JSON object")
+
+    invalid_entries = [
+        (k, v) for k, v in mapping.items()
+        if not isinstance(k, str) or not isinstance(v, str)
+    ]
+    if invalid_entries:
+        raise ValueError(
+            f"All keys and values must be strings. Invalid entries: {invalid_entries}"
+        )
+
+    logger.info(f"Compiled field map: {mapping}")
+    return FieldMapping(mapping)
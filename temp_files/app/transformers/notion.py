@@ -1,198 +1,250 @@
 from .base import DataTransformer
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, Mapping, Optional
 from app.models.ad_data import AdData
+from app.transformers.debug import TransformTrace, NULL_TRACE
+from app.transformers.field_mapping import FieldMapping, build_plan
 import logging
-import json
 
 logger = logging.getLogger(__name__)
 
+# AdData source fields read from Notion properties
+TARGET_FIELDS = (
+    "ad_id", "ad_name", "ad_headline", "ad_body", "ad_link", "ad_media_type",
+    "ad_cta_label", "ad_asset", "ad_asset_vertical",
+    "destination_ad_account_id", "destination_adset_id", "destination_template_ad_id"
+)
+
+def _with_scheme(value: Optional[str]) -> Optional[str]:
+    if value and not value.startswith(('http://', 'https://')):
+        value = f"https://{value}"
+    return value if value else None
+
+def _join_rich_text(blocks) -> Optional[str]:
+    if not blocks:
+        return None
+    value = "".join([block.get("text", {}).get("content", "") for block in blocks])
+    return value if value else None
+
+def _format_number(number) -> Optional[str]:
+    if number is None:
+        return None
+    if isinstance(number, float) and number.is_integer():
+        number = int(number)
+    return str(number)
+
+def _rich_text(prop, name):
+    return _join_rich_text(prop["rich_text"])
+
+def _title(prop, name):
+    return _join_rich_text(prop["title"])
+
+def _select(prop, name):
+    option = prop.get(prop.get("type") or "select") or {}
+    value = option.get("name", "")
+    return value if value else None
+
+def _multi_select(prop, name):
+    value = ", ".join(option.get("name", "") for option in prop.get("multi_select") or [])
+    return value if value else None
+
+def _number(prop, name):
+    return _format_number(prop.get("number"))
+
+def _url(prop, name):
+    return _with_scheme(prop.get("url"))
+
+def _formula(prop, name):
+    formula = prop.get("formula") or {}
+    formula_type = formula.get("type")
+    if formula_type == "string":
+        value = formula.get("string", "")
+        return value if value else None
+    if formula_type == "number":
+        return _format_number(formula.get("number"))
+    return None
+
+def _rollup(prop, name):
+    rollup = prop.get("rollup") or {}
+    if rollup.get("type") == "number":
+        return _format_number(rollup.get("number"))
+    # Rollups of other properties arrive as an array of property values
+    values = []
+    for item in rollup.get("array") or []:
+        value = extract_property(item, name)
+        if value:
+            values.append(value)
+    return "".join(values) if values else None
+
+def _files(prop, name):
+    files = prop.get("files")
+    if not files:
+        logger.warning(f"No files found for property {name}")
+        return None
+        
+    file_obj = files[0]  # Get the first file
+    file_type = file_obj.get("type")
+    if file_type not in ("file", "external"):
+        logger.warning(f"Unknown file type '{file_type}' for property {name}")
+        return None
+        
+    value = _with_scheme(file_obj.get(file_type, {}).get("url"))
+    if not value:
+        logger.warning(f"No URL found in file object for {name}")
+    return value
+
+# Handlers keyed by the declared Notion property type
+PROPERTY_HANDLERS: Dict[str, Callable[[Dict[str, Any], str], Optional[str]]] = {
+    "rich_text": _rich_text,
+    "title": _title,
+    "select": _select,
+    "status": _select,
+    "multi_select": _multi_select,
+    "number": _number,
+    "url": _url,
+    "formula": _formula,
+    "rollup": _rollup,
+    "files": _files,
+}
+
+_UNMAPPED_PLAN = build_plan(TARGET_FIELDS)
+
+def payload_spec(field_map: Optional[Mapping[str, str]] = None) -> Dict[str, Any]:
+    """The parts of a Notion webhook payload the transformer reads (see app.webhook_body)"""
+    field_map = FieldMapping.coerce(field_map)
+    plan = field_map.plan(TARGET_FIELDS) if field_map else _UNMAPPED_PLAN
+    properties = dict.fromkeys(name for name, _ in plan)
+    return {"source": None, "data": {"id": None, "parent": None, "properties": properties}}
+
+# Probe order for properties without a declared type (older payloads)
+_LEGACY_PROBE_ORDER = ("rich_text", "select", "rollup", "url", "formula", "files")
+
+def property_type(prop: Dict[str, Any]) -> Optional[str]:
+    """Declared type of a Notion property value, probing keys if it has none"""
+    declared = prop.get("type")
+    if declared in PROPERTY_HANDLERS:
+        return declared
+    for key in _LEGACY_PROBE_ORDER:
+        if key in prop:
+            return key
+    return declared
+
+def extract_property(prop: Dict[str, Any], name: str) -> Optional[str]:
+    """Extract a string value from one Notion property value"""
+    handler = PROPERTY_HANDLERS.get(property_type(prop))
+    if handler is None:
+        logger.warning(f"Unhandled property type for {name}")
+        return None
+    return handler(prop, name)
+
 class NotionTransformer(DataTransformer):
     def __init__(self, data: Dict[str, Any]):
         self.data = data
-        # Log the entire incoming data structure
-        logger.info(f"Initializing NotionTransformer with data: {json.dumps(self.data, indent=2)}")
+        self.trace = NULL_TRACE
         
-    def get_property_value(self, property_name: str, field_map: Optional[Dict[str, str]] = None) -> Optional[str]:
-        """Extract value from any Notion property type"""
-        logger.info(f"\nExtracting property: {property_name}")
+    def extract_properties(self, field_map: Optional[Mapping[str, str]] = None) -> Dict[str, Optional[str]]:
+        """Extract every target field's value in one pass over the wanted properties"""
+        trace = self.trace
+        tracing = trace.enabled
+        field_map = FieldMapping.coerce(field_map)
         
         # Properties are nested under data.properties in the Notion webhook payload
         all_properties = self.data.get('data', {}).get('properties', {})
-        logger.info(f"All available properties: {list(all_properties.keys())}")
         
-        # If field_map is provided, check if we need to use a different property name
-        notion_property_name = property_name
-        if field_map:
-            # Look for a Notion property name that maps to our desired field
-            for notion_name, mapped_name in field_map.items():
-                if mapped_name == property_name:
-                    logger.info(f"Using Notion property '{notion_name}' for field '{property_name}'")
-                    notion_property_name = notion_name
-                    break
+        # Each property is looked up and extracted at most once
+        plan = field_map.plan(TARGET_FIELDS) if field_map else _UNMAPPED_PLAN
+        values: Dict[str, Optional[str]] = dict.fromkeys(TARGET_FIELDS)
+        for name, fields in plan:
+            prop = all_properties.get(name)
+            if not prop:
+                logger.warning(f"Property {name} not found in Notion data")
+                continue
+            kind = prop.get("type")
+            handler = PROPERTY_HANDLERS.get(kind)
+            if handler is None:
+                kind = property_type(prop)
+                handler = PROPERTY_HANDLERS.get(kind)
+            if handler is None:
+                logger.warning(f"Unhandled property type for {name}")
+                continue
+            value = handler(prop, name)
+            for field in fields:
+                values[field] = value
+            if tracing:
+                trace.dump(f"property {name}", prop)
+                trace.event("extracted", source=name, fields=fields, type=kind, value=value)
+                
+        return values
+        
+    def get_property_value(self, property_name: str, field_map: Optional[Mapping[str, str]] = None) -> Optional[str]:
+        """Extract value from any Notion property type"""
+        field_map = FieldMapping.coerce(field_map)
+        notion_property_name = field_map.source_for(property_name) if field_map else property_name
         
-        prop = all_properties.get(notion_property_name, {})
+        prop = self.data.get('data', {}).get('properties', {}).get(notion_property_name, {})
         if not prop:
             logger.warning(f"Property {notion_property_name} not found in Notion data")
             return None
             
-        # Log the exact structure of this property
-        logger.info(f"Structure of property {notion_property_name}:")
-        logger.info(json.dumps(prop, indent=2))
-            
-        # Handle different property types
-        property_type = None
-        for key in ["rich_text", "select", "rollup", "url", "formula", "files"]:
-            if key in prop:
-                property_type = key
-                break
-        logger.info(f"Detected property type: {property_type}")
-            
-        if "rich_text" in prop:
-            value = "".join(block.get("text", {}).get("content", "") for block in prop["rich_text"])
-            logger.info(f"Extracted rich_text value: {value}")
-            return value if value else None
-        elif "select" in prop:
-            value = prop["select"].get("name", "")
-            logger.info(f"Extracted select value: {value}")
-            return value if value else None
-        elif "rollup" in prop:
-            # Handle rollup of rich text
-            if prop["rollup"].get("array"):
-                value = "".join(
-                    block.get("rich_text", [{}])[0].get("text", {}).get("content", "")
-                    for block in prop["rollup"]["array"]
-                )
-                logger.info(f"Extracted rollup value: {value}")
-                return value if value else None
-            return None
-        elif "url" in prop:
-            value = prop["url"]
-            logger.info(f"Found URL property value: {value}")
-            if value and not value.startswith(('http://', 'https://')):
-                value = f"https://{value}"
-                logger.info(f"Added https:// prefix to URL: {value}")
-            return value if value else None
-        elif "formula" in prop:
-            formula = prop["formula"]
-            if formula.get("type") == "string":
-                value = formula.get("string", "")
-                logger.info(f"Extracted formula value: {value}")
-                return value if value else None
-        elif "files" in prop:
-            logger.info("Processing files property:")
-            logger.info(json.dumps(prop["files"], indent=2))
-            
-            files = prop["files"]
-            if not files or len(files) == 0:
-                logger.warning(f"No files found for property {notion_property_name}")
-                return None
-                
-            file_obj = files[0]  # Get the first file
-            logger.info(f"Processing first file object:")
-            logger.info(json.dumps(file_obj, indent=2))
-            
-            # Get the file URL based on type
-            file_type = file_obj.get("type")
-            logger.info(f"File type: {file_type}")
-            
-            value = None
-            if file_type == "file":
-                # Internal Notion file
-                file_data = file_obj.get("file", {})
-                logger.info(f"Internal file data: {file_data}")
-                value = file_data.get("url")
-                logger.info(f"Found internal Notion file URL: {value}")
-            elif file_type == "external":
-                # External file
-                external_data = file_obj.get("external", {})
-                logger.info(f"External file data: {external_data}")
-                value = external_data.get("url")
-                logger.info(f"Found external file URL: {value}")
-            else:
-                logger.warning(f"Unknown file type '{file_type}' for property {notion_property_name}")
-                logger.info(f"Full file object for unknown type:")
-                logger.info(json.dumps(file_obj, indent=2))
-                return None
-            
-            if value and not value.startswith(('http://', 'https://')):
-                value = f"https://{value}"
-                logger.info(f"Added https:// prefix to file URL: {value}")
-            
-            if not value:
-                logger.warning(f"No URL found in file object for {notion_property_name}")
-            else:
-                logger.info(f"Final URL value: {value}")
-            
-            return value if value else None
-            
-        logger.warning(f"Unhandled property type for {notion_property_name}")
-        return None
+        return extract_property(prop, notion_property_name)
         
-    def transform(self, user_id: str, field_map: Optional[Dict[str, str]] = None) -> AdData:
+    def transform(self, user_id: str, field_map: Optional[Mapping[str, str]] = None) -> AdData:
         """Transform Notion data into AdData"""
-        logger.info("\nStarting Notion data transformation")
-        logger.info(f"User ID: {user_id}")
-        logger.info(f"Field map: {field_map}")
-        
-        # Get the asset URLs first
-        logger.info("\nExtracting ad_asset URL:")
-        ad_asset_url = self.get_property_value("ad_asset", field_map)
-        logger.info(f"Extracted ad_asset_url: {ad_asset_url}")
+        self.trace = trace = TransformTrace.start(logger, user_id)
+        if trace:
+            trace.event("start", source="notion", user_id=user_id, field_map=field_map)
+            trace.dump("payload", self.data)
+            
+        values = self.extract_properties(field_map)
+        ad_asset_url = values["ad_asset"]
+        ad_asset_vertical_url = values["ad_asset_vertical"]
         
-        logger.info("\nExtracting ad_asset_vertical URL:")
-        ad_asset_vertical_url = self.get_property_value("ad_asset_vertical", field_map)
-        logger.info(f"Extracted ad_asset_vertical_url: {ad_asset_vertical_url}")
-
         # Extract filenames from URLs
         if not ad_asset_url:
             logger.error("ad_asset URL is missing")
             raise ValueError("ad_asset is required and must be a valid URL")
-        
+            
         try:
-            logger.info(f"\nExtracting filename from ad_asset URL: {ad_asset_url}")
             ad_asset_filename = self.extract_filename(ad_asset_url)
             if not ad_asset_filename:
                 logger.error(f"Could not extract filename from ad_asset URL: {ad_asset_url}")
                 raise ValueError(f"Could not extract filename from ad_asset URL: {ad_asset_url}")
-            logger.info(f"Extracted ad_asset filename: {ad_asset_filename}")
+            trace.event("filename", field="ad_asset", filename=ad_asset_filename)
         except Exception as e:
             logger.error(f"Error extracting ad_asset filename: {str(e)}")
             raise ValueError(f"Could not extract filename from ad_asset URL: {str(e)}")
-
+            
         ad_asset_vertical_filename = None
         if ad_asset_vertical_url:
             try:
-                logger.info(f"\nExtracting filename from ad_asset_vertical URL: {ad_asset_vertical_url}")
                 ad_asset_vertical_filename = self.extract_filename(ad_asset_vertical_url)
-                logger.info(f"Extracted ad_asset_vertical filename: {ad_asset_vertical_filename}")
+                trace.event("filename", field="ad_asset_vertical", filename=ad_asset_vertical_filename)
             except Exception as e:
                 logger.warning(f"Could not extract filename from ad_asset_vertical URL: {str(e)}")
-
+                
         try:
-            logger.info("\nCreating AdData object")
             ad_data = AdData(
                 source_type="notion",
                 source_record_id=self.data.get('data', {}).get('id'),
                 user_id=user_id,
-                ad_id=self.get_property_value("ad_id", field_map),
-                ad_name=self.get_property_value("ad_name", field_map),
-                ad_headline=self.get_property_value("ad_headline", field_map),
-                ad_body=self.get_property_value("ad_body", field_map),
-                ad_link_url=self.get_property_value("ad_link", field_map),
-                ad_media_type=self.get_property_value("ad_media_type", field_map),
-                ad_cta_label=self.get_property_value("ad_cta_label", field_map),
+                ad_id=values["ad_id"],
+                ad_name=values["ad_name"],
+                ad_headline=values["ad_headline"],
+                ad_body=values["ad_body"],
+                ad_link_url=values["ad_link"],
+                ad_media_type=values["ad_media_type"],
+                ad_cta_label=values["ad_cta_label"],
                 ad_asset_url=ad_asset_url,
                 ad_asset_filename=ad_asset_filename,
                 ad_asset_vertical_url=ad_asset_vertical_url,
                 ad_asset_vertical_filename=ad_asset_vertical_filename,
-                destination_ad_account_id=self.get_property_value("destination_ad_account_id", field_map),
-                destination_adset_id=self.get_property_value("destination_adset_id", field_map),
-                destination_template_ad_id=self.get_property_value("destination_template_ad_id", field_map),
+                destination_ad_account_id=values["destination_ad_account_id"],
+                destination_adset_id=values["destination_adset_id"],
+                destination_template_ad_id=values["destination_template_ad_id"],
                 ad_import_status="building",
                 source_table_id=self.data.get('data', {}).get('parent', {}).get('database_id')
             )
-            logger.info("Successfully created AdData object")
+            trace.event("done", ad_name=ad_data.ad_name)
             return ad_data
         except Exception as e:
             logger.error(f"Failed to create AdData object: {str(e)}")
-            raise 
\ No newline at end of file
+            raise
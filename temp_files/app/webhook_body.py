@@ -0,0 +1,156 @@
+"""Size-limited, selectively materialized webhook request bodies.
+
+read_webhook_json() streams the request body, answers 413 as soon as it grows
+past the limit (or straight away when Content-Length already says so), and
+builds only the parts of the document described by a spec:
+
+    {"data": {"id": None, "properties": {"Name": None, "Image": None}}}
+
+A dict keeps just the listed keys of the object at that position, None keeps
+the whole subtree, and a spec at an array position applies to each item. With
+ijson installed the body is parsed incrementally and skipped subtrees (unused
+rich_text or rollup arrays, page metadata) are never built; without it the
+body is parsed in one go with app.json_codec and pruned afterwards, so at least
+the captures, queue payloads and logs stay small.
+"""
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import HTTPException, Request, status
+
+from app.json_codec import loads
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+Spec = Optional[Dict[str, Any]]
+
+_START_EVENTS = ("start_map", "start_array")
+_END_EVENTS = ("end_map", "end_array")
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Request body exceeds {max_bytes} bytes"
+    )
+
+async def iter_body(request: Request, max_bytes: int) -> AsyncIterator[bytes]:
+    """Yield the request body in chunks, raising 413 once it passes max_bytes"""
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise _too_large(max_bytes)
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_bytes:
+            raise _too_large(max_bytes)
+        if chunk:
+            yield chunk
+
+def prune(value: Any, spec: Spec) -> Any:
+    """Drop everything from a parsed document that the spec doesn't keep"""
+    if spec is None:
+        return value
+    if isinstance(value, dict):
+        return {key: prune(item, spec[key]) for key, item in value.items() if key in spec}
+    if isinstance(value, list):
+        return [prune(item, spec) for item in value]
+    return value
+
+class _Builder:
+    """Assembles a document from ijson basic_parse events, skipping unwanted subtrees"""
+
+    def __init__(self, spec: Spec):
+        self.root: Any = None
+        self.complete = False
+        # [container, spec for its children, current key]
+        self._stack: List[List[Any]] = []
+        self._root_spec = spec
+        self._skip_depth = 0
+        self._skip_value = False
+
+    def feed(self, event: str, value: Any) -> None:
+        if self._skip_depth:
+            if event in _START_EVENTS:
+                self._skip_depth += 1
+            elif event in _END_EVENTS:
+                self._skip_depth -= 1
+            return
+        if event == "map_key":
+            frame = self._stack[-1]
+            frame[2] = value
+            self._skip_value = frame[1] is not None and value not in frame[1]
+            return
+        if event in _END_EVENTS:
+            self._stack.pop()
+            if not self._stack:
+                self.complete = True
+            return
+        if self._skip_value:
+            self._skip_value = False
+            if event in _START_EVENTS:
+                self._skip_depth = 1
+            return
+        if event == "start_map":
+            self._start({})
+        elif event == "start_array":
+            self._start([])
+        else:
+            self._add(value)
+            if not self._stack:
+                self.complete = True
+
+    def _child_spec(self) -> Spec:
+        if not self._stack:
+            return self._root_spec
+        container, spec, key = self._stack[-1]
+        if spec is None or isinstance(container, list):
+            return spec
+        return spec[key]
+
+    def _start(self, container: Any) -> None:
+        spec = self._child_spec()
+        self._add(container)
+        self._stack.append([container, spec, None])
+
+    def _add(self, value: Any) -> None:
+        if not self._stack:
+            self.root = value
+            return
+        container, _, key = self._stack[-1]
+        if isinstance(container, list):
+            container.append(value)
+        else:
+            container[key] = value
+
+async def _parse_streaming(chunks: AsyncIterator[bytes], spec: Spec) -> Any:
+    events = ijson.sendable_list()
+    parser = ijson.basic_parse_coro(events, use_float=True)
+    builder = _Builder(spec)
+    try:
+        async for chunk in chunks:
+            parser.send(chunk)
+            for event, value in events:
+                builder.feed(event, value)
+            del events[:]
+        parser.close()
+    except ijson.JSONError as e:
+        # The C backend's messages span several lines and echo the body
+        raise ValueError(f"Invalid JSON in request body: {str(e).splitlines()[0]}") from e
+    for event, value in events:
+        builder.feed(event, value)
+    if not builder.complete:
+        raise ValueError("Invalid JSON in request body: empty or incomplete document")
+    return builder.root
+
+async def read_webhook_json(request: Request, max_bytes: int, spec: Spec = None) -> Any:
+    """Parse a JSON request body of at most max_bytes, keeping only what spec asks for.
+
+    Raises HTTPException(413) for oversized bodies and ValueError for invalid JSON.
+    """
+    chunks = iter_body(request, max_bytes)
+    if ijson is not None:
+        return await _parse_streaming(chunks, spec)
+    body = b"".join([chunk async for chunk in chunks])
+    return prune(loads(body), spec)
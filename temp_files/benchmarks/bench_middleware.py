@@ -0,0 +1,127 @@
+"""Requests/sec through the middleware stack, BaseHTTPMiddleware vs pure ASGI.
+
+Serves a trivial authenticated route three ways: with no middleware, behind
+BaseHTTPMiddleware equivalents of the old stack (auth, Supabase session and the
+settings-for-templates http middleware) and behind the current pure ASGI
+AuthMiddleware and SupabaseConnectionMiddleware. Requests carry a locally
+verifiable HS256 access token and the Supabase session call is stubbed out, so
+only middleware overhead is measured.
+
+    python benchmarks/bench_middleware.py --requests 5000 --concurrency 50
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+import jwt
+
+from common import bootstrap
+
+JWT_SECRET = "benchmark-jwt-secret-at-least-32-bytes"
+
+bootstrap()
+os.environ["SUPABASE_JWT_SECRET"] = JWT_SECRET
+
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import PlainTextResponse, RedirectResponse  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+from app.auth.supabase_auth import supabase  # noqa: E402
+from app.auth import token_verifier  # noqa: E402
+from app.auth.token_verifier import verify_access_token  # noqa: E402
+from app.middleware.auth_middleware import AuthMiddleware  # noqa: E402
+from app.middleware.supabase_middleware import SupabaseConnectionMiddleware  # noqa: E402
+
+class LegacyAuthMiddleware(BaseHTTPMiddleware):
+    """The old AuthMiddleware's happy path"""
+
+    async def dispatch(self, request: Request, call_next):
+        access_token = request.cookies.get("access_token")
+        if not access_token:
+            return RedirectResponse(url="/auth/login", status_code=303)
+        user = await verify_access_token(access_token)
+        if not user:
+            return RedirectResponse(url="/auth/login", status_code=303)
+        request.state.user = user
+        request.state.user_id = user.id
+        return await call_next(request)
+
+class LegacySupabaseConnectionMiddleware(BaseHTTPMiddleware):
+    """The old SupabaseConnectionMiddleware's happy path"""
+
+    async def dispatch(self, request: Request, call_next):
+        access_token = request.cookies.get("access_token")
+        if access_token:
+            supabase.auth.set_session(access_token, "")
+            payload = jwt.decode(access_token, options={"verify_signature": False})
+            request.state.user_id = payload.get("sub")
+        return await call_next(request)
+
+def make_app(stack: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/bench")
+    async def bench(request: Request):
+        return PlainTextResponse(request.state.user_id if stack != "none" else "ok")
+
+    if stack == "legacy":
+        @app.middleware("http")
+        async def add_settings_to_templates(request: Request, call_next):
+            return await call_next(request)
+
+        app.add_middleware(LegacyAuthMiddleware)
+        app.add_middleware(LegacySupabaseConnectionMiddleware)
+    elif stack == "asgi":
+        app.add_middleware(AuthMiddleware)
+        app.add_middleware(SupabaseConnectionMiddleware)
+    return app
+
+async def run(app: FastAPI, token: str, requests: int, concurrency: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies={"access_token": token}) as client:
+        # Warm up caches (token verification, route compilation) before timing
+        response = await client.get("/bench")
+        assert response.status_code == 200, response.status_code
+
+        remaining = requests
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                response = await client.get("/bench")
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {"elapsed": elapsed, "throughput": requests / elapsed}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    supabase.auth.set_session = lambda access_token, refresh_token: None
+    # No revoked_sessions table to ask; the lookup runs once per token per check interval anyway
+    async def session_not_revoked(session_id):
+        return False
+    token_verifier._session_revoked_remotely = session_not_revoked
+    token = jwt.encode(
+        {"sub": "user-1", "session_id": "bench-session", "aud": "authenticated", "exp": int(time.time()) + 3600},
+        JWT_SECRET,
+        algorithm="HS256"
+    )
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}")
+    for stack in ("none", "legacy", "asgi"):
+        result = asyncio.run(run(make_app(stack), token, args.requests, args.concurrency))
+        print(f"  {stack:<7} {result['throughput']:8.1f} req/s  {result['elapsed']:6.2f} s total")
+
+if __name__ == "__main__":
+    main()
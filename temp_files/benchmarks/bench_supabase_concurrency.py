@@ -0,0 +1,105 @@
+"""Concurrent build throughput with inline vs pooled Supabase queries.
+
+Runs BuildService.create_build concurrently against an in-memory Supabase
+stand-in whose execute() blocks for a fixed latency, once with queries run
+inline on the event loop (the old behaviour) and once through app.db. Also
+reports the worst event-loop stall seen by a heartbeat task, which is what
+other in-flight webhooks experience.
+
+    python benchmarks/bench_supabase_concurrency.py --requests 200 --latency 0.05
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import time
+
+from common import InMemorySupabase, bootstrap
+
+bootstrap()
+
+from app import db  # noqa: E402
+from app.models.ad_data import AdData  # noqa: E402
+
+# app.services re-exports a build_service singleton under the module's name
+build_service_module = importlib.import_module("app.services.build_service")
+
+def make_ad_data() -> AdData:
+    return AdData(
+        source_type="notion",
+        source_record_id="page-1",
+        user_id="user-1",
+        ad_name="benchmark-ad",
+        ad_headline="Headline",
+        ad_body="Body",
+        ad_link_url="https://example.com",
+        ad_media_type="static",
+        ad_cta_label="LEARN_MORE",
+        ad_asset_url="https://example.com/image.jpg",
+        ad_asset_filename="image.jpg",
+        destination_ad_account_id="act_1",
+        destination_adset_id="adset_1",
+        destination_template_ad_id="ad_1",
+        ad_import_status="building",
+    )
+
+async def heartbeat(stop: asyncio.Event, interval: float, lags: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+async def run(requests: int, concurrency: int) -> dict:
+    service = build_service_module.BuildService()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await service.create_build(make_ad_data())
+
+    stop = asyncio.Event()
+    lags: list = []
+    ticker = asyncio.create_task(heartbeat(stop, 0.005, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    return {
+        "elapsed": elapsed,
+        "throughput": requests / elapsed,
+        "max_loop_lag_ms": max(lags, default=0.0) * 1000,
+    }
+
+async def inline_execute(query):
+    """The pre-app.db behaviour: block the event loop for the round trip"""
+    return query.execute()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated Supabase round trip in seconds")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    build_service_module.supabase_service = InMemorySupabase(latency=args.latency)
+
+    pooled_execute = db.execute
+    results = {}
+    for label, executor in (("inline", inline_execute), ("pooled", pooled_execute)):
+        db.execute = executor
+        results[label] = asyncio.run(run(args.requests, args.concurrency))
+    db.execute = pooled_execute
+
+    print(f"{args.requests} builds, concurrency {args.concurrency}, {args.latency * 1000:.0f} ms simulated latency")
+    for label, result in results.items():
+        print(
+            f"  {label:<7} {result['throughput']:8.1f} builds/s  "
+            f"{result['elapsed']:6.2f} s total  "
+            f"max loop stall {result['max_loop_lag_ms']:7.1f} ms"
+        )
+    db.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks import the real application modules, which build Supabase clients
+and read settings at import time. ``bootstrap()`` puts the project root on
+sys.path and fills in placeholder settings (real values from the environment
+or .env always win) so the modules can be imported without a live project.
+"""
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PLACEHOLDER_ENV = {
+    "SUPABASE_URL": "https://benchmark.supabase.co",
+    "SUPABASE_KEY": "benchmark-anon-key-placeholder",
+    "SUPABASE_SERVICE_KEY": "benchmark-service-key-placeholder",
+    "DOMAIN": "http://localhost:8000",
+    "CLOUDFLARE_TURNSTILE_SITE_KEY": "",
+    "CLOUDFLARE_TURNSTILE_SECRET_KEY": "",
+}
+
+def bootstrap() -> None:
+    """Make the app package importable outside of uvicorn"""
+    if PROJECT_ROOT not in sys.path:
+        sys.path.insert(0, PROJECT_ROOT)
+    os.chdir(PROJECT_ROOT)
+    for name, value in PLACEHOLDER_ENV.items():
+        os.environ.setdefault(name, value)
+
+class InMemoryResponse:
+    """Mimics the APIResponse returned by supabase-py's execute()"""
+
+    def __init__(self, data: List[Dict[str, Any]]):
+        self.data = data
+        self.count = len(data)
+
+class InMemoryQuery:
+    """Chainable stand-in for a supabase-py query builder"""
+
+    def __init__(self, store: "InMemorySupabase", table: str):
+        self.store = store
+        self.table = table
+        self.operation = "select"
+        self.payload: Any = None
+        self.filters: List[tuple] = []
+        self.row_limit: Optional[int] = None
+
+    def select(self, *columns, **kwargs):
+        self.operation = "select"
+        return self
+
+    def insert(self, payload, **kwargs):
+        self.operation = "insert"
+        self.payload = payload
+        return self
+
+    def upsert(self, payload, **kwargs):
+        self.operation = "upsert"
+        self.payload = payload
+        return self
+
+    def update(self, payload, **kwargs):
+        self.operation = "update"
+        self.payload = payload
+        return self
+
+    def delete(self, **kwargs):
+        self.operation = "delete"
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, value))
+        return self
+
+    def in_(self, column, values):
+        self.filters.append((column, tuple(values)))
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def _matches(self, row: Dict[str, Any]) -> bool:
+        for column, value in self.filters:
+            if isinstance(value, tuple):
+                if row.get(column) not in value:
+                    return False
+            elif row.get(column) != value:
+                return False
+        return True
+
+    def execute(self) -> InMemoryResponse:
+        # Blocking sleep on purpose: supabase-py's execute() blocks the caller
+        if self.store.latency:
+            time.sleep(self.store.latency)
+
+        rows = self.store.tables.setdefault(self.table, [])
+        if self.operation in ("insert", "upsert"):
+            new_rows = self.payload if isinstance(self.payload, list) else [self.payload]
+            rows.extend(dict(row) for row in new_rows)
+            return InMemoryResponse([dict(row) for row in new_rows])
+
+        matched = [row for row in rows if self._matches(row)]
+        if self.operation == "update":
+            for row in matched:
+                row.update(self.payload)
+        elif self.operation == "delete":
+            self.store.tables[self.table] = [row for row in rows if not self._matches(row)]
+        if self.row_limit is not None:
+            matched = matched[:self.row_limit]
+        return InMemoryResponse([dict(row) for row in matched])
+
+class InMemorySupabase:
+    """Local stand-in for the Supabase client with optional per-query latency"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+
+    def table(self, name: str) -> InMemoryQuery:
+        return InMemoryQuery(self, name)
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
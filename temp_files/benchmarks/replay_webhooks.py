@@ -0,0 +1,218 @@
+"""Replay captured webhook payloads through BuildService as a regression benchmark.
+
+Loads payloads from the webhook capture store (gzip JSONL segments) and from
+legacy logs/notion_*.json / logs/airtable_*.json dumps, then runs each one
+through BuildService.process_notion_data / process_airtable_data with Supabase
+replaced by an in-memory stand-in. Batch captures are expanded into their
+records. Reports throughput and p50/p95/p99 latency for the full build path,
+plus peak allocation per transform measured with tracemalloc in a separate
+pass so tracing does not skew the timings.
+
+    python benchmarks/replay_webhooks.py --repeat 20
+    python benchmarks/replay_webhooks.py --json results.json
+    python benchmarks/replay_webhooks.py --baseline results.json --max-regression 0.15
+
+With --baseline the script exits non-zero if throughput drops, or p95 latency
+grows, by more than --max-regression for any source.
+"""
+import argparse
+import asyncio
+import glob
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+from common import InMemorySupabase, bootstrap, percentile
+
+bootstrap()
+
+from app.services.build_queue import BuildQueue, MemoryQueueBackend  # noqa: E402
+from app.services.webhook_capture import iter_captured, webhook_capture  # noqa: E402
+
+# app.services re-exports a build_service singleton under the module's name
+build_service_module = importlib.import_module("app.services.build_service")
+
+BATCH_SOURCES = {"notion_batch": "notion", "airtable_batch": "airtable"}
+DEFAULT_TABLE = "appReplay_tblReplay"
+
+class Replay:
+    """One payload to replay"""
+
+    def __init__(self, source: str, payload: Dict[str, Any], user_id: str, source_table_id: Optional[str]):
+        self.source = source
+        self.payload = payload
+        self.user_id = user_id
+        self.base_id, self.table_id = (source_table_id or DEFAULT_TABLE).split("_", 1)
+
+def load_replays(log_dir: str, capture_dir: Optional[str]) -> List[Replay]:
+    replays = []
+    for source in ("notion", "airtable"):
+        for path in sorted(glob.glob(os.path.join(log_dir, f"{source}_*.json"))):
+            with open(path) as f:
+                replays.append(Replay(source, json.load(f), "replay-user", None))
+
+    segments = webhook_capture.segments(include_active=True)
+    if capture_dir:
+        segments = sorted(
+            glob.glob(os.path.join(capture_dir, "*.jsonl.gz"))
+            + glob.glob(os.path.join(capture_dir, "*.jsonl.gz.part"))
+        )
+    for record in iter_captured(segments):
+        source = record.get("source")
+        payloads = [record.get("payload")]
+        if source in BATCH_SOURCES:
+            source = BATCH_SOURCES[source]
+            payloads = record.get("payload") or []
+        if source not in ("notion", "airtable"):
+            continue
+        for payload in payloads:
+            replays.append(Replay(
+                source,
+                payload,
+                record.get("user_id") or "replay-user",
+                record.get("source_table_id")
+            ))
+    return [replay for replay in replays if isinstance(replay.payload, dict)]
+
+async def process(service, replay: Replay) -> None:
+    if replay.source == "notion":
+        await service.process_notion_data(replay.payload, replay.user_id)
+    else:
+        await service.process_airtable_data(
+            replay.payload, replay.user_id, replay.base_id, replay.table_id
+        )
+
+def transform(service, replay: Replay) -> None:
+    if replay.source == "notion":
+        service.build_notion_ad(replay.payload, replay.user_id)
+    else:
+        service.build_airtable_ad(replay.payload, replay.user_id, replay.base_id, replay.table_id)
+
+async def time_replays(service, replays: List[Replay], repeat: int) -> Dict[str, Any]:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    elapsed: Dict[str, float] = defaultdict(float)
+    errors: Dict[str, Counter] = defaultdict(Counter)
+    for _ in range(repeat):
+        for replay in replays:
+            started = time.perf_counter()
+            try:
+                await process(service, replay)
+            except Exception as e:
+                errors[replay.source][str(e).splitlines()[0][:120]] += 1
+                continue
+            took = time.perf_counter() - started
+            latencies[replay.source].append(took)
+            elapsed[replay.source] += took
+    return {"latencies": latencies, "elapsed": elapsed, "errors": errors}
+
+def measure_allocations(service, replays: List[Replay]) -> Dict[str, List[int]]:
+    """Peak bytes allocated while transforming each payload"""
+    peaks: Dict[str, List[int]] = defaultdict(list)
+    tracemalloc.start()
+    try:
+        for replay in replays:
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            try:
+                transform(service, replay)
+            except Exception:
+                continue
+            _, peak = tracemalloc.get_traced_memory()
+            peaks[replay.source].append(peak - baseline)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+def summarize(timings: Dict[str, Any], peaks: Dict[str, List[int]]) -> Dict[str, Dict[str, Any]]:
+    summary = {}
+    sources = set(timings["latencies"]) | set(timings["errors"])
+    for source in sorted(sources):
+        samples = timings["latencies"].get(source, [])
+        elapsed = timings["elapsed"].get(source, 0.0)
+        allocations = peaks.get(source, [])
+        summary[source] = {
+            "processed": len(samples),
+            "failed": sum(timings["errors"][source].values()),
+            "throughput": len(samples) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+            "peak_alloc_kib_p50": percentile(allocations, 50) / 1024,
+            "peak_alloc_kib_max": max(allocations, default=0) / 1024,
+            "errors": dict(timings["errors"][source].most_common(5)),
+        }
+    return summary
+
+def compare(summary: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], max_regression: float) -> List[str]:
+    regressions = []
+    for source, current in summary.items():
+        previous = baseline.get(source)
+        if not previous or not current["processed"]:
+            continue
+        if previous["throughput"] and current["throughput"] < previous["throughput"] * (1 - max_regression):
+            regressions.append(
+                f"{source}: throughput {current['throughput']:.0f}/s vs baseline {previous['throughput']:.0f}/s"
+            )
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + max_regression):
+            regressions.append(
+                f"{source}: p95 {current['p95_ms']:.3f} ms vs baseline {previous['p95_ms']:.3f} ms"
+            )
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logs", default="logs", help="Directory with legacy notion_*/airtable_*.json dumps")
+    parser.add_argument("--captures", default=None, help="Capture segment directory (defaults to CAPTURE_DIR)")
+    parser.add_argument("--repeat", type=int, default=10, help="Times to replay the whole set")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated Supabase round trip in seconds")
+    parser.add_argument("--json", dest="json_path", help="Write the summary to this file")
+    parser.add_argument("--baseline", help="Summary JSON from a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    replays = load_replays(args.logs, args.captures)
+    if not replays:
+        print("No captured payloads found; enable webhook capture or pass --logs/--captures")
+        return 1
+
+    build_service_module.supabase_service = InMemorySupabase(latency=args.latency)
+    service = build_service_module.BuildService(queue=BuildQueue(MemoryQueueBackend()))
+
+    timings = asyncio.run(time_replays(service, replays, args.repeat))
+    peaks = measure_allocations(service, replays)
+    summary = summarize(timings, peaks)
+
+    counts = Counter(replay.source for replay in replays)
+    print(f"Replayed {len(replays)} payloads x{args.repeat} ({', '.join(f'{n} {s}' for s, n in sorted(counts.items()))})")
+    for source, row in summary.items():
+        print(
+            f"  {source:<9} {row['throughput']:9.0f} builds/s  "
+            f"p50 {row['p50_ms']:7.3f} ms  p95 {row['p95_ms']:7.3f} ms  p99 {row['p99_ms']:7.3f} ms  "
+            f"peak alloc {row['peak_alloc_kib_p50']:6.1f} KiB (max {row['peak_alloc_kib_max']:.1f})  "
+            f"failed {row['failed']}"
+        )
+        for message, count in row["errors"].items():
+            print(f"      {count:>5} x {message}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(summary, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
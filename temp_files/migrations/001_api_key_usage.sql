@@ -0,0 +1,22 @@
+-- Per-key call counts and the bulk usage writer used by app/services/api_key_usage.py.
+-- Run once in the Supabase SQL editor (or with psql against the project database).
+
+alter table public.api_keys
+    add column if not exists usage_count bigint not null default 0;
+
+-- usage: [{"key": "...", "last_used_at": "2025-01-01T12:00:00", "calls": 3}, ...]
+create or replace function public.record_api_key_usage(usage jsonb)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    update api_keys as k
+       set last_used_at = greatest(k.last_used_at, u.last_used_at),
+           usage_count = k.usage_count + u.calls
+      from jsonb_to_recordset(usage) as u(key text, last_used_at timestamptz, calls bigint)
+     where k.key = u.key;
+$$;
+
+revoke all on function public.record_api_key_usage(jsonb) from public, anon, authenticated;
+grant execute on function public.record_api_key_usage(jsonb) to service_role;
@@ -0,0 +1,37 @@
+-- Store API keys as an indexed prefix plus an HMAC-SHA256 hash instead of plaintext
+-- (app/services/api_key_service.py). Apply before deploying the matching app version.
+
+alter table public.api_keys
+    add column if not exists key_prefix text,
+    add column if not exists key_hash text;
+
+alter table public.api_keys
+    alter column key drop not null;
+
+create index if not exists api_keys_key_prefix_idx on public.api_keys (key_prefix);
+
+-- Existing plaintext keys are moved over by the app the first time they're used.
+-- To move them all now instead, enable pgcrypto and run with the app's API_KEY_HASH_SECRET:
+--
+--   update public.api_keys
+--      set key_prefix = left(key, 12),
+--          key_hash = encode(hmac(key, '<API_KEY_HASH_SECRET>', 'sha256'), 'hex'),
+--          key = null
+--    where key is not null and key_hash is null;
+
+-- usage: [{"key_hash": "...", "last_used_at": "2025-01-01T12:00:00", "calls": 3}, ...]
+create or replace function public.record_api_key_usage(usage jsonb)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    update api_keys as k
+       set last_used_at = greatest(k.last_used_at, u.last_used_at),
+           usage_count = k.usage_count + u.calls
+      from jsonb_to_recordset(usage) as u(key_hash text, last_used_at timestamptz, calls bigint)
+     where k.key_hash = u.key_hash;
+$$;
+
+revoke all on function public.record_api_key_usage(jsonb) from public, anon, authenticated;
+grant execute on function public.record_api_key_usage(jsonb) to service_role;
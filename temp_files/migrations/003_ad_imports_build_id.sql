@@ -0,0 +1,13 @@
+-- One ad_imports row per build_id, so a build queue job that runs twice (retried after a
+-- lost response, or re-queued after a restart) can't insert a duplicate.
+-- app/services/build_service.py upserts on build_id and ignores conflicts.
+
+create unique index if not exists ad_imports_build_id_key on public.ad_imports (build_id);
+
+-- If the index fails because earlier plain inserts already wrote a build_id twice,
+-- check the copies and remove the extras first, e.g. keeping one row per build_id:
+--
+--   delete from public.ad_imports as a
+--    using public.ad_imports as b
+--    where a.build_id = b.build_id
+--      and a.ctid > b.ctid;
@@ -0,0 +1,16 @@
+-- Sessions ended by logging out, checked by app/auth/token_verifier.py before a locally
+-- verified access token is trusted, so a logout holds across workers and restarts.
+-- Only the service role reads or writes it.
+
+create table if not exists public.revoked_sessions (
+    session_id uuid primary key,
+    expires_at timestamptz not null,  -- exp of the token that logged out; no token of the session outlives it by much
+    revoked_at timestamptz not null default now()
+);
+
+alter table public.revoked_sessions enable row level security;
+
+-- Rows are only useful until their tokens expire. Prune them now and then, e.g. with pg_cron:
+--
+--   select cron.schedule('prune-revoked-sessions', '17 * * * *',
+--       $$delete from public.revoked_sessions where expires_at < now() - interval '1 day'$$);
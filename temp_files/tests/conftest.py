@@ -0,0 +1,12 @@
+import os
+import sys
+
+# app.config and the Supabase clients read these at import time; the tests never call out
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("DOMAIN", "http://localhost:8000")
+os.environ.setdefault("SUPABASE_KEY", "test-anon-key")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-service-key")
+os.environ.setdefault("CLOUDFLARE_TURNSTILE_SITE_KEY", "test-site-key")
+os.environ.setdefault("CLOUDFLARE_TURNSTILE_SECRET_KEY", "test-secret-key")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+
+from app.services.build_queue import (
+    BuildJob,
+    BuildQueue,
+    MemoryQueueBackend,
+    PermanentJobError,
+    SQLiteQueueBackend,
+)
+
+def run_until(queue: BuildQueue, done, timeout: float = 5.0):
+    """Start the queue, wait for done() and stop it again"""
+    async def main():
+        await queue.start()
+        deadline = time.monotonic() + timeout
+        while not done() and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await queue.stop()
+    asyncio.run(main())
+
+def enqueue(queue: BuildQueue, kind: str, payload: dict) -> str:
+    return asyncio.run(queue.enqueue(kind, payload))
+
+def test_claim_is_exclusive_across_processes(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    SQLiteQueueBackend(path).put(BuildJob(kind="insert", payload={"n": 1}))
+
+    first, second = SQLiteQueueBackend(path), SQLiteQueueBackend(path)
+    job = first.claim(time.time())
+    assert job is not None and job.payload == {"n": 1}
+    assert second.claim(time.time()) is None
+
+def test_concurrent_claims_hand_out_each_job_once(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    backend = SQLiteQueueBackend(path)
+    for n in range(50):
+        backend.put(BuildJob(kind="insert", payload={"n": n}))
+
+    claimed = []
+    def worker():
+        # One connection per thread, as separate processes would have
+        own = SQLiteQueueBackend(path)
+        while (job := own.claim(time.time())) is not None:
+            claimed.append(job.payload["n"])
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == list(range(50))
+
+def test_running_job_is_only_recovered_after_its_lease_expires(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    SQLiteQueueBackend(path).put(BuildJob(kind="insert", payload={}, attempts=2))
+    now = time.time()
+    assert SQLiteQueueBackend(path, visibility_timeout=60).claim(now) is not None
+
+    # A process starting while the first one still holds the lease leaves the job alone
+    restarted = SQLiteQueueBackend(path, visibility_timeout=60)
+    assert restarted.claim(now + 30) is None
+    assert restarted.stats() == {"pending": 0, "running": 1, "failed": 0}
+
+    recovered = restarted.claim(now + 61)
+    assert recovered is not None and recovered.attempts == 2
+
+def test_released_job_is_claimable_again(tmp_path):
+    backend = SQLiteQueueBackend(str(tmp_path / "queue.sqlite3"))
+    backend.put(BuildJob(kind="insert", payload={}))
+    job = backend.claim(time.time())
+    backend.release(job.id)
+    assert backend.claim(time.time()).id == job.id
+
+def test_failed_job_is_retried_with_backoff(tmp_path):
+    backend = SQLiteQueueBackend(str(tmp_path / "queue.sqlite3"))
+    queue = BuildQueue(backend, concurrency=1, retry_base_delay=0.05, retry_max_delay=0.05, poll_interval=0.01)
+    calls = []
+    async def handler(payload):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise Exception("temporary")
+    queue.register("insert", handler)
+    enqueue(queue, "insert", {})
+
+    run_until(queue, lambda: backend.stats()["pending"] == 0 and len(calls) == 2)
+
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.025
+    assert backend.stats() == {"pending": 0, "running": 0, "failed": 0}
+
+def test_backoff_is_capped_and_jittered():
+    queue = BuildQueue(MemoryQueueBackend(), retry_base_delay=2.0, retry_max_delay=10.0)
+    for attempts, delay in ((1, 2.0), (2, 4.0), (3, 8.0), (6, 10.0)):
+        for _ in range(20):
+            assert delay / 2 <= queue._backoff(attempts) <= delay
+
+def test_job_fails_after_max_attempts(tmp_path):
+    backend = SQLiteQueueBackend(str(tmp_path / "queue.sqlite3"))
+    queue = BuildQueue(backend, concurrency=1, max_attempts=2, retry_base_delay=0.01, retry_max_delay=0.01, poll_interval=0.01)
+    calls = []
+    async def handler(payload):
+        calls.append(payload)
+        raise Exception("still broken")
+    queue.register("insert", handler)
+    enqueue(queue, "insert", {})
+
+    run_until(queue, lambda: backend.stats()["failed"] == 1)
+
+    assert len(calls) == 2
+    assert backend.stats() == {"pending": 0, "running": 0, "failed": 1}
+
+def test_permanent_error_fails_without_retrying():
+    backend = MemoryQueueBackend()
+    queue = BuildQueue(backend, concurrency=1, poll_interval=0.01)
+    calls = []
+    async def handler(payload):
+        calls.append(payload)
+        raise PermanentJobError("record deleted")
+    queue.register("insert", handler)
+    enqueue(queue, "insert", {})
+
+    run_until(queue, lambda: backend.stats()["failed"] == 1)
+
+    assert len(calls) == 1
+
+def test_stop_releases_jobs_cut_short(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    backend = SQLiteQueueBackend(path)
+    queue = BuildQueue(backend, concurrency=1, poll_interval=0.01, shutdown_timeout=0.05)
+    started = []
+    async def handler(payload):
+        started.append(payload)
+        await asyncio.sleep(10)
+    queue.register("insert", handler)
+    enqueue(queue, "insert", {})
+
+    run_until(queue, lambda: bool(started))
+
+    assert backend.stats() == {"pending": 1, "running": 0, "failed": 0}
+    assert SQLiteQueueBackend(path).claim(time.time()) is not None
@@ -0,0 +1,29 @@
+import os
+import time
+
+from app.services.webhook_capture import ACTIVE_SUFFIX, WebhookCapture, iter_captured
+
+def test_quiet_segment_is_rotated_once_it_is_too_old(tmp_path):
+    capture = WebhookCapture(str(tmp_path), segment_max_age=60, retention_interval=3600)
+    capture._write([{"source": "notion", "payload": {"id": 1}}])
+    assert capture.segments(include_active=True)[0].endswith(ACTIVE_SUFFIX)
+
+    capture._maintain()
+    assert capture.segments() == []
+
+    capture._segment_opened_at -= 61
+    capture._maintain()
+    segments = capture.segments(include_active=True)
+    assert len(segments) == 1 and not segments[0].endswith(ACTIVE_SUFFIX)
+    assert [record["payload"] for record in iter_captured(segments)] == [{"id": 1}]
+
+def test_retention_runs_on_schedule_without_a_rotation(tmp_path):
+    capture = WebhookCapture(str(tmp_path), retention_days=7, retention_interval=300)
+    expired = tmp_path / "webhooks-20200101T000000-1-0001.jsonl.gz"
+    expired.write_bytes(b"")
+    os.utime(expired, (time.time() - 8 * 86400,) * 2)
+
+    capture._maintain()
+
+    assert not expired.exists()
+    assert capture.stats()["segments_deleted"] == 1